@@ -1,60 +1,88 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from sqlalchemy import func, desc
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional
 
 from app.database.sql import get_db
-from app.core.security import is_admin, User
-from app.models.sql import User as UserModel, Room as RoomModel, Message as MessageModel, SystemSetting
+from app.core.security import is_admin, invalidate_principal, principal_cache, token_cache, Principal
+from app.models.sql import (
+    User as UserModel, Room as RoomModel, RoomMember as RoomMemberModel, Message as MessageModel,
+    MessageArchiveSegment as MessageArchiveSegmentModel
+)
+from app.core.websocket_manager import manager
+from app.core.system_settings import system_settings
+from app.core.message_writer import message_writer
+from app.core.moderation import profanity_filter, PROFANITY_SETTING
+from app.core.sanctions import sanctions
+from app.core.room_history import room_history
+from app.core.scheduler import scheduler
+from app.core.export import stream_room_export, make_compressor
+from app.core.archive import archiver
+from app.utils.pagination import decode_cursor
+from app.schemas.room import Sanction
 
 router = APIRouter()
 
 @router.post("/pause-communications", status_code=status.HTTP_200_OK)
 async def pause_communications(
-    current_user: User = Depends(is_admin),
+    current_user: Principal = Depends(is_admin),
     db: Session = Depends(get_db)
 ):
     """Pause all communications (admin only)"""
-    setting = db.query(SystemSetting).filter(SystemSetting.name == "communications_paused").first()
-    if not setting:
-        setting = SystemSetting(name="communications_paused", value="true", is_enabled=True)
-        db.add(setting)
-    else:
-        setting.value = "true"
+    await system_settings.set(db, "communications_paused", "true")
     
-    db.commit()
+    # Tell every connected client once instead of on each frame they send
+    await manager.broadcast_to_all({
+        "type": "communications_paused",
+        "message": "Communications are temporarily paused by an administrator."
+    })
     return {"message": "All communications have been paused."}
 
 @router.post("/resume-communications", status_code=status.HTTP_200_OK)
 async def resume_communications(
-    current_user: User = Depends(is_admin),
+    current_user: Principal = Depends(is_admin),
     db: Session = Depends(get_db)
 ):
     """Resume all communications (admin only)"""
-    setting = db.query(SystemSetting).filter(SystemSetting.name == "communications_paused").first()
-    if not setting:
-        setting = SystemSetting(name="communications_paused", value="false", is_enabled=True)
-        db.add(setting)
-    else:
-        setting.value = "false"
+    await system_settings.set(db, "communications_paused", "false")
     
-    db.commit()
+    await manager.broadcast_to_all({"type": "communications_resumed"})
     return {"message": "All communications have been resumed."}
 
 @router.get("/communications-status")
 async def get_communications_status(
-    current_user: User = Depends(is_admin),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(is_admin)
 ):
     """Get the current status of communications"""
-    setting = db.query(SystemSetting).filter(SystemSetting.name == "communications_paused").first()
-    is_paused = setting.value == "true" if setting else False
-    return {"is_paused": is_paused}
+    return {"is_paused": system_settings.is_true("communications_paused")}
+
+@router.get("/profanity-words")
+async def get_profanity_words(
+    current_user: Principal = Depends(is_admin)
+):
+    """Get the banned words managed through the admin API"""
+    value = system_settings.get(PROFANITY_SETTING) or ""
+    return {
+        "words": value.splitlines(),
+        "loaded_word_count": profanity_filter.matcher.word_count
+    }
+
+@router.put("/profanity-words")
+async def update_profanity_words(
+    words: List[str] = Body(..., embed=True),
+    current_user: Principal = Depends(is_admin),
+    db: Session = Depends(get_db)
+):
+    """Replace the banned word list; every worker rebuilds its filter in the background"""
+    cleaned = sorted({word.strip() for word in words if word.strip()})
+    await system_settings.set(db, PROFANITY_SETTING, "\n".join(cleaned))
+    return {"message": f"Profanity filter updated with {len(cleaned)} words."}
 
 @router.get("/stats")
 async def get_stats(
-    current_user: User = Depends(is_admin),
+    current_user: Principal = Depends(is_admin),
     db: Session = Depends(get_db)
 ):
     """Get key statistics for the admin dashboard"""
@@ -75,9 +103,120 @@ async def get_stats(
         "avg_active_minutes": avg_active_minutes
     }
 
+@router.get("/websocket-stats")
+async def get_websocket_stats(
+    current_user: Principal = Depends(is_admin)
+):
+    """Get WebSocket fan-out metrics (queue depth, evictions, send latency percentiles)"""
+    return manager.get_stats()
+
+@router.get("/write-behind-stats")
+async def get_write_behind_stats(
+    current_user: Principal = Depends(is_admin)
+):
+    """Get write-behind message persistence metrics (batch sizes, flush latency)"""
+    return message_writer.get_stats()
+
+@router.get("/auth-cache-stats")
+async def get_auth_cache_stats(
+    current_user: Principal = Depends(is_admin)
+):
+    """Get principal and token cache hit rates"""
+    return {
+        "principals": principal_cache.get_stats(),
+        "tokens": token_cache.get_stats(),
+    }
+
+@router.get("/room-history-stats")
+async def get_room_history_stats(
+    current_user: Principal = Depends(is_admin)
+):
+    """Get room history cache hit rates and bytes held per room"""
+    return room_history.get_stats()
+
+@router.get("/scheduler-stats")
+async def get_scheduler_stats(
+    current_user: Principal = Depends(is_admin)
+):
+    """Get scheduled message delivery metrics (window size, sent, lateness)"""
+    return scheduler.get_stats()
+
+@router.get("/rooms/{room_id}/export")
+async def export_room_messages(
+    room_id: str,
+    compression: str = Query("none", pattern="^(none|gzip|zstd)$"),
+    after: Optional[str] = None,
+    current_user: Principal = Depends(is_admin),
+    db: Session = Depends(get_db)
+):
+    """
+    Stream a room's full history as NDJSON, oldest first.
+
+    Pass the `cursor` of the last line received as `after` to resume an
+    interrupted export.
+    """
+    if not db.query(RoomModel.id).filter(RoomModel.id == room_id).first():
+        raise HTTPException(status_code=404, detail="Room not found")
+
+    position = None
+    if after:
+        try:
+            created_at, message_id = decode_cursor(after)
+            position = (datetime.fromisoformat(created_at), message_id)
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    try:
+        make_compressor(compression)
+    except ImportError:
+        raise HTTPException(status_code=400, detail="zstd compression is not available on this server")
+
+    filename = f"room-{room_id}.ndjson" + {"none": "", "gzip": ".gz", "zstd": ".zst"}[compression]
+    return StreamingResponse(
+        stream_room_export(room_id, compression, position),
+        media_type="application/x-ndjson" if compression == "none" else "application/octet-stream",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.get("/archive-stats")
+async def get_archive_stats(
+    current_user: Principal = Depends(is_admin)
+):
+    """Get message archiving metrics (segments written, messages moved, pass time)"""
+    return archiver.get_stats()
+
+@router.put("/rooms/{room_id}/retention")
+async def set_room_retention(
+    room_id: str,
+    archive_after_days: Optional[int] = Body(None, embed=True, ge=0),
+    current_user: Principal = Depends(is_admin),
+    db: Session = Depends(get_db)
+):
+    """
+    Set how many days of a room's history stay in the messages table
+    before archiving: null for the server default, 0 to keep it all.
+    """
+    room = db.query(RoomModel).filter(RoomModel.id == room_id).first()
+    if not room:
+        raise HTTPException(status_code=404, detail="Room not found")
+    room.archive_after_days = archive_after_days
+    db.commit()
+    return {"room_id": room_id, "archive_after_days": archive_after_days}
+
+@router.post("/rooms/{room_id}/archive")
+async def archive_room_now(
+    room_id: str,
+    current_user: Principal = Depends(is_admin),
+    db: Session = Depends(get_db)
+):
+    """Archive a room's messages past its retention now instead of on the next pass"""
+    if not db.query(RoomModel.id).filter(RoomModel.id == room_id).first():
+        raise HTTPException(status_code=404, detail="Room not found")
+    return {"room_id": room_id, "archived": await archiver.archive_room(room_id)}
+
 @router.get("/user-growth")
 async def get_user_growth(
-    current_user: User = Depends(is_admin),
+    current_user: Principal = Depends(is_admin),
     db: Session = Depends(get_db)
 ):
     """Get user growth data for the last 30 days"""
@@ -102,7 +241,7 @@ async def get_user_growth(
 
 @router.get("/message-volume")
 async def get_message_volume(
-    current_user: User = Depends(is_admin),
+    current_user: Principal = Depends(is_admin),
     db: Session = Depends(get_db)
 ):
     """Get message volume for the last 7 days"""
@@ -121,7 +260,7 @@ async def get_message_volume(
 
 @router.get("/active-rooms")
 async def get_active_rooms(
-    current_user: User = Depends(is_admin),
+    current_user: Principal = Depends(is_admin),
     db: Session = Depends(get_db)
 ):
     """Get top 5 most active rooms by message count"""
@@ -153,7 +292,7 @@ async def get_active_rooms(
 async def get_all_users(
     skip: int = 0,
     limit: int = 100,
-    current_user: User = Depends(is_admin),
+    current_user: Principal = Depends(is_admin),
     db: Session = Depends(get_db)
 ):
     """List all users"""
@@ -164,7 +303,7 @@ async def get_all_users(
 async def update_user_status(
     user_id: str,
     is_active: bool,
-    current_user: User = Depends(is_admin),
+    current_user: Principal = Depends(is_admin),
     db: Session = Depends(get_db)
 ):
     """Ban or unban a user"""
@@ -174,13 +313,41 @@ async def update_user_status(
     
     user.is_active = is_active
     db.commit()
+    await invalidate_principal(user.id)
     return {"message": f"User status updated to {'active' if is_active else 'inactive'}"}
 
+@router.post("/users/{user_id}/ban")
+async def ban_user(
+    user_id: str,
+    sanction: Sanction,
+    current_user: Principal = Depends(is_admin),
+    db: Session = Depends(get_db)
+):
+    """Ban a user from the whole platform, for duration_minutes or until unbanned"""
+    if user_id == current_user.id:
+        raise HTTPException(status_code=400, detail="You cannot ban yourself")
+    if not db.query(UserModel.id).filter(UserModel.id == user_id).first():
+        raise HTTPException(status_code=404, detail="User not found")
+
+    expires_at = datetime.utcnow() + timedelta(minutes=sanction.duration_minutes) if sanction.duration_minutes else None
+    await sanctions.ban(db, user_id, banned_by=current_user.id, reason=sanction.reason, expires_at=expires_at)
+    return {"message": "User banned"}
+
+@router.delete("/users/{user_id}/ban")
+async def unban_user(
+    user_id: str,
+    current_user: Principal = Depends(is_admin),
+    db: Session = Depends(get_db)
+):
+    """Lift a platform-wide ban"""
+    await sanctions.unban(db, user_id)
+    return {"message": "User unbanned"}
+
 @router.get("/rooms")
 async def get_all_rooms(
     skip: int = 0,
     limit: int = 100,
-    current_user: User = Depends(is_admin),
+    current_user: Principal = Depends(is_admin),
     db: Session = Depends(get_db)
 ):
     """List all rooms (excluding DMs)"""
@@ -193,7 +360,7 @@ async def get_all_rooms(
 @router.delete("/rooms/{room_id}")
 async def delete_room(
     room_id: str,
-    current_user: User = Depends(is_admin),
+    current_user: Principal = Depends(is_admin),
     db: Session = Depends(get_db)
 ):
     """Delete a room"""
@@ -205,9 +372,11 @@ async def delete_room(
     # SQLAlchemy relationship cascade should handle this if configured, 
     # but explicit deletion is safer if not sure.
     db.query(MessageModel).filter(MessageModel.room_id == room_id).delete()
+    db.query(MessageArchiveSegmentModel).filter(MessageArchiveSegmentModel.room_id == room_id).delete()
     # RoomMember deletion might be needed too
     db.query(RoomMemberModel).filter(RoomMemberModel.room_id == room_id).delete()
     
     db.delete(room)
     db.commit()
+    await room_history.invalidate(room_id)
     return {"message": "Room deleted successfully"}
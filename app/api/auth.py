@@ -1,5 +1,5 @@
-from datetime import timedelta, datetime
-from fastapi import APIRouter, Depends, HTTPException, status
+from datetime import timedelta
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from fastapi.security import OAuth2PasswordRequestForm
 from sqlalchemy.orm import Session
 from sqlalchemy import or_
@@ -7,12 +7,13 @@ from sqlalchemy import or_
 from app.database.sql import get_db
 from app.models.sql import User as UserModel
 from app.core.security import (
-    get_password_hash, 
-    verify_password, 
+    password_hasher,
     create_access_token, 
     get_current_user,
-    User # Keep this import for get_current_user dependency
+    Principal
 )
+from app.core.presence import presence
+from app.core.moderation import rate_limiter
 from app.schemas.user import UserCreate
 from app.schemas.token import Token
 from app.config import settings
@@ -52,12 +53,15 @@ async def register_user(user_in: UserCreate, db: Session = Depends(get_db)):
             detail="Phone number already registered"
         )
 
+    # Give the connection back to the pool while bcrypt runs
+    db.close()
+
     # Create new user
     user = UserModel(
         email=user_in.email,
         username=user_in.username,
         phone_number=user_in.phone_number,
-        password_hash=get_password_hash(user_in.password),
+        password_hash=await password_hasher.hash(user_in.password),
         avatar_url=user_in.avatar_url
     )
     
@@ -77,10 +81,18 @@ async def register_user(user_in: UserCreate, db: Session = Depends(get_db)):
 
 @router.post("/login", response_model=Token)
 async def login(
+    request: Request,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db)
 ):
     logger.info(f"Login attempt for user: {form_data.username}")
+    client_ip = request.client.host if request.client else "unknown"
+    if not await rate_limiter.check("ip", client_ip):
+        logger.warning(f"Too many login attempts from {client_ip}")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts. Please try again later."
+        )
     # Find user by email or username
     user = db.query(UserModel).filter(
         or_(
@@ -88,9 +100,11 @@ async def login(
             UserModel.username == form_data.username
         )
     ).first()
+    # Give the connection back to the pool while bcrypt runs; the loaded user stays readable
+    db.close()
     
     # Check if user exists and password is correct
-    if not user or not verify_password(form_data.password, user.password_hash):
+    if not user or not await password_hasher.verify(form_data.password, user.password_hash):
         logger.warning(f"Login failed for user: {form_data.username}")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -113,15 +127,14 @@ async def login(
     )
     
     # Update last seen
-    user.last_seen = datetime.utcnow()
-    db.commit()
+    presence.touch(user.id)
     
     logger.info(f"Login successful for user: {form_data.username}")
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/logout")
-async def logout(current_user: User = Depends(get_current_user)):
+async def logout(current_user: Principal = Depends(get_current_user)):
     # In a real-world scenario with refresh tokens, we would invalidate the token here
     # But with simple JWT, we just return success - client should remove the token
-    logger.info(f"User logged out: {current_user.email}")
+    logger.info(f"User logged out: {current_user.username}")
     return {"message": "Successfully logged out"}
\ No newline at end of file
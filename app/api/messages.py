@@ -1,18 +1,20 @@
-from typing import List, Optional, Dict, Any
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Query, Body
-from datetime import datetime
+from typing import List, Optional, Dict, Any, Tuple
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, Query, Body, Response
+from datetime import datetime, timedelta, timezone
 import json
-from sqlalchemy.orm import Session
-from sqlalchemy import desc, and_
+from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import desc, and_, or_
 
 from app.database.sql import get_db
-from app.core.security import get_current_active_user, is_moderator_or_admin, is_admin
-from app.core.moderation import profanity_filter, rate_limiter
+from app.core.security import Principal, get_current_active_user, is_moderator_or_admin, is_admin
+from app.core.moderation import profanity_filter, rate_limiter, spam_guard, check_user_permissions
 from app.schemas.message import (
     MessageCreate, MessageUpdate, 
     MessageWithReactions, MessageReportCreate, 
     BroadcastMessageCreate, DeleteMessageRequest,
-    MessageWithReadReceipts,
+    MessageWithReadReceipts, MessageSearchResult,
+    ScheduledMessageCreate, ScheduledMessage as ScheduledMessageSchema,
+    MessageReactionCreate, ReadPosition, MarkRead,
     MessageType, DeletionType,
     Message as MessageSchema,
     MessageReaction as MessageReactionSchema,
@@ -22,45 +24,103 @@ from app.schemas.message import (
 from app.models.sql import (
     Message as MessageModel, 
     Room as RoomModel, RoomMember as RoomMemberModel,
-    User as UserModel, HiddenMessage as HiddenMessageModel
+    HiddenMessage as HiddenMessageModel,
+    ScheduledMessage as ScheduledMessageModel,
+    MessageReaction as MessageReactionModel
 )
+from app.schemas.user import User as UserSchema
 from app.config import settings
 from app.core.websocket_manager import manager
+from app.core.room_history import room_history, serialize_message
+from app.core.reactions import add_reaction, remove_reaction, attach_reactions, is_reaction_emoji, reaction_broadcaster
+from app.core.search import search_messages, has_terms
+from app.core.scheduler import scheduler
+from app.core.read_receipts import mark_read, read_positions, read_by, read_receipts
+from app.core.archive import read_archive
+from app.utils.pagination import encode_cursor, decode_cursor
 
 router = APIRouter()
 
-# Background task to deliver scheduled messages - Simplified for SQL
-async def deliver_scheduled_message(message_id: str, db: Session):
-    pass
+def _as_utc(value: datetime) -> datetime:
+    """Naive UTC, as every timestamp is stored"""
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _cursor_key(cursor: str) -> Tuple[datetime, str]:
+    try:
+        created_at, message_id = decode_cursor(cursor)
+        return datetime.fromisoformat(created_at), message_id
+    except (ValueError, TypeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+def _keyset_filter(cursor: str, newer: bool):
+    """Rows strictly after (newer=True) or before a (created_at, id) cursor"""
+    created_at, message_id = _cursor_key(cursor)
+    # The plain range on created_at bounds the index scan; the OR only breaks ties
+    if newer:
+        return and_(
+            MessageModel.created_at >= created_at,
+            or_(MessageModel.created_at > created_at, MessageModel.id > message_id)
+        )
+    return and_(
+        MessageModel.created_at <= created_at,
+        or_(MessageModel.created_at < created_at, MessageModel.id < message_id)
+    )
 
 @router.get("/rooms/{room_id}/messages", response_model=List[MessageSchema])
 async def read_messages(
     room_id: str,
+    response: Response,
     skip: int = 0,
-    limit: int = 100,
+    limit: int = Query(100, ge=1, le=500),
+    before: Optional[str] = None,
+    after: Optional[str] = None,
     before_timestamp: Optional[datetime] = None,
     after_timestamp: Optional[datetime] = None,
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
-    """Get messages in a room with pagination"""
-    room = db.query(RoomModel).filter(RoomModel.id == room_id).first()
-    if not room:
+    """
+    Get messages in a room, newest first.
+
+    Pass the X-Next-Cursor header of a page as `before` to load older
+    messages, or a cursor as `after` to load newer ones. `skip` is only
+    honoured when no cursor is given.
+    """
+    # The room and the user's membership of it in one query
+    found = db.query(RoomModel, RoomMemberModel).outerjoin(
+        RoomMemberModel,
+        and_(
+            RoomMemberModel.room_id == RoomModel.id,
+            RoomMemberModel.user_id == current_user.id
+        )
+    ).filter(RoomModel.id == room_id).first()
+    if not found:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Room not found"
         )
     
-    if room.is_private:
-        member = db.query(RoomMemberModel).filter(
-            RoomMemberModel.room_id == room_id,
-            RoomMemberModel.user_id == current_user.id
-        ).first()
-        if not member:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You don't have permission to access this private room"
-            )
+    room, member = found
+    if room.is_private and not member:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to access this private room"
+        )
+            
+    cleared_at = member.cleared_at if member else None
+
+    # The newest page is the same for every member, so it usually comes from the room's ring
+    if not (skip or before or after or before_timestamp or after_timestamp):
+        page = room_history.get_page(db, room_id, current_user.id, limit, cleared_at)
+        if page is not None:
+            if len(page) == limit:
+                response.headers["X-Next-Cursor"] = encode_cursor(page[-1][0], page[-1][1])
+            return attach_reactions(db, current_user.id, [entry[2] for entry in page])
             
     # Build query with hidden messages filter
     query = db.query(MessageModel).outerjoin(
@@ -74,24 +134,136 @@ async def read_messages(
         HiddenMessageModel.id == None  # Only messages NOT hidden by this user
     )
     
+    # Messages from before the member last cleared the chat
+    if cleared_at:
+        query = query.filter(MessageModel.created_at > cleared_at)
+    
     if before_timestamp:
         query = query.filter(MessageModel.created_at < before_timestamp)
     if after_timestamp:
         query = query.filter(MessageModel.created_at > after_timestamp)
+    if before:
+        query = query.filter(_keyset_filter(before, newer=False))
         
-    messages = query.order_by(desc(MessageModel.created_at)).offset(skip).limit(limit).all()
+    # Messages up to here live in archive segments, all older than any in the table
+    boundary = (room.archived_until, room.archived_until_id) if room.archived_until else None
+    archive_args = dict(
+        cleared_at=cleared_at,
+        before_timestamp=before_timestamp,
+        after_timestamp=after_timestamp
+    )
     
-    return messages
+    if after:
+        # Walk forward from the cursor, then return the page newest first like every other page
+        after_key = _cursor_key(after)
+        archived = []
+        if boundary and after_key < boundary:
+            archived = read_archive(db, room_id, current_user.id, limit, after=after_key, **archive_args)
+        hot = []
+        if len(archived) < limit:
+            query = query.filter(_keyset_filter(after, newer=True))
+            hot = query.order_by(MessageModel.created_at, MessageModel.id).limit(limit - len(archived)).all()
+        hot.reverse()
+        archived.reverse()
+    else:
+        query = query.order_by(desc(MessageModel.created_at), desc(MessageModel.id))
+        if not before:
+            query = query.offset(skip)
+        hot = query.limit(limit).all()
+        archived = []
+        if boundary and len(hot) < limit:
+            # The page runs past the oldest hot message: continue from the archive
+            archive_skip = 0
+            if skip and not before and not hot:
+                archive_skip = max(skip - query.offset(None).count(), 0)
+            archived = read_archive(
+                db, room_id, current_user.id, limit - len(hot),
+                before=_cursor_key(before) if before else None,
+                skip=archive_skip,
+                **archive_args
+            )
+
+    # Newest first either way: hot messages, then archived ones
+    keys = [(message.created_at, message.id) for message in hot] + [key for key, _ in archived]
+    page = attach_reactions(db, current_user.id, [serialize_message(message) for message in hot])
+    page += [payload for _, payload in archived]
+
+    # A full page means there may be more in the direction of travel
+    if len(page) == limit:
+        edge = keys[0] if after else keys[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(*edge)
+
+    return page
+
+@router.get("/search", response_model=List[MessageSearchResult])
+async def search_room_messages(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    room_id: Optional[str] = None,
+    user_id: Optional[str] = None,
+    after_timestamp: Optional[datetime] = None,
+    before_timestamp: Optional[datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = Query(20, ge=1, le=100),
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Search messages the current user can read, best match first.
+
+    Filter by room, sender (`user_id`) or date range; pass the
+    X-Next-Cursor header of a page as `cursor` for the next one.
+    """
+    if not has_terms(q):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Search query must contain at least one word"
+        )
+
+    last = None
+    if cursor:
+        try:
+            score, created_at, message_id = decode_cursor(cursor)
+            last = (float(score), datetime.fromisoformat(created_at), message_id)
+        except (ValueError, TypeError):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+
+    hits = search_messages(
+        db, current_user.id, q, limit,
+        room_id=room_id,
+        sender_id=user_id,
+        after=after_timestamp,
+        before=before_timestamp,
+        cursor=last
+    )
+
+    if len(hits) == limit:
+        message, score = hits[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(score, message.created_at, message.id)
+
+    return attach_reactions(db, current_user.id, [
+        {**serialize_message(message), "score": score}
+        for message, score in hits
+    ])
 
 @router.post("/rooms/{room_id}/messages", response_model=MessageSchema)
 async def create_message(
     room_id: str,
     message_in: MessageCreate,
     background_tasks: BackgroundTasks,
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Create a new message in a room"""
+    if message_in.scheduled_for and _as_utc(message_in.scheduled_for) > datetime.utcnow():
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Use POST /rooms/{room_id}/scheduled-messages to schedule a message"
+        )
+
     room = db.query(RoomModel).filter(RoomModel.id == room_id).first()
     if not room:
         raise HTTPException(
@@ -110,12 +282,19 @@ async def create_message(
             detail="You are not a member of this room"
         )
         
+    check_user_permissions(current_user.id, room_id)
+        
     # Check rate limiting
-    if not rate_limiter.check_rate_limit(current_user.id, settings.RATE_LIMIT_MESSAGES_PER_MINUTE):
+    if not await rate_limiter.check_rate_limit(current_user.id, settings.RATE_LIMIT_MESSAGES_PER_MINUTE):
         raise HTTPException(
             status_code=status.HTTP_429_TOO_MANY_REQUESTS,
             detail=f"Rate limit exceeded. Maximum {settings.RATE_LIMIT_MESSAGES_PER_MINUTE} messages per minute."
         )
+    if not await rate_limiter.check("room", room_id):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="This room is receiving too many messages. Please slow down."
+        )
     
     is_encrypted = message_in.message_type == MessageType.ENCRYPTED
     content = message_in.content
@@ -127,8 +306,14 @@ async def create_message(
                 detail=f"Message too long. Maximum {settings.MAX_MESSAGE_LENGTH} characters allowed."
             )
         
-        if profanity_filter.contains_profanity(content):
-            content = profanity_filter.censor_text(content)
+        spam_reason = spam_guard.check(current_user.id, content)
+        if spam_reason:
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail=spam_reason
+            )
+        
+        content = profanity_filter.censor_text(content)
             
     message = MessageModel(
         content=content,
@@ -145,6 +330,7 @@ async def create_message(
     
     db.commit()
     db.refresh(message)
+    await room_history.added(message)
     
     # Prepare message data for websocket
     msg_data = {
@@ -168,11 +354,220 @@ async def create_message(
     
     return message
 
+@router.post("/rooms/{room_id}/scheduled-messages", response_model=ScheduledMessageSchema)
+async def schedule_message(
+    room_id: str,
+    message_in: ScheduledMessageCreate,
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Schedule a message to be sent to a room later"""
+    member = db.query(RoomMemberModel).filter(
+        RoomMemberModel.room_id == room_id,
+        RoomMemberModel.user_id == current_user.id
+    ).first()
+    if not member:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You are not a member of this room"
+        )
+
+    check_user_permissions(current_user.id, room_id)
+
+    scheduled_for = _as_utc(message_in.scheduled_for)
+    now = datetime.utcnow()
+    if scheduled_for <= now:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="scheduled_for must be in the future"
+        )
+    if scheduled_for > now + timedelta(days=settings.SCHEDULED_MAX_DAYS_AHEAD):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Messages can be scheduled at most {settings.SCHEDULED_MAX_DAYS_AHEAD} days ahead"
+        )
+
+    if not await rate_limiter.check_rate_limit(current_user.id, settings.RATE_LIMIT_MESSAGES_PER_MINUTE):
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail=f"Rate limit exceeded. Maximum {settings.RATE_LIMIT_MESSAGES_PER_MINUTE} messages per minute."
+        )
+
+    is_encrypted = message_in.is_encrypted or message_in.message_type == MessageType.ENCRYPTED
+    content = message_in.content
+    if not is_encrypted:
+        content = profanity_filter.censor_text(content)
+
+    scheduled = ScheduledMessageModel(
+        room_id=room_id,
+        user_id=current_user.id,
+        content=content,
+        message_type=MessageType.ENCRYPTED if is_encrypted else message_in.message_type,
+        is_encrypted=is_encrypted,
+        scheduled_for=scheduled_for,
+        status="pending"
+    )
+    db.add(scheduled)
+    db.commit()
+    db.refresh(scheduled)
+
+    scheduler.add(scheduled.id, scheduled.scheduled_for)
+    return scheduled
+
+@router.get("/scheduled-messages", response_model=List[ScheduledMessageSchema])
+async def read_scheduled_messages(
+    room_id: Optional[str] = None,
+    include_finished: bool = False,
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """List the current user's scheduled messages, soonest first"""
+    query = db.query(ScheduledMessageModel).filter(ScheduledMessageModel.user_id == current_user.id)
+    if room_id:
+        query = query.filter(ScheduledMessageModel.room_id == room_id)
+    if not include_finished:
+        query = query.filter(ScheduledMessageModel.status == "pending")
+    return query.order_by(ScheduledMessageModel.scheduled_for).limit(500).all()
+
+@router.delete("/scheduled-messages/{scheduled_id}")
+async def cancel_scheduled_message(
+    scheduled_id: str,
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Cancel a scheduled message that has not been sent yet"""
+    # Conditional update, so a message being sent right now cannot also be cancelled
+    cancelled = db.query(ScheduledMessageModel).filter(
+        ScheduledMessageModel.id == scheduled_id,
+        ScheduledMessageModel.user_id == current_user.id,
+        ScheduledMessageModel.status == "pending"
+    ).update({ScheduledMessageModel.status: "cancelled"}, synchronize_session=False)
+    db.commit()
+
+    if not cancelled:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="No pending scheduled message with that id"
+        )
+    return {"message": "Scheduled message cancelled"}
+
+def _reactable_message(db: Session, message_id: str, user: Principal) -> MessageModel:
+    """The message, if the user can see its room and may post there"""
+    found = db.query(MessageModel, RoomModel.is_private, RoomMemberModel.id).join(
+        RoomModel, RoomModel.id == MessageModel.room_id
+    ).outerjoin(
+        RoomMemberModel,
+        and_(
+            RoomMemberModel.room_id == MessageModel.room_id,
+            RoomMemberModel.user_id == user.id
+        )
+    ).filter(MessageModel.id == message_id).first()
+    if not found or (found[1] and not found[2]):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Message not found"
+        )
+    message = found[0]
+    check_user_permissions(user.id, message.room_id)
+    return message
+
+@router.post("/messages/{message_id}/reactions")
+async def react_to_message(
+    message_id: str,
+    reaction_in: MessageReactionCreate,
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Add a reaction to a message (once per user and emoji)"""
+    if not is_reaction_emoji(reaction_in.emoji):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unsupported reaction emoji"
+        )
+    message = _reactable_message(db, message_id, current_user)
+    room_id = message.room_id
+
+    added = add_reaction(db, message_id, current_user.id, reaction_in.emoji)
+    if added:
+        reaction_broadcaster.touch(message_id, room_id)
+    return {"message": "Reaction added" if added else "Already reacted", "emoji": reaction_in.emoji}
+
+@router.delete("/messages/{message_id}/reactions/{emoji}")
+async def remove_message_reaction(
+    message_id: str,
+    emoji: str,
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Remove the current user's reaction to a message"""
+    message = _reactable_message(db, message_id, current_user)
+    room_id = message.room_id
+
+    if remove_reaction(db, message_id, current_user.id, emoji):
+        reaction_broadcaster.touch(message_id, room_id)
+    return {"message": "Reaction removed", "emoji": emoji}
+
+@router.get("/messages/{message_id}/reactions", response_model=List[MessageReactionSchema])
+async def read_message_reactions(
+    message_id: str,
+    emoji: Optional[str] = None,
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=500),
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """List who reacted to a message, newest first"""
+    _reactable_message(db, message_id, current_user)
+    query = db.query(MessageReactionModel).options(
+        joinedload(MessageReactionModel.user)
+    ).filter(MessageReactionModel.message_id == message_id)
+    if emoji:
+        query = query.filter(MessageReactionModel.emoji == emoji)
+    return query.order_by(desc(MessageReactionModel.created_at)).offset(skip).limit(limit).all()
+
+@router.post("/rooms/{room_id}/read")
+async def mark_room_read(
+    room_id: str,
+    read_in: MarkRead,
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Mark the room read up to and including a message"""
+    position = mark_read(db, room_id, current_user.id, read_in.message_id)
+    if position:
+        read_receipts.touch(room_id, current_user.id, position)
+    return {"message": "Read position updated" if position else "Already read", "advanced": position is not None}
+
+@router.get("/rooms/{room_id}/read-positions", response_model=List[ReadPosition])
+async def read_room_read_positions(
+    room_id: str,
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """How far each member has read; a message is read by every member positioned at or past it"""
+    positions = read_positions(db, room_id)
+    if not any(position.user_id == current_user.id for position in positions):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You are not a member of this room"
+        )
+    return positions
+
+@router.get("/messages/{message_id}/read-by", response_model=List[UserSchema])
+async def read_message_read_by(
+    message_id: str,
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """Members who have read a message"""
+    message = _reactable_message(db, message_id, current_user)
+    return read_by(db, message)
+
 @router.put("/messages/{message_id}", response_model=MessageSchema)
 async def update_message(
     message_id: str,
     message_in: MessageUpdate,
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Update a message (owner only)"""
@@ -197,13 +592,13 @@ async def update_message(
             detail=f"Message too long. Maximum {settings.MAX_MESSAGE_LENGTH} characters allowed."
         )
     
-    if profanity_filter.contains_profanity(content):
-        content = profanity_filter.censor_text(content)
+    content = profanity_filter.censor_text(content)
         
     message.content = content
     message.edited_at = datetime.utcnow()
     db.commit()
     db.refresh(message)
+    await room_history.updated(message)
     
     await manager.broadcast_to_room(
         room_id=str(message.room_id),
@@ -221,7 +616,7 @@ async def update_message(
 async def delete_message(
     message_id: str,
     deletion_request: DeleteMessageRequest = Body(None),
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Delete a message"""
@@ -270,6 +665,7 @@ async def delete_message(
     else: # FOR_EVERYONE
         db.delete(message)
         db.commit()
+        await room_history.deleted(str(message.room_id), message_id)
         
         await manager.notify_message_deleted(
             room_id=str(message.room_id),
@@ -283,7 +679,7 @@ async def delete_message(
 @router.delete("/rooms/{room_id}/messages/clear")
 async def clear_room_messages(
     room_id: str,
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Hide all messages in a room for the current user"""
@@ -293,36 +689,24 @@ async def clear_room_messages(
     if not room:
         raise HTTPException(status_code=404, detail="Room not found")
     
-    # Check membership for private rooms
-    if room.is_private:
-        member = db.query(RoomMemberModel).filter(
-            RoomMemberModel.room_id == room_id,
-            RoomMemberModel.user_id == current_user.id
-        ).first()
-        if not member:
-            raise HTTPException(status_code=403, detail="Not a member of this room")
+    # The watermark lives on the membership row
+    member = db.query(RoomMemberModel).filter(
+        RoomMemberModel.room_id == room_id,
+        RoomMemberModel.user_id == current_user.id
+    ).first()
+    if not member:
+        raise HTTPException(status_code=403, detail="Not a member of this room")
 
-    # Get all message IDs in this room
-    message_ids = db.query(MessageModel.id).filter(
-        MessageModel.room_id == room_id
-    ).all()
-    
-    count = 0
-    # Create hidden_message records for messages not already hidden
-    for (msg_id,) in message_ids:
-        existing = db.query(HiddenMessageModel).filter(
-            HiddenMessageModel.message_id == msg_id,
-            HiddenMessageModel.user_id == current_user.id
-        ).first()
-        
-        if not existing:
-            hidden_msg = HiddenMessageModel(
-                message_id=msg_id,
-                user_id=current_user.id
-            )
-            db.add(hidden_msg)
-            count += 1
-    
+    # Everything up to now is hidden by the watermark, so individual hidden rows below it are redundant
+    member.cleared_at = datetime.utcnow()
+    covered = db.query(MessageModel.id).filter(
+        MessageModel.room_id == room_id,
+        MessageModel.created_at <= member.cleared_at
+    )
+    db.query(HiddenMessageModel).filter(
+        HiddenMessageModel.user_id == current_user.id,
+        HiddenMessageModel.message_id.in_(covered)
+    ).delete(synchronize_session=False)
     db.commit()
     
-    return {"message": f"Cleared {count} messages from room"}
\ No newline at end of file
+    return {"message": "Cleared messages from room"}
@@ -3,14 +3,17 @@ import string
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, status, Query
 from datetime import datetime, timedelta
-from sqlalchemy.orm import Session
-from sqlalchemy import or_, desc
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy import or_, desc, func, and_
 
 from app.database.sql import get_db
-from app.core.security import get_current_active_user, is_room_admin
-from app.schemas.room import RoomCreate, RoomUpdate, RoomWithMembers, RoomOwnershipTransfer, Room as RoomSchema, DMCreate
-from app.models.sql import Room as RoomModel, RoomMember as RoomMemberModel, User as UserModel
+from app.core.security import Principal, get_current_active_user, is_room_admin
+from app.schemas.room import RoomCreate, RoomUpdate, RoomWithMembers, RoomOwnershipTransfer, Room as RoomSchema, DMCreate, Sanction
+from app.models.sql import Room as RoomModel, RoomMember as RoomMemberModel, User as UserModel, Message as MessageModel, MessageArchiveSegment as MessageArchiveSegmentModel
 from app.core.websocket_manager import manager
+from app.core.sanctions import sanctions
+from app.core.room_history import room_history
+from app.core.read_receipts import read_receipts
 
 router = APIRouter()
 
@@ -18,10 +21,16 @@ def generate_join_code():
     """Generates a 9-digit code."""
     return ''.join(random.choices(string.digits, k=9))
 
+def load_room_with_members(db: Session, room_id: str) -> Optional[RoomModel]:
+    """Load a room with its members and their users in two queries, whatever the member count"""
+    return db.query(RoomModel).options(
+        selectinload(RoomModel.members).joinedload(RoomMemberModel.user)
+    ).filter(RoomModel.id == room_id).first()
+
 @router.post("/dm", response_model=RoomSchema)
 async def create_dm(
     dm_in: DMCreate,
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Create or get existing Direct Message (DM) room"""
@@ -51,18 +60,18 @@ async def create_dm(
         RoomMemberModel.user_id == target_user_id
     ).subquery()
 
-    # Find common rooms
-    common_rooms = db.query(RoomModel).filter(
-        RoomModel.id.in_(my_rooms),
-        RoomModel.id.in_(target_rooms),
-        RoomModel.is_private == True
-    ).all()
+    # Find common rooms with exactly two members
+    pair_rooms = db.query(RoomMemberModel.room_id).filter(
+        RoomMemberModel.room_id.in_(my_rooms),
+        RoomMemberModel.room_id.in_(target_rooms)
+    ).group_by(RoomMemberModel.room_id).having(func.count(RoomMemberModel.id) == 2)
 
-    for room in common_rooms:
-        # Check member count is exactly 2
-        member_count = db.query(RoomMemberModel).filter(RoomMemberModel.room_id == room.id).count()
-        if member_count == 2:
-            return room
+    existing = db.query(RoomModel.id).filter(
+        RoomModel.id.in_(pair_rooms),
+        RoomModel.is_private == True
+    ).first()
+    if existing:
+        return load_room_with_members(db, existing.id)
 
     # 2. If not found, create new private room
     join_code = generate_join_code()
@@ -79,8 +88,7 @@ async def create_dm(
     )
     
     db.add(room)
-    db.commit()
-    db.refresh(room)
+    db.flush()
     
     # Add both users
     member1 = RoomMemberModel(user_id=current_user.id, room_id=room.id, role="admin")
@@ -90,12 +98,12 @@ async def create_dm(
     db.add(member2)
     db.commit()
     
-    return room
+    return load_room_with_members(db, room.id)
 
 @router.post("/", response_model=RoomSchema)
 async def create_room(
     room_in: RoomCreate,
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Create a new chat room"""
@@ -116,8 +124,7 @@ async def create_room(
     )
     
     db.add(room)
-    db.commit()
-    db.refresh(room)
+    db.flush()
     
     # Add creator as a member
     room_member = RoomMemberModel(
@@ -128,7 +135,7 @@ async def create_room(
     db.add(room_member)
     db.commit()
     
-    return room
+    return load_room_with_members(db, room.id)
 
 @router.get("/", response_model=List[dict])
 async def read_rooms(
@@ -136,19 +143,25 @@ async def read_rooms(
     limit: int = 100,
     search: str = None,
     is_private: bool = None,
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Get list of rooms with optional filtering"""
-    query = db.query(RoomModel)
+    # The user's own membership comes back with each room for the unread check
+    query = db.query(RoomModel, RoomMemberModel.id, RoomMemberModel.last_read_at).outerjoin(
+        RoomMemberModel,
+        and_(
+            RoomMemberModel.room_id == RoomModel.id,
+            RoomMemberModel.user_id == current_user.id
+        )
+    )
 
     # Privacy filter
     if is_private is not None:
         query = query.filter(RoomModel.is_private == is_private)
     else:
         # Show ONLY rooms where user is a member
-        user_room_ids = [m.room_id for m in db.query(RoomMemberModel).filter(RoomMemberModel.user_id == current_user.id).all()]
-        query = query.filter(RoomModel.id.in_(user_room_ids))
+        query = query.filter(RoomMemberModel.id != None)
 
     # Search filter
     if search:
@@ -160,11 +173,18 @@ async def read_rooms(
         )
     
     # Sort by last_activity descending
-    rooms = query.order_by(desc(RoomModel.last_activity)).offset(skip).limit(limit).all()
+    rows = query.order_by(desc(RoomModel.last_activity)).offset(skip).limit(limit).all()
+
+    # Member counts for the whole page in one query
+    member_counts = dict(
+        db.query(RoomMemberModel.room_id, func.count(RoomMemberModel.id)).filter(
+            RoomMemberModel.room_id.in_([room.id for room, _, _ in rows])
+        ).group_by(RoomMemberModel.room_id).all()
+    ) if rows else {}
     
     # Calculate has_unread for each room
     rooms_data = []
-    for room in rooms:
+    for room, member_id, last_read_at in rows:
         # Convert to schema compatible dict/object
         room_dict = {
             "id": room.id,
@@ -177,15 +197,14 @@ async def read_rooms(
             "is_temporary": room.is_temporary,
             "expires_at": room.expires_at,
             "last_activity": room.last_activity,
-            "member_count": len(room.members),
+            "member_count": member_counts.get(room.id, 0),
             "join_code": room.join_code
         }
         
         # Check unread status
-        member = next((m for m in room.members if m.user_id == current_user.id), None)
-        if member and room.last_activity:
+        if member_id and room.last_activity:
             # If last_read_at is None, it's unread. If last_activity > last_read_at, it's unread.
-            if not member.last_read_at or room.last_activity > member.last_read_at:
+            if not last_read_at or room.last_activity > last_read_at:
                 room_dict["has_unread"] = True
             else:
                 room_dict["has_unread"] = False
@@ -199,11 +218,11 @@ async def read_rooms(
 @router.get("/{room_id}", response_model=RoomSchema)
 async def read_room(
     room_id: str,
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Get details of a specific room with member list"""
-    room = db.query(RoomModel).filter(RoomModel.id == room_id).first()
+    room = load_room_with_members(db, room_id)
     
     if not room:
         raise HTTPException(
@@ -211,30 +230,28 @@ async def read_room(
             detail="Room not found"
         )
     
+    member = next((m for m in room.members if m.user_id == current_user.id), None)
+
     # Check if room is private and user is a member
-    if room.is_private:
-        member = db.query(RoomMemberModel).filter(
-            RoomMemberModel.room_id == room_id,
-            RoomMemberModel.user_id == current_user.id
-        ).first()
-        
-        if not member:
-             raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You don't have permission to access this private room"
-            )
+    if room.is_private and not member:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You don't have permission to access this private room"
+        )
             
     # Mark as read
-    member = db.query(RoomMemberModel).filter(
-        RoomMemberModel.room_id == room_id,
-        RoomMemberModel.user_id == current_user.id
-    ).first()
+    read_at = datetime.utcnow()
+    if member:
+        member.last_read_at = read_at
+        member.last_read_message_id = None
     
+    # Serialized before the commit, which would otherwise expire the room and reload it
+    result = RoomSchema.model_validate(room)
     if member:
-        member.last_read_at = datetime.utcnow()
         db.commit()
+        read_receipts.touch(room_id, current_user.id, (read_at, None))
             
-    return room
+    return result
 
 @router.put("/{room_id}", response_model=RoomSchema)
 async def update_room(
@@ -244,7 +261,7 @@ async def update_room(
     db: Session = Depends(get_db)
 ):
     """Update a room (room admin only)"""
-    room = db.query(RoomModel).filter(RoomModel.id == room_id).first()
+    room = load_room_with_members(db, room_id)
     if not room:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -258,9 +275,9 @@ async def update_room(
     if room_in.is_private is not None:
         room.is_private = room_in.is_private
     
+    result = RoomSchema.model_validate(room)
     db.commit()
-    db.refresh(room)
-    return room
+    return result
 
 @router.delete("/{room_id}")
 async def delete_room(
@@ -278,16 +295,18 @@ async def delete_room(
     
     # Delete members and messages first
     db.query(MessageModel).filter(MessageModel.room_id == room_id).delete()
+    db.query(MessageArchiveSegmentModel).filter(MessageArchiveSegmentModel.room_id == room_id).delete()
     db.query(RoomMemberModel).filter(RoomMemberModel.room_id == room_id).delete()
     db.delete(room)
     db.commit()
+    await room_history.invalidate(room_id)
     
     return {"message": "Room deleted successfully"}
 
 @router.post("/{room_id}/join")
 async def join_room(
     room_id: str,
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Join a chat room"""
@@ -306,6 +325,12 @@ async def join_room(
     
     if member:
         return {"message": "You are already a member of this room"}
+
+    if sanctions.is_banned(current_user.id, room.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You are banned from this room"
+        )
     
     # Check member limit
     if room.max_members:
@@ -330,7 +355,7 @@ async def join_room(
 @router.post("/join/{join_code}")
 async def join_room_by_code(
     join_code: str,
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Join a chat room using a join code"""
@@ -349,6 +374,12 @@ async def join_room_by_code(
     
     if member:
         return {"message": "You are already a member of this room"}
+
+    if sanctions.is_banned(current_user.id, room.id):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="You are banned from this room"
+        )
     
     # Check member limit
     if room.max_members:
@@ -373,7 +404,7 @@ async def join_room_by_code(
 @router.post("/{room_id}/leave")
 async def leave_room(
     room_id: str,
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Leave a chat room"""
@@ -479,6 +510,81 @@ async def remove_member(
 
     return {"message": "Member removed from the room."}
 
+@router.post("/{room_id}/members/{user_id}/mute", status_code=status.HTTP_200_OK)
+async def mute_member(
+    room_id: str,
+    user_id: str,
+    sanction: Sanction,
+    admin_member: RoomMemberModel = Depends(is_room_admin),
+    db: Session = Depends(get_db)
+):
+    """Mute a room member, for duration_minutes or until unmuted."""
+    if str(admin_member.user_id) == user_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You cannot mute yourself.")
+
+    member_to_mute = db.query(RoomMemberModel).filter(
+        RoomMemberModel.room_id == room_id,
+        RoomMemberModel.user_id == user_id
+    ).first()
+
+    if not member_to_mute:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Member not found in this room.")
+
+    until = datetime.utcnow() + timedelta(minutes=sanction.duration_minutes) if sanction.duration_minutes else None
+    await sanctions.mute(db, member_to_mute, until)
+    await manager.broadcast_to_room(room_id, {"type": "member_muted", "user_id": user_id, "muted_until": until.isoformat() if until else None})
+    return {"message": "Member muted."}
+
+@router.delete("/{room_id}/members/{user_id}/mute", status_code=status.HTTP_200_OK)
+async def unmute_member(
+    room_id: str,
+    user_id: str,
+    admin_member: RoomMemberModel = Depends(is_room_admin),
+    db: Session = Depends(get_db)
+):
+    """Lift a room member's mute."""
+    member_to_unmute = db.query(RoomMemberModel).filter(
+        RoomMemberModel.room_id == room_id,
+        RoomMemberModel.user_id == user_id
+    ).first()
+
+    if not member_to_unmute:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Member not found in this room.")
+
+    await sanctions.unmute(db, member_to_unmute)
+    await manager.broadcast_to_room(room_id, {"type": "member_unmuted", "user_id": user_id})
+    return {"message": "Member unmuted."}
+
+@router.post("/{room_id}/bans/{user_id}", status_code=status.HTTP_200_OK)
+async def ban_from_room(
+    room_id: str,
+    user_id: str,
+    sanction: Sanction,
+    admin_member: RoomMemberModel = Depends(is_room_admin),
+    db: Session = Depends(get_db)
+):
+    """Ban a user from a room, removing them if they are a member."""
+    if str(admin_member.user_id) == user_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="You cannot ban yourself.")
+
+    if not db.query(UserModel.id).filter(UserModel.id == user_id).first():
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found.")
+
+    expires_at = datetime.utcnow() + timedelta(minutes=sanction.duration_minutes) if sanction.duration_minutes else None
+    await sanctions.ban(db, user_id, room_id, banned_by=admin_member.user_id, reason=sanction.reason, expires_at=expires_at)
+    return {"message": "User banned from the room."}
+
+@router.delete("/{room_id}/bans/{user_id}", status_code=status.HTTP_200_OK)
+async def unban_from_room(
+    room_id: str,
+    user_id: str,
+    admin_member: RoomMemberModel = Depends(is_room_admin),
+    db: Session = Depends(get_db)
+):
+    """Lift a user's ban from a room."""
+    await sanctions.unban(db, user_id, room_id)
+    return {"message": "User unbanned from the room."}
+
 @router.post("/{room_id}/transfer-ownership", status_code=status.HTTP_200_OK)
 async def transfer_ownership(
     room_id: str,
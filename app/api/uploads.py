@@ -2,7 +2,7 @@ from fastapi import APIRouter, Depends, UploadFile, File, HTTPException, status
 import os
 import uuid
 import aiofiles
-from app.core.security import get_current_active_user, User
+from app.core.security import get_current_active_user, Principal
 from app.config import settings
 
 router = APIRouter()
@@ -10,7 +10,7 @@ router = APIRouter()
 @router.post("/")
 async def upload_file(
     file: UploadFile = File(...),
-    current_user: User = Depends(get_current_active_user)
+    current_user: Principal = Depends(get_current_active_user)
 ):
     """Handle file uploads and return the file URL."""
     # Basic validation for content type can be done here if needed
@@ -7,21 +7,29 @@ from sqlalchemy.orm import Session
 from sqlalchemy import or_
 
 from app.database.sql import get_db
-from app.models.sql import User as UserModel, Message as MessageModel, RoomMember as RoomMemberModel, Room as RoomModel
+from app.models.sql import (
+    User as UserModel, Message as MessageModel, RoomMember as RoomMemberModel, Room as RoomModel,
+    MessageArchiveSegment as MessageArchiveSegmentModel
+)
 from app.schemas.user import User as UserSchema, UserUpdate, UserStatusUpdate
 from app.core.security import (
     get_current_active_user,
-    get_password_hash,
+    get_current_db_user,
+    invalidate_principal,
+    password_hasher,
     is_admin,
+    Principal,
 )
 from app.config import settings
+from app.core.room_history import room_history
+from app.core.archive import drop_user_messages
 
 router = APIRouter()
 
 @router.put("/me/status", response_model=UserSchema)
 async def update_current_user_status(
     status_in: UserStatusUpdate,
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: UserModel = Depends(get_current_db_user),
     db: Session = Depends(get_db)
 ):
     """Update current user's status"""
@@ -32,7 +40,7 @@ async def update_current_user_status(
 
 @router.get("/me", response_model=UserSchema)
 async def read_current_user(
-    current_user: UserModel = Depends(get_current_active_user)
+    current_user: UserModel = Depends(get_current_db_user)
 ):
     """Get current user profile"""
     return current_user
@@ -40,7 +48,7 @@ async def read_current_user(
 @router.put("/me", response_model=UserSchema)
 async def update_current_user(
     user_in: UserUpdate,
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: UserModel = Depends(get_current_db_user),
     db: Session = Depends(get_db)
 ):
     """Update current user profile"""
@@ -73,17 +81,18 @@ async def update_current_user(
     user_data = user_in.dict(exclude_unset=True)
     for field, value in user_data.items():
         if field == "password":
-            setattr(current_user, "hashed_password", get_password_hash(value))
+            current_user.password_hash = await password_hasher.hash(value)
         else:
             setattr(current_user, field, value)
 
     db.commit()
+    await invalidate_principal(current_user.id)
     db.refresh(current_user)
     return current_user
 
 @router.delete("/me", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_current_user(
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: UserModel = Depends(get_current_db_user),
     db: Session = Depends(get_db)
 ):
     """Delete current user account"""
@@ -95,6 +104,7 @@ async def delete_current_user(
     
     # Hard delete messages sent by user
     db.query(MessageModel).filter(MessageModel.user_id == current_user.id).delete()
+    drop_user_messages(db, current_user.id)
     
     # 1. Delete ALL rooms owned by the user (Group chats and DMs created by user)
     # First, get all room IDs owned by the user
@@ -104,6 +114,9 @@ async def delete_current_user(
     if user_owned_room_ids:
         # Delete all messages in these rooms (to avoid foreign key constraint failure)
         db.query(MessageModel).filter(MessageModel.room_id.in_(user_owned_room_ids)).delete(synchronize_session=False)
+        db.query(MessageArchiveSegmentModel).filter(
+            MessageArchiveSegmentModel.room_id.in_(user_owned_room_ids)
+        ).delete(synchronize_session=False)
         # Delete all members in these rooms
         db.query(RoomMemberModel).filter(RoomMemberModel.room_id.in_(user_owned_room_ids)).delete(synchronize_session=False)
         # Now delete the rooms
@@ -137,12 +150,15 @@ async def delete_current_user(
     current_user.avatar_url = None
     
     db.commit()
+    await invalidate_principal(current_user.id)
+    # Whole rooms and the user's messages elsewhere went with the account
+    await room_history.invalidate()
     return None
 
 @router.get("/{user_id}", response_model=UserSchema)
 async def read_user_by_id(
     user_id: str,
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Get user by ID"""
@@ -159,7 +175,7 @@ async def read_user_by_id(
 @router.post("/upload-avatar", response_model=UserSchema)
 async def upload_avatar(
     file: UploadFile = File(...),
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: UserModel = Depends(get_current_db_user),
     db: Session = Depends(get_db)
 ):
     """Upload user avatar"""
@@ -189,6 +205,7 @@ async def upload_avatar(
     avatar_url = f"/uploads/{unique_filename}"
     current_user.avatar_url = avatar_url
     db.commit()
+    await invalidate_principal(current_user.id)
     db.refresh(current_user)
     
     return current_user
@@ -198,7 +215,7 @@ async def read_users(
     search: str,
     skip: int = 0,
     limit: int = 100,
-    current_user: UserModel = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ):
     """Get list of users by email or phone number"""
@@ -216,7 +233,7 @@ async def read_users(
 async def update_user_role(
     user_id: str,
     role: str, # Role is now a string
-    current_user: UserModel = Depends(is_admin),  # Only admins can change roles
+    current_user: Principal = Depends(is_admin),  # Only admins can change roles
     db: Session = Depends(get_db)
 ):
     """Update user role (admin only)"""
@@ -230,6 +247,7 @@ async def update_user_role(
     
     user.role = role
     db.commit()
+    await invalidate_principal(user.id)
     db.refresh(user)
     
     return user
\ No newline at end of file
@@ -1,44 +1,194 @@
-
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, status, Depends
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, status
 from sqlalchemy.orm import Session
 from typing import Optional
-from jose import jwt, JWTError
 from datetime import datetime
 import json
-import asyncio
 
-from app.core.moderation import profanity_filter, rate_limiter
+from app.core.moderation import profanity_filter, rate_limiter, spam_guard
 from app.schemas.message import MessageType
-from app.models.sql import User as UserModel, Room as RoomModel, RoomMember as RoomMemberModel, Message as MessageModel, SystemSetting
+from app.models.sql import Room as RoomModel, RoomMember as RoomMemberModel, Message as MessageModel, generate_uuid
 from app.config import settings
-from app.database.sql import get_db
-from app.schemas.token import TokenPayload
+from app.database.sql import run_db, stored_utcnow
+from app.core.security import Principal, decode_access_token, load_principal
 from app.core.websocket_manager import manager
+from app.core.system_settings import system_settings
+from app.core.message_writer import message_writer
+from app.core.presence import presence
+from app.core.sanctions import sanctions
+from app.core.room_history import room_history
+from app.core.read_receipts import mark_read, read_receipts
 
 router = APIRouter()
 
 # Authenticate WebSocket connection
-def get_token_user(token: str, db: Session) -> Optional[UserModel]:
+def get_token_user(db: Session, token: str) -> Optional[Principal]:
     """Authenticate WebSocket connection using token"""
     
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        token_data = TokenPayload(**payload)
-        if datetime.fromtimestamp(token_data.exp) < datetime.now():
-            return None
+        token_data = decode_access_token(token)
     except:
         return None
     
-    user = db.query(UserModel).filter(UserModel.id == token_data.sub).first()
+    user = load_principal(db, token_data.sub)
     
     if not user or not user.is_active:
         return None
     
     # Update last seen
-    user.last_seen = datetime.utcnow()
+    presence.touch(user.id)
+
+    return user
+
+def can_access_room(db: Session, room_id: str, user_id: str) -> bool:
+    """Check the room exists and, if private, that the user is a member"""
+    room = db.query(RoomModel).filter(RoomModel.id == room_id).first()
+    if not room:
+        return False
+
+    if room.is_private:
+        member = db.query(RoomMemberModel).filter(
+            RoomMemberModel.room_id == room_id,
+            RoomMemberModel.user_id == user_id
+        ).first()
+        if not member:
+            return False
+
+    return True
+
+async def send_pause_notice(websocket: WebSocket):
+    """Let a newly connected client know if communications are already paused"""
+    if system_settings.is_true("communications_paused"):
+        await manager.send_to_connection(websocket, {
+            "type": "communications_paused",
+            "message": "Communications are temporarily paused by an administrator."
+        })
+
+def save_message(db: Session, message: MessageModel):
+    db.add(message)
     db.commit()
     
-    return user
+async def handle_room_frame(websocket: WebSocket, room_id: str, user: Principal, message_data: dict):
+    """Handle a typing update, read position or chat message sent by a client for one room"""
+    # Reading is allowed even while communications are paused or the user is muted
+    if message_data["type"] == "read":
+        position = await run_db(mark_read, room_id, str(user.id), message_data.get("message_id"))
+        if position:
+            read_receipts.touch(room_id, user.id, position)
+        return
+
+    # Clients were told when communications paused; only chat messages get an error back
+    if system_settings.is_true("communications_paused"):
+        if message_data["type"] == "message":
+            await manager.send_to_connection(websocket, {
+                "type": "error",
+                "message": "Communications are temporarily paused by an administrator."
+            })
+        return
+
+    # Banned and muted users can neither post nor show as typing
+    restriction = sanctions.check(user.id, room_id)
+    if restriction:
+        if message_data["type"] == "message":
+            await manager.send_to_connection(websocket, {
+                "type": "error",
+                "message": restriction
+            })
+        return
+
+    # Typing status update
+    if message_data["type"] == "typing":
+        is_typing = message_data.get("is_typing", False)
+        await manager.set_typing_status(room_id, str(user.id), is_typing)
+
+    # New message
+    elif message_data["type"] == "message":
+        if not await rate_limiter.check_rate_limit(str(user.id), settings.RATE_LIMIT_MESSAGES_PER_MINUTE):
+            await manager.send_to_connection(websocket, {
+                "type": "error",
+                "message": f"Rate limit exceeded. Maximum {settings.RATE_LIMIT_MESSAGES_PER_MINUTE} messages per minute."
+            })
+            return
+        if not await rate_limiter.check("room", room_id):
+            await manager.send_to_connection(websocket, {
+                "type": "error",
+                "message": "This room is receiving too many messages. Please slow down."
+            })
+            return
+
+        content = message_data.get("content", "")
+
+        is_encrypted = message_data.get("is_encrypted", False)
+        incoming_type = message_data.get("message_type", "text")
+
+        if is_encrypted:
+            message_type = MessageType.ENCRYPTED
+        elif incoming_type in ["image", "file", "video", "audio"]:
+            message_type = incoming_type
+        else:
+            message_type = MessageType.TEXT
+
+        if not is_encrypted and message_type == MessageType.TEXT:
+            if len(content) > settings.MAX_MESSAGE_LENGTH:
+                await manager.send_to_connection(websocket, {
+                    "type": "error",
+                    "message": f"Message too long. Maximum {settings.MAX_MESSAGE_LENGTH} characters allowed."
+                })
+                return
+
+            spam_reason = spam_guard.check(user.id, content)
+            if spam_reason:
+                await manager.send_to_connection(websocket, {
+                    "type": "error",
+                    "message": spam_reason
+                })
+                return
+
+            content = profanity_filter.censor_text(content)
+
+        # Id and timestamp are assigned here so nothing has to be read back after the commit
+        message_id = generate_uuid()
+        created_at = stored_utcnow()
+        row = {
+            "id": message_id,
+            "content": content,
+            "user_id": user.id,
+            "room_id": room_id,
+            "message_type": message_type,
+            "is_encrypted": is_encrypted,
+            "created_at": created_at,
+        }
+        if message_writer.enabled:
+            # Broadcast now; the row is group-committed and the sender acked after the flush
+            message_writer.submit(row, websocket)
+        else:
+            await run_db(save_message, MessageModel(**row))
+            await room_history.added(row)
+
+        msg_data = {
+            "type": "message",
+            "message_id": message_id,
+            "content": content,
+            "user_id": str(user.id),
+            "sender_name": user.username,
+            "user": {
+                "id": str(user.id),
+                "username": user.username,
+                "avatar_url": user.avatar_url
+            },
+            "message_type": message_type,
+            "created_at": created_at.isoformat(),
+            "is_encrypted": is_encrypted
+        }
+
+        await manager.broadcast_to_room(
+            room_id=room_id,
+            message=msg_data
+        )
+
+def record_session_time(user: Principal, session_start_time: datetime):
+    """Add the length of a finished socket session to the user's active time"""
+    session_duration = (datetime.utcnow() - session_start_time).total_seconds()
+    presence.add_active_time(user.id, int(session_duration))
 
 @router.websocket("/ws/{room_id}")
 async def websocket_endpoint(
@@ -47,157 +197,144 @@ async def websocket_endpoint(
     token: str = Query(...),
 ):
     """WebSocket endpoint for real-time chat in a room"""
-    # Get a database session
-    db_gen = get_db()
-    db = next(db_gen)
+    # Database sessions are borrowed per operation via run_db, never held for the socket's lifetime
+    # Authenticate user
+    user = await run_db(get_token_user, token)
+    if not user:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    # Check bans, room exists and private room membership
+    if sanctions.is_banned(user.id, room_id) or not await run_db(can_access_room, room_id, str(user.id)):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    # Accept connection
+    await manager.connect(websocket, room_id, str(user.id))
+    await send_pause_notice(websocket)
+
+    # Track session start time
+    session_start_time = datetime.utcnow()
     
     try:
-        # Authenticate user
-        user = get_token_user(token, db)
-        if not user:
-            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
-            return
+        while True:
+            # Receive message from WebSocket
+            data = await websocket.receive_text()
         
-        # Check room exists
-        room = db.query(RoomModel).filter(RoomModel.id == room_id).first()
-        if not room:
-            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
-            return
+            try:
+                message_data = json.loads(data)
         
-        # Check if user is a member of the room (required for private rooms)
-        if room.is_private:
-            member = db.query(RoomMemberModel).filter(
-                RoomMemberModel.room_id == room_id,
-                RoomMemberModel.user_id == user.id
-            ).first()
-            if not member:
-                await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
-                return
+                # Handle different types of WebSocket messages
+                if "type" in message_data:
+                    await handle_room_frame(websocket, room_id, user, message_data)
+            except json.JSONDecodeError:
+                await manager.send_to_connection(websocket, {
+                    "type": "error",
+                    "message": "Invalid message format"
+                })
+            except Exception as e:
+                await manager.send_to_connection(websocket, {
+                    "type": "error",
+                    "message": str(e)
+                })
         
-        # Accept connection
-        await manager.connect(websocket, room_id, str(user.id))
+    except WebSocketDisconnect:
+        record_session_time(user, session_start_time)
         
-        # Track session start time
-        session_start_time = datetime.utcnow()
+        manager.disconnect(websocket, room_id, str(user.id))
+        await manager.broadcast_to_room(
+            room_id=room_id,
+            message={"type": "user_left", "user_id": str(user.id)}
+        )
         
+@router.websocket("/ws")
+async def multiplexed_websocket_endpoint(
+    websocket: WebSocket,
+    token: str = Query(...),
+):
+    """Single WebSocket carrying all of a user's rooms.
+
+    Clients send {"type": "subscribe" | "unsubscribe", "room_id": ...} to
+    choose rooms; chat and typing frames carry the room_id they target,
+    and every frame sent by the server is tagged with its room_id.
+    """
+    # Authenticate user
+    user = await run_db(get_token_user, token)
+    if not user or sanctions.is_banned(user.id):
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    user_id = str(user.id)
+    await manager.connect_multiplexed(websocket, user_id)
+    await send_pause_notice(websocket)
+    connection = manager.connections.get(websocket)
+    if connection is None:
+        # Evicted before it read a frame
         try:
-            while True:
-                # Check if communications are paused
-                comms_setting = db.query(SystemSetting).filter(SystemSetting.name == "communications_paused").first()
-                if comms_setting and comms_setting.value == "true":
-                    await websocket.send_json({
-                        "type": "error",
-                        "message": "Communications are temporarily paused by an administrator."
-                    })
-                    data = await websocket.receive_text()
+            await websocket.close(code=status.WS_1013_TRY_AGAIN_LATER)
+        except RuntimeError:
+            pass  # Already closed by the eviction
+        return
+
+    # Track session start time
+    session_start_time = datetime.utcnow()
+
+    try:
+        while True:
+            data = await websocket.receive_text()
+
+            try:
+                message_data = json.loads(data)
+                frame_type = message_data.get("type")
+                room_id = message_data.get("room_id")
+                if not frame_type or not room_id:
                     continue
 
-                # Receive message from WebSocket
-                data = await websocket.receive_text()
+                if frame_type == "subscribe":
+                    if sanctions.is_banned(user_id, room_id) or not await run_db(can_access_room, room_id, user_id):
+                        await manager.send_to_connection(websocket, {
+                            "type": "error",
+                            "room_id": room_id,
+                            "message": "Room not found or access denied"
+                        })
+                        continue
+                    await manager.subscribe(websocket, room_id, user_id)
+                    await manager.send_to_connection(websocket, {"type": "subscribed", "room_id": room_id})
                 
-                try:
-                    message_data = json.loads(data)
+                elif frame_type == "unsubscribe":
+                    if room_id in connection.rooms:
+                        manager.unsubscribe(websocket, room_id, user_id)
+                        await manager.broadcast_to_room(
+                            room_id=room_id,
+                            message={"type": "user_left", "user_id": user_id}
+                        )
+                    await manager.send_to_connection(websocket, {"type": "unsubscribed", "room_id": room_id})
                     
-                    # Handle different types of WebSocket messages
-                    if "type" in message_data:
-                        # Typing status update
-                        if message_data["type"] == "typing":
-                            is_typing = message_data.get("is_typing", False)
-                            await manager.set_typing_status(room_id, str(user.id), is_typing)
-                        
-                        # New message
-                        elif message_data["type"] == "message":
-                            if not rate_limiter.check_rate_limit(str(user.id), settings.RATE_LIMIT_MESSAGES_PER_MINUTE):
-                                await websocket.send_json({
-                                    "type": "error",
-                                    "message": f"Rate limit exceeded. Maximum {settings.RATE_LIMIT_MESSAGES_PER_MINUTE} messages per minute."
-                                })
-                                continue
-                            
-                            content = message_data.get("content", "")
-                            
-                            is_encrypted = message_data.get("is_encrypted", False)
-                            incoming_type = message_data.get("message_type", "text")
-                            
-                            if is_encrypted:
-                                message_type = MessageType.ENCRYPTED
-                            elif incoming_type in ["image", "file", "video", "audio"]:
-                                message_type = incoming_type
-                            else:
-                                message_type = MessageType.TEXT
-                            
-                            if not is_encrypted and message_type == MessageType.TEXT:
-                                if len(content) > settings.MAX_MESSAGE_LENGTH:
-                                    await websocket.send_json({
-                                        "type": "error",
-                                        "message": f"Message too long. Maximum {settings.MAX_MESSAGE_LENGTH} characters allowed."
-                                    })
-                                    continue
-                                
-                                if profanity_filter.contains_profanity(content):
-                                    content = profanity_filter.censor_text(content)
-                            
-                            message = MessageModel(
-                                content=content,
-                                user_id=user.id,
-                                room_id=room_id,
-                                message_type=message_type,
-                                is_encrypted=is_encrypted,
-                            )
-                            db.add(message)
-                            db.commit()
-                            db.refresh(message)
-                            
-                            msg_data = {
-                                "type": "message",
-                                "message_id": str(message.id),
-                                "content": content,
-                                "user_id": str(user.id),
-                                "sender_name": user.username,
-                                "user": {
-                                    "id": str(user.id),
-                                    "username": user.username,
-                                    "avatar_url": user.avatar_url
-                                },
-                                "message_type": message_type,
-                                "created_at": message.created_at.isoformat(),
-                                "is_encrypted": is_encrypted
-                            }
-                                
-                            await manager.broadcast_to_room(
-                                room_id=room_id,
-                                message=msg_data
-                            )
-                except json.JSONDecodeError:
-                    await websocket.send_json({
-                        "type": "error",
-                        "message": "Invalid message format"
-                    })
-                except Exception as e:
-                    await websocket.send_json({
+                elif room_id not in connection.rooms:
+                    await manager.send_to_connection(websocket, {
                         "type": "error",
-                        "message": str(e)
+                        "room_id": room_id,
+                        "message": "Not subscribed to this room"
                     })
         
-        except WebSocketDisconnect:
-            # Calculate session duration
-            session_duration = (datetime.utcnow() - session_start_time).total_seconds()
-            
-            # Update user's total active time
-            try:
-                # Re-fetch user to ensure attached to session
-                db_user = db.query(UserModel).filter(UserModel.id == user.id).first()
-                if db_user:
-                    db_user.total_active_time = (db_user.total_active_time or 0) + int(session_duration)
-                    db_user.last_seen = datetime.utcnow()
-                    db.commit()
+                else:
+                    await handle_room_frame(websocket, room_id, user, message_data)
+            except json.JSONDecodeError:
+                await manager.send_to_connection(websocket, {
+                    "type": "error",
+                    "message": "Invalid message format"
+                })
             except Exception as e:
-                print(f"Error updating session time: {e}")
+                await manager.send_to_connection(websocket, {
+                    "type": "error",
+                    "message": str(e)
+                })
+            
+    except WebSocketDisconnect:
+        record_session_time(user, session_start_time)
 
-            manager.disconnect(websocket, room_id, str(user.id))
+        for room_id in manager.disconnect_all(websocket):
             await manager.broadcast_to_room(
                 room_id=room_id,
-                message={"type": "user_left", "user_id": str(user.id)}
+                message={"type": "user_left", "user_id": user_id}
             )
-    finally:
-        db.close()
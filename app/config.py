@@ -20,10 +20,83 @@ class Settings(BaseSettings):
     REDIS_HOST: str = os.getenv("REDIS_HOST", "localhost")
     REDIS_PORT: int = int(os.getenv("REDIS_PORT", "6379"))
     REDIS_PASSWORD: Optional[str] = os.getenv("REDIS_PASSWORD")
+
+    # Cross-worker pub/sub for WebSocket broadcasts: "memory", "redis" or "postgres"
+    BACKPLANE: str = os.getenv("BACKPLANE", "memory")
+
+    # How often buffered last_seen / active time updates are written to users
+    PRESENCE_FLUSH_SECONDS: float = 5.0
+
+    # How often each worker re-checks system_settings for writes it missed
+    SYSTEM_SETTINGS_REFRESH_SECONDS: float = 5.0
+
+    # Authenticated principals and decoded tokens cached per worker
+    AUTH_CACHE_TTL_SECONDS: float = 60.0
+    AUTH_CACHE_MAX_ENTRIES: int = 10000
+
+    # bcrypt runs on its own pool; requests beyond MAX_PENDING get a 503
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 64
     
     # Moderation
     RATE_LIMIT_MESSAGES_PER_MINUTE: int = 60
+    RATE_LIMIT_ROOM_MESSAGES_PER_MINUTE: int = 600  # Across all senders in one room
+    RATE_LIMIT_LOGIN_ATTEMPTS_PER_MINUTE: int = 20  # Per client IP
+    RATE_LIMIT_SWEEP_SECONDS: float = 60.0
+    RATE_LIMIT_SWEEP_BATCH: int = 10000  # Keys checked per event-loop turn while sweeping
+    # "memory" (per worker) or "redis" (shared across workers)
+    RATE_LIMIT_BACKEND: str = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    RATE_LIMIT_LEASE_SECONDS: float = 1.0  # How long events leased from Redis stay usable locally
+    RATE_LIMIT_LEASE_MAX: int = 8
     MAX_MESSAGE_LENGTH: int = 2000
+    PROFANITY_WORDS_FILE: Optional[str] = os.getenv("PROFANITY_WORDS_FILE")  # One banned word per line
+    SANCTIONS_REFRESH_SECONDS: float = 60.0  # Full reload of bans and mutes, catching writes made outside the app
+
+    # Repeated / near-identical message detection
+    SPAM_WINDOW_SECONDS: float = 60.0
+    SPAM_USER_MAX_REPEATS: int = 3  # Similar messages one user may send per window
+    SPAM_GLOBAL_MAX_REPEATS: int = 20  # Similar messages all users together may send per window
+    SPAM_MIN_LENGTH: int = 10  # Shorter messages ("ok", "lol") are never treated as spam
+    SPAM_MAX_ENTRIES: int = 100000
+
+    # WebSocket fan-out
+    WS_SEND_QUEUE_SIZE: int = 256  # Outbound frames buffered per socket before eviction
+    WS_SEND_TIMEOUT_SECONDS: float = 5.0
+
+    # Newest messages of recently read rooms, kept per worker for first-page history reads
+    ROOM_HISTORY_CACHE_ENABLED: bool = os.getenv("ROOM_HISTORY_CACHE_ENABLED", "true").lower() == "true"
+    ROOM_HISTORY_CACHE_MESSAGES: int = 200  # Ring size per room; larger page requests go to the database
+    ROOM_HISTORY_CACHE_MAX_BYTES: int = 64 * 1024 * 1024  # Serialized size across all rooms before LRU eviction
+
+    # Scheduled messages: only those due within the next window are held in memory
+    SCHEDULED_WINDOW_SECONDS: float = 60.0
+    SCHEDULED_WINDOW_MAX_ROWS: int = 10000  # A fuller window is cut short and reloaded sooner
+    SCHEDULED_BATCH_SIZE: int = 500  # Due messages delivered per transaction
+    SCHEDULED_MAX_DAYS_AHEAD: int = 365
+
+    # Reaction count updates are sent at most once per message per interval
+    REACTION_BROADCAST_MS: int = 100
+
+    # Read positions are broadcast at most once per room per interval
+    READ_RECEIPT_BROADCAST_MS: int = 500
+
+    # Room exports read and write this many messages at a time
+    EXPORT_BATCH_SIZE: int = 1000
+
+    # Messages older than ARCHIVE_AFTER_DAYS (or a room's own setting) move to compressed archive segments
+    ARCHIVE_ENABLED: bool = os.getenv("ARCHIVE_ENABLED", "false").lower() == "true"
+    ARCHIVE_AFTER_DAYS: int = 180
+    ARCHIVE_BATCH_SIZE: int = 500  # Messages per segment, and per archiving transaction
+    ARCHIVE_INTERVAL_SECONDS: float = 300.0
+    ARCHIVE_BATCH_PAUSE_MS: int = 50  # Gap between batches, so archiving never hogs the database
+
+    # Report the SQL statements each request ran in an X-SQL-Queries response header
+    SQL_QUERY_COUNT_HEADER: bool = os.getenv("SQL_QUERY_COUNT_HEADER", "false").lower() == "true"
+
+    # Write-behind persistence for WebSocket messages (falls back to a commit per message when off)
+    WRITE_BEHIND_ENABLED: bool = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() == "true"
+    WRITE_BEHIND_FLUSH_MS: int = 5
+    WRITE_BEHIND_BATCH_SIZE: int = 200
     
     # File uploads
     UPLOAD_DIR: str = "./uploads"
@@ -0,0 +1,309 @@
+import json
+import time
+import zlib
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from sqlalchemy import desc
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database.sql import run_db
+from app.models.sql import (
+    Message, Room, HiddenMessage, MessageReaction, MessageReactionCount, MessageArchiveSegment as Segment
+)
+from app.core.room_history import room_history, serialize_message
+
+logger = logging.getLogger(__name__)
+
+# (created_at, message_id): the order room history is read in
+Key = Tuple[datetime, str]
+
+
+def _pack(records: List[dict]) -> bytes:
+    return zlib.compress(json.dumps(records, separators=(",", ":"), ensure_ascii=False).encode("utf-8"), 6)
+
+
+def _unpack(data: bytes) -> List[dict]:
+    return json.loads(zlib.decompress(data))
+
+
+def _key(record: dict) -> Key:
+    return (datetime.fromisoformat(record["created_at"]), record["id"])
+
+
+def archive_batch(db: Session, room_id: str) -> int:
+    """
+    Move up to ARCHIVE_BATCH_SIZE of a room's oldest messages past its
+    archive age into one segment, in a single short transaction. Returns
+    the number moved; 0 when nothing is due or another worker holds the room.
+
+    Reactions and per-user hides travel with their messages, so archived
+    history reads back the same. Rooms are archived strictly oldest first,
+    which keeps every archived message older than every hot one.
+    """
+    # Row lock on the room serialises archiving per room across workers
+    room = db.query(Room).filter(Room.id == room_id).with_for_update(skip_locked=True).first()
+    if room is None:
+        db.rollback()
+        return 0
+    days = settings.ARCHIVE_AFTER_DAYS if room.archive_after_days is None else room.archive_after_days
+    if days <= 0:
+        db.rollback()
+        return 0
+
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    rows = db.query(
+        Message.id, Message.user_id, Message.content, Message.message_type,
+        Message.is_encrypted, Message.created_at, Message.edited_at
+    ).filter(
+        Message.room_id == room_id,
+        Message.created_at < cutoff
+    ).order_by(Message.created_at, Message.id).limit(settings.ARCHIVE_BATCH_SIZE).with_for_update().all()
+    if not rows:
+        db.rollback()
+        return 0
+
+    message_ids = [row.id for row in rows]
+    hidden_by: Dict[str, List[str]] = {}
+    for message_id, user_id in db.query(HiddenMessage.message_id, HiddenMessage.user_id).filter(
+        HiddenMessage.message_id.in_(message_ids)
+    ):
+        hidden_by.setdefault(message_id, []).append(user_id)
+    reactions: Dict[str, Dict[str, List[str]]] = {}
+    for message_id, emoji, user_id in db.query(
+        MessageReaction.message_id, MessageReaction.emoji, MessageReaction.user_id
+    ).filter(MessageReaction.message_id.in_(message_ids)).order_by(MessageReaction.created_at):
+        reactions.setdefault(message_id, {}).setdefault(emoji, []).append(user_id)
+
+    records = []
+    for row in rows:
+        record = {
+            "id": row.id,
+            "user_id": row.user_id,
+            "content": row.content,
+            "message_type": row.message_type,
+            "is_encrypted": row.is_encrypted,
+            "created_at": row.created_at.isoformat(),
+            "edited_at": row.edited_at.isoformat() if row.edited_at else None,
+        }
+        if row.id in hidden_by:
+            record["hidden_by"] = hidden_by[row.id]
+        if row.id in reactions:
+            record["reactions"] = reactions[row.id]
+        records.append(record)
+
+    first, last = rows[0], rows[-1]
+    db.add(Segment(
+        room_id=room_id,
+        first_created_at=first.created_at,
+        first_message_id=first.id,
+        last_created_at=last.created_at,
+        last_message_id=last.id,
+        message_count=len(records),
+        user_ids=" ".join(sorted({row.user_id for row in rows if row.user_id})),
+        codec="zlib",
+        data=_pack(records)
+    ))
+    for model in (MessageReactionCount, MessageReaction, HiddenMessage):
+        db.query(model).filter(model.message_id.in_(message_ids)).delete(synchronize_session=False)
+    db.query(Message).filter(Message.id.in_(message_ids)).delete(synchronize_session=False)
+    room.archived_until = last.created_at
+    room.archived_until_id = last.id
+    db.commit()
+    return len(rows)
+
+
+def _segments(
+    db: Session,
+    room_id: str,
+    newest_first: bool,
+    before: Optional[datetime] = None,
+    after: Optional[datetime] = None
+) -> List[str]:
+    """Ids of a room's segments that may hold messages created in [after, before]"""
+    query = db.query(Segment.id).filter(Segment.room_id == room_id)
+    if before is not None:
+        query = query.filter(Segment.first_created_at <= before)
+    if after is not None:
+        query = query.filter(Segment.last_created_at >= after)
+    if newest_first:
+        query = query.order_by(desc(Segment.last_created_at), desc(Segment.last_message_id))
+    else:
+        query = query.order_by(Segment.last_created_at, Segment.last_message_id)
+    return [segment_id for (segment_id,) in query]
+
+
+def _load(db: Session, segment_id: str) -> List[dict]:
+    # Blobs are read one segment at a time, only as far as the page needs
+    data = db.query(Segment.data).filter(Segment.id == segment_id).scalar()
+    return _unpack(data) if data else []
+
+
+def read_archive(
+    db: Session,
+    room_id: str,
+    user_id: str,
+    limit: int,
+    before: Optional[Key] = None,
+    after: Optional[Key] = None,
+    cleared_at: Optional[datetime] = None,
+    before_timestamp: Optional[datetime] = None,
+    after_timestamp: Optional[datetime] = None,
+    skip: int = 0
+) -> List[Tuple[Key, dict]]:
+    """
+    A page of archived messages the user can see, as (key, serialized
+    message) pairs: newest first, or oldest first when walking forward
+    from `after`. Messages carry their reactions like attach_reactions does.
+    """
+    newest_first = after is None
+    # Time bounds narrow the segments read; the exact checks are per message below
+    upper = [value for value in (before[0] if before else None, before_timestamp) if value is not None]
+    lower = [value for value in (after[0] if after else None, after_timestamp, cleared_at) if value is not None]
+
+    page: List[Tuple[Key, dict]] = []
+    for segment_id in _segments(
+        db, room_id, newest_first,
+        before=min(upper) if upper else None,
+        after=max(lower) if lower else None
+    ):
+        records = _load(db, segment_id)
+        for record in (reversed(records) if newest_first else records):
+            key = _key(record)
+            if before is not None and key >= before:
+                continue
+            if after is not None and key <= after:
+                continue
+            if before_timestamp is not None and key[0] >= before_timestamp:
+                continue
+            if after_timestamp is not None and key[0] <= after_timestamp:
+                continue
+            if cleared_at is not None and key[0] <= cleared_at:
+                continue
+            if user_id in record.get("hidden_by", ()):
+                continue
+            if skip:
+                skip -= 1
+                continue
+
+            reactions = record.get("reactions", {})
+            by_emoji = {emoji: len(users) for emoji, users in reactions.items()}
+            page.append((key, {
+                **serialize_message({**record, "room_id": room_id}),
+                "reaction_count": sum(by_emoji.values()),
+                "reactions_by_emoji": by_emoji,
+                "my_reactions": [emoji for emoji, users in reactions.items() if user_id in users],
+            }))
+            if len(page) == limit:
+                return page
+    return page
+
+
+def iter_archive(db: Session, room_id: str, after: Optional[Key] = None) -> Iterator[dict]:
+    """Every archived message of a room after `after`, oldest first, as stored"""
+    for segment_id in _segments(db, room_id, newest_first=False, after=after[0] if after else None):
+        for record in _load(db, segment_id):
+            if after is None or _key(record) > after:
+                yield record
+
+
+def drop_user_messages(db: Session, user_id: str) -> int:
+    """Remove a user's messages from every segment holding any; the caller commits"""
+    removed = 0
+    for segment in db.query(Segment).filter(Segment.user_ids.contains(user_id)):
+        records = _unpack(segment.data)
+        kept = [record for record in records if record["user_id"] != user_id]
+        if len(kept) == len(records):
+            continue
+        removed += len(records) - len(kept)
+        if not kept:
+            db.delete(segment)
+            continue
+        segment.first_created_at, segment.first_message_id = _key(kept[0])
+        segment.last_created_at, segment.last_message_id = _key(kept[-1])
+        segment.message_count = len(kept)
+        segment.user_ids = " ".join(sorted({record["user_id"] for record in kept if record["user_id"]}))
+        segment.data = _pack(kept)
+    return removed
+
+
+class MessageArchiver:
+    """Moves old room history out of the messages table.
+
+    Every ARCHIVE_INTERVAL_SECONDS each room's messages older than its
+    archive age (Room.archive_after_days, else ARCHIVE_AFTER_DAYS) are
+    packed into compressed segments of ARCHIVE_BATCH_SIZE, one short
+    transaction per segment with a pause between them. The messages
+    table, and every index on it, then only holds recent history;
+    read_messages falls through to the segments once a page crosses
+    Room.archived_until. Archived messages are read-only.
+    """
+
+    def __init__(self):
+        self.task: Optional[asyncio.Task] = None
+        # Metrics
+        self.passes = 0
+        self.segments = 0
+        self.messages = 0
+        self.last_pass_seconds = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.ARCHIVE_ENABLED
+
+    async def archive_room(self, room_id: str) -> int:
+        moved_total = 0
+        while True:
+            moved = await run_db(archive_batch, room_id)
+            if not moved:
+                break
+            moved_total += moved
+            self.segments += 1
+            self.messages += moved
+            await asyncio.sleep(settings.ARCHIVE_BATCH_PAUSE_MS / 1000)
+        if moved_total:
+            # Cached rings still check hides against the hot table
+            await room_history.invalidate(room_id)
+        return moved_total
+
+    async def run_once(self):
+        started = time.perf_counter()
+        room_ids = await run_db(lambda db: [room_id for (room_id,) in db.query(Room.id)])
+        moved = 0
+        for room_id in room_ids:
+            moved += await self.archive_room(room_id)
+        self.passes += 1
+        self.last_pass_seconds = time.perf_counter() - started
+        if moved:
+            logger.info(f"Archived {moved} messages in {self.last_pass_seconds:.1f}s")
+
+    async def _run(self):
+        while True:
+            try:
+                if self.enabled:
+                    await self.run_once()
+            except Exception as e:
+                logger.error(f"Message archiving failed: {e}")
+            await asyncio.sleep(settings.ARCHIVE_INTERVAL_SECONDS)
+
+    async def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "passes": self.passes,
+            "segments": self.segments,
+            "messages": self.messages,
+            "last_pass_seconds": round(self.last_pass_seconds, 3),
+        }
+
+
+archiver = MessageArchiver()
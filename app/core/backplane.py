@@ -0,0 +1,270 @@
+import asyncio
+import logging
+import uuid
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Called with (channel, data) for every frame received on a subscribed channel
+FrameHandler = Callable[[str, str], None]
+
+
+class Backplane:
+    """Pub/sub transport that carries encoded frames between workers.
+
+    Channels are subscribed per room/user only while this worker holds a
+    socket for them, so a worker receives traffic for its own rooms only.
+    """
+
+    def __init__(self):
+        self.handler: Optional[FrameHandler] = None
+        # Channels this worker wants, and channels the broker has confirmed
+        self.channels: Set[str] = set()
+        self.subscribed: Set[str] = set()
+        self._lock = asyncio.Lock()
+        # Background unsubscribe tasks, referenced until they finish
+        self.tasks: Set[asyncio.Task] = set()
+
+    def set_handler(self, handler: FrameHandler):
+        self.handler = handler
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def publish(self, channel: str, data: str):
+        """Send a frame to every worker subscribed to the channel.
+
+        Callers have usually committed already (a REST message is saved
+        before it is broadcast), so a broker outage is logged here rather
+        than failing the request.
+        """
+        try:
+            await self._publish(channel, data)
+        except Exception as e:
+            logger.error(f"Backplane publish to {channel} failed: {e}")
+
+    async def _publish(self, channel: str, data: str):
+        raise NotImplementedError
+
+    async def subscribe(self, channel: str):
+        """Subscribe and wait until the broker has confirmed it"""
+        self.channels.add(channel)
+        await self._reconcile()
+
+    def unsubscribe(self, channel: str):
+        """Drop a channel; the broker is updated in the background"""
+        self.channels.discard(channel)
+        task = asyncio.create_task(self._reconcile())
+        self.tasks.add(task)
+        task.add_done_callback(self.tasks.discard)
+
+    async def _reconcile(self):
+        # Always apply the latest desired state, so interleaved
+        # subscribe/unsubscribe calls cannot leave a stale subscription behind
+        async with self._lock:
+            added = self.channels - self.subscribed
+            removed = self.subscribed - self.channels
+            try:
+                if added:
+                    await self._subscribe(added)
+                if removed:
+                    await self._unsubscribe(removed)
+            except Exception as e:
+                logger.error(f"Backplane subscription update failed: {e}")
+                return
+            self.subscribed = (self.subscribed | added) - removed
+
+    async def _subscribe(self, channels: Set[str]):
+        pass
+
+    async def _unsubscribe(self, channels: Set[str]):
+        pass
+
+    def _dispatch(self, channel: str, data: str):
+        if self.handler is None or channel not in self.channels:
+            return
+        try:
+            self.handler(channel, data)
+        except Exception as e:
+            logger.error(f"Backplane handler failed on {channel}: {e}")
+
+
+class InMemoryBackplane(Backplane):
+    """Single-process backplane: publishing delivers straight to this worker"""
+
+    async def _publish(self, channel: str, data: str):
+        self._dispatch(channel, data)
+
+
+class RedisBackplane(Backplane):
+    """Redis PUBLISH/SUBSCRIBE backplane on REDIS_HOST/REDIS_PORT"""
+
+    def __init__(self, prefix: str = "echo:"):
+        super().__init__()
+        self.prefix = prefix
+        self.pubsub = None
+        self.reader_task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        from app.database.redis import get_redis
+
+        self.client = get_redis()
+        self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        self.reader_task = asyncio.create_task(self._reader())
+
+    async def stop(self):
+        if self.reader_task:
+            self.reader_task.cancel()
+        if self.pubsub:
+            await self.pubsub.close()
+
+    async def _publish(self, channel: str, data: str):
+        await self.client.publish(self.prefix + channel, data)
+
+    async def _subscribe(self, channels: Set[str]):
+        await self.pubsub.subscribe(*(self.prefix + c for c in channels))
+
+    async def _unsubscribe(self, channels: Set[str]):
+        await self.pubsub.unsubscribe(*(self.prefix + c for c in channels))
+
+    async def _reader(self):
+        while True:
+            if not self.subscribed:
+                await asyncio.sleep(0.1)
+                continue
+            try:
+                message = await self.pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # redis-py reconnects and resubscribes on the next read
+                logger.error(f"Redis backplane read failed: {e}")
+                await asyncio.sleep(1)
+                continue
+            if message and message["type"] == "message":
+                self._dispatch(message["channel"][len(self.prefix):], message["data"])
+
+
+class PostgresBackplane(Backplane):
+    """PostgreSQL LISTEN/NOTIFY backplane on DATABASE_URL.
+
+    NOTIFY payloads are limited to 8000 bytes. Larger frames are split
+    into parts sent by one statement, so they commit together and arrive
+    back to back; each part carries a header the receiver reassembles
+    them by.
+    """
+
+    MAX_PAYLOAD = 7999
+    # Parts start with a character no encoded frame starts with
+    PART_MARK = "\x1e"
+    # Characters per part: at most 4 bytes each in UTF-8, leaving room for the header
+    PART_CHARS = (MAX_PAYLOAD - 64) // 4
+
+    def __init__(self, prefix: str = "echo:"):
+        super().__init__()
+        self.prefix = prefix
+        self.listener = None
+        self.publisher = None
+        self.publish_lock = asyncio.Lock()
+        # (channel, frame id) -> parts received so far
+        self.parts: Dict[Tuple[str, str], List[str]] = {}
+
+    def _connect(self):
+        import psycopg2
+        import psycopg2.extensions
+        from sqlalchemy.engine import make_url
+        from app.database.sql import DATABASE_URL
+
+        dsn = make_url(DATABASE_URL).set(drivername="postgresql").render_as_string(hide_password=False)
+        conn = psycopg2.connect(dsn)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        return conn
+
+    async def start(self):
+        self.listener = await asyncio.to_thread(self._connect)
+        self.publisher = await asyncio.to_thread(self._connect)
+        asyncio.get_running_loop().add_reader(self.listener.fileno(), self._on_readable)
+
+    async def stop(self):
+        if self.listener:
+            asyncio.get_running_loop().remove_reader(self.listener.fileno())
+            self.listener.close()
+        if self.publisher:
+            self.publisher.close()
+
+    def _on_readable(self):
+        try:
+            self.listener.poll()
+        except Exception as e:
+            logger.error(f"Postgres backplane poll failed: {e}")
+            return
+        while self.listener.notifies:
+            notify = self.listener.notifies.pop(0)
+            channel, payload = notify.channel[len(self.prefix):], notify.payload
+            if payload.startswith(self.PART_MARK):
+                payload = self._reassemble(channel, payload)
+                if payload is None:
+                    continue
+            self._dispatch(channel, payload)
+
+    def _split(self, data: str) -> List[str]:
+        """Payloads for a frame: the frame itself, or headed parts if it is too large"""
+        if len(data.encode("utf-8")) <= self.MAX_PAYLOAD:
+            return [data]
+        frame_id = uuid.uuid4().hex
+        chunks = [data[i:i + self.PART_CHARS] for i in range(0, len(data), self.PART_CHARS)]
+        return [f"{self.PART_MARK}{frame_id}:{index}:{len(chunks)}\n{chunk}" for index, chunk in enumerate(chunks)]
+
+    def _reassemble(self, channel: str, payload: str) -> Optional[str]:
+        """Collect one part; returns the whole frame once its last part arrives"""
+        header, chunk = payload[1:].split("\n", 1)
+        frame_id, index, count = header.split(":")
+        key = (channel, frame_id)
+        parts = self.parts.setdefault(key, [])
+        if int(index) != len(parts):
+            # A part went missing (the listener reconnected mid-frame); drop the frame
+            logger.error(f"Postgres backplane lost part of a frame on {channel}")
+            del self.parts[key]
+            return None
+        parts.append(chunk)
+        if len(parts) < int(count):
+            return None
+        del self.parts[key]
+        return "".join(parts)
+
+    def _execute(self, conn, sql: str, params: tuple = ()):
+        with conn.cursor() as cursor:
+            cursor.execute(sql, params)
+
+    def _quote(self, channel: str) -> str:
+        return '"' + (self.prefix + channel).replace('"', '""') + '"'
+
+    async def _publish(self, channel: str, data: str):
+        payloads = self._split(data)
+        sql = "SELECT " + ", ".join(["pg_notify(%s, %s)"] * len(payloads))
+        params = tuple(value for payload in payloads for value in (self.prefix + channel, payload))
+        async with self.publish_lock:
+            await asyncio.to_thread(self._execute, self.publisher, sql, params)
+
+    async def _subscribe(self, channels: Set[str]):
+        sql = "; ".join(f"LISTEN {self._quote(c)}" for c in channels)
+        await asyncio.to_thread(self._execute, self.listener, sql)
+
+    async def _unsubscribe(self, channels: Set[str]):
+        sql = "; ".join(f"UNLISTEN {self._quote(c)}" for c in channels)
+        await asyncio.to_thread(self._execute, self.listener, sql)
+
+
+def create_backplane() -> Backplane:
+    """Build the backplane selected by settings.BACKPLANE"""
+    backend = settings.BACKPLANE.lower()
+    if backend == "redis":
+        return RedisBackplane()
+    if backend in ("postgres", "postgresql"):
+        return PostgresBackplane()
+    return InMemoryBackplane()
@@ -0,0 +1,188 @@
+import json
+import time
+import zlib
+import logging
+from itertools import chain
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import select, or_
+
+from app.config import settings
+from app.database.sql import SessionLocal
+from app.models.sql import Message
+from app.utils.pagination import encode_cursor
+from app.core.archive import iter_archive
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib encoder
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+messages_table = Message.__table__
+
+EXPORT_COLUMNS = (
+    messages_table.c.id,
+    messages_table.c.room_id,
+    messages_table.c.user_id,
+    messages_table.c.content,
+    messages_table.c.message_type,
+    messages_table.c.is_encrypted,
+    messages_table.c.created_at,
+    messages_table.c.edited_at,
+)
+
+COMPRESSIONS = ("none", "gzip", "zstd")
+
+
+def _dumps(record: dict) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(record)
+    return json.dumps(record, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value else None
+
+
+def make_compressor(compression: str):
+    """Return (compress, flush) callables for the requested stream compression"""
+    if compression == "gzip":
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress, compressor.flush
+    if compression == "zstd":
+        # Optional dependency, only needed for zstd exports
+        import zstandard
+
+        compressor = zstandard.ZstdCompressor(level=3).compressobj()
+        return compressor.compress, compressor.flush
+    return (lambda data: data), (lambda: b"")
+
+
+def _archived_batches(
+    db,
+    room_id: str,
+    after: Optional[Tuple[datetime, str]],
+    before: Optional[Tuple[datetime, str]] = None
+) -> Iterator[List[dict]]:
+    batch = []
+    for record in iter_archive(db, room_id, after):
+        if before is not None and (datetime.fromisoformat(record["created_at"]), record["id"]) >= before:
+            break
+        batch.append({
+            "id": record["id"],
+            "room_id": room_id,
+            "user_id": record["user_id"],
+            "content": record["content"],
+            "message_type": record["message_type"],
+            "is_encrypted": record["is_encrypted"],
+            "created_at": record["created_at"],
+            "edited_at": record["edited_at"],
+        })
+        if len(batch) == settings.EXPORT_BATCH_SIZE:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _hot_batches(db, room_id: str, after: Optional[Tuple[datetime, str]]) -> Iterator[List[dict]]:
+    query = select(*EXPORT_COLUMNS).where(messages_table.c.room_id == room_id)
+    if after:
+        created_at, message_id = after
+        query = query.where(
+            messages_table.c.created_at >= created_at,
+            or_(messages_table.c.created_at > created_at, messages_table.c.id > message_id)
+        )
+    query = query.order_by(messages_table.c.created_at, messages_table.c.id)
+
+    result = db.execute(query.execution_options(stream_results=True, yield_per=settings.EXPORT_BATCH_SIZE))
+    for batch in result.partitions():
+        yield [
+            {
+                "id": row.id,
+                "room_id": row.room_id,
+                "user_id": row.user_id,
+                "content": row.content,
+                "message_type": row.message_type,
+                "is_encrypted": row.is_encrypted,
+                "created_at": _iso(row.created_at),
+                "edited_at": _iso(row.edited_at),
+            }
+            for row in batch
+        ]
+
+
+def _write(compress, batch: List[dict]) -> Tuple[str, bytes]:
+    """NDJSON lines for a batch, compressed; returns the last line's cursor with them"""
+    lines = []
+    for record in batch:
+        cursor = encode_cursor(record["created_at"], record["id"])
+        lines.append(_dumps({**record, "cursor": cursor}))
+    lines.append(b"")
+    return cursor, compress(b"\n".join(lines))
+
+
+def stream_room_export(
+    room_id: str,
+    compression: str = "none",
+    after: Optional[Tuple[datetime, str]] = None
+) -> Iterator[bytes]:
+    """
+    Yield a room's messages, oldest first, as NDJSON chunks.
+
+    Archived segments come first (they are all older than the messages
+    table), then the table through a server-side cursor. Either way rows
+    are read and written EXPORT_BATCH_SIZE at a time, so memory stays
+    flat however large the room is. Every line carries the cursor of its
+    message; passing the last one received as `after` resumes an
+    interrupted export. The final line is an {"export": {...}} summary
+    with the row count and throughput.
+
+    Runs in the threadpool (StreamingResponse iterates sync generators
+    there) with its own session, held for the length of the export.
+    """
+    compress, flush = make_compressor(compression)
+    started = time.perf_counter()
+    rows = 0
+    last_cursor = None
+
+    db = SessionLocal()
+    try:
+        last_key = after
+        for batch in _archived_batches(db, room_id, after):
+            last_key = (datetime.fromisoformat(batch[-1]["created_at"]), batch[-1]["id"])
+            rows += len(batch)
+            last_cursor, chunk = _write(compress, batch)
+            if chunk:
+                yield chunk
+
+        # The hot query reads one snapshot. Messages archived after the pass
+        # above but before that snapshot are in neither, and all sort ahead
+        # of its first row, so the archive is read again up to there.
+        hot = _hot_batches(db, room_id, after)
+        first = next(hot, None)
+        first_key = (datetime.fromisoformat(first[0]["created_at"]), first[0]["id"]) if first else None
+        late = _archived_batches(db, room_id, last_key, before=first_key)
+
+        for batch in chain(late, [first] if first else [], hot):
+            rows += len(batch)
+            last_cursor, chunk = _write(compress, batch)
+            if chunk:
+                yield chunk
+    finally:
+        db.close()
+
+    seconds = time.perf_counter() - started
+    rate = round(rows / seconds) if seconds else rows
+    logger.info(f"Exported {rows} messages from room {room_id} in {seconds:.1f}s ({rate} rows/s)")
+    summary = _dumps({"export": {
+        "room_id": room_id,
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_second": rate,
+        "cursor": last_cursor,
+    }})
+    yield compress(summary + b"\n") + flush()
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import time
+from typing import List, Optional, Set, Tuple
+
+from fastapi import WebSocket
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database.sql import run_db
+from app.models.sql import Message as MessageModel
+from app.core.websocket_manager import manager, LatencyStats
+from app.core.room_history import room_history
+
+logger = logging.getLogger(__name__)
+
+
+class MessageWriter:
+    """Write-behind persistence for chat messages sent over WebSockets.
+
+    Messages arrive with their id and created_at already assigned and are
+    broadcast before they are stored. The writer collects them and inserts
+    them in one transaction every WRITE_BEHIND_FLUSH_MS or once
+    WRITE_BEHIND_BATCH_SIZE rows are waiting, then sends the sender a
+    message_persisted (or message_persist_failed) frame. A batch that
+    fails twice is retried a row at a time, so only rows that cannot be
+    stored are reported as failed.
+    """
+
+    def __init__(self):
+        self.pending: List[Tuple[dict, Optional[WebSocket]]] = []
+        self.wakeup = asyncio.Event()
+        self.batch_full = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        self.stopping = False
+        # Metrics
+        self.flush_latency = LatencyStats()
+        self.flushes = 0
+        self.rows_written = 0
+        self.max_batch = 0
+        self.failed_rows = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.WRITE_BEHIND_ENABLED
+
+    def submit(self, row: dict, websocket: Optional[WebSocket] = None):
+        """Queue a message row; websocket (the sender) gets the durability ack"""
+        self.pending.append((row, websocket))
+        self.wakeup.set()
+        if len(self.pending) >= settings.WRITE_BEHIND_BATCH_SIZE:
+            self.batch_full.set()
+
+    def _insert(self, db: Session, rows: List[dict]):
+        db.execute(MessageModel.__table__.insert(), rows)
+        db.commit()
+
+    def _insert_each(self, db: Session, rows: List[dict]) -> Set[str]:
+        """Insert rows one transaction each; returns the ids that could not be stored"""
+        failed = set()
+        for row in rows:
+            try:
+                db.execute(MessageModel.__table__.insert(), [row])
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                # A batch attempt may have committed before its connection dropped
+                if db.query(MessageModel.id).filter(MessageModel.id == row["id"]).first() is None:
+                    logger.error(f"Write-behind insert of message {row['id']} failed: {e}")
+                    failed.add(row["id"])
+        return failed
+
+    async def _write(self, rows: List[dict]) -> Set[str]:
+        """
+        Store a batch in one transaction, retrying once. If it still fails,
+        fall back to a row at a time so one bad row does not take the
+        others down with it. Returns the ids that were not stored.
+        """
+        for attempt in range(2):
+            try:
+                await run_db(self._insert, rows)
+                return set()
+            except Exception as e:
+                logger.warning(f"Write-behind flush of {len(rows)} messages failed (attempt {attempt + 1}): {e}")
+        try:
+            return await run_db(self._insert_each, rows)
+        except Exception as e:
+            logger.error(f"Write-behind row-by-row insert failed: {e}")
+            return {row["id"] for row in rows}
+
+    async def flush(self):
+        """Write everything queued so far, one transaction per batch"""
+        while self.pending:
+            batch = self.pending[:settings.WRITE_BEHIND_BATCH_SIZE]
+            del self.pending[:len(batch)]
+
+            started = time.perf_counter()
+            failed = await self._write([row for row, _ in batch])
+            stored = len(batch) - len(failed)
+            self.failed_rows += len(failed)
+            if stored:
+                self.flush_latency.record(time.perf_counter() - started)
+                self.flushes += 1
+                self.rows_written += stored
+                self.max_batch = max(self.max_batch, stored)
+
+            for row, websocket in batch:
+                if row["id"] not in failed:
+                    # History rings only take messages once they are stored
+                    await room_history.added(row)
+                if websocket is not None:
+                    await manager.send_to_connection(websocket, {
+                        "type": "message_persist_failed" if row["id"] in failed else "message_persisted",
+                        "message_id": row["id"],
+                        "room_id": row["room_id"]
+                    })
+
+    async def _run(self):
+        interval = settings.WRITE_BEHIND_FLUSH_MS / 1000
+        while not self.stopping:
+            await self.wakeup.wait()
+            # Let the batch fill for a few milliseconds unless it is already full
+            try:
+                await asyncio.wait_for(self.batch_full.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wakeup.clear()
+            self.batch_full.clear()
+            await self.flush()
+
+    async def start(self):
+        if self.enabled:
+            self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write out anything still queued"""
+        # Let an in-flight flush finish rather than cancelling it halfway through a batch
+        self.stopping = True
+        self.wakeup.set()
+        self.batch_full.set()
+        if self.task:
+            await self.task
+        await self.flush()
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "pending": len(self.pending),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "failed_rows": self.failed_rows,
+            "avg_batch": round(self.rows_written / self.flushes, 2) if self.flushes else 0,
+            "max_batch": self.max_batch,
+            "flush_latency": self.flush_latency.snapshot(),
+        }
+
+
+message_writer = MessageWriter()
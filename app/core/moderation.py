@@ -1,122 +1,509 @@
-import re
-from datetime import datetime, timedelta
-from typing import List, Optional
+import time
+import heapq
+import string
+import asyncio
+import logging
+import unicodedata
+from collections import deque
+from itertools import islice
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
 
-from fastapi import Depends, HTTPException, status
-from motor.motor_asyncio import AsyncIOMotorClient
-from bson import ObjectId
+from fastapi import HTTPException, status
 
-from app.database.mongodb import get_database
-from app.models.mongodb import UserBan, RoomMember
+from app.config import settings
+from app.core.system_settings import system_settings
+from app.core.sanctions import sanctions
+
+logger = logging.getLogger(__name__)
+
+
+# Banned words used until a word list file or the profanity_words setting provides some
+DEFAULT_BANNED_WORDS = [
+    "badword1",
+    "badword2",
+    "badword3",
+]
+
+PROFANITY_SETTING = "profanity_words"
+
+# Common character substitutions, folded before matching
+LEET_MAP = {"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s"}
+
+
+class _NormalizeTable(dict):
+    """
+    str.translate table mapping every character to exactly one lowercase,
+    accent-stripped, de-leeted character, so positions in the normalized
+    text are positions in the original. Filled in lazily per code point.
+    """
+    def __missing__(self, codepoint: int) -> str:
+        char = chr(codepoint)
+        char = LEET_MAP.get(char, char)
+        char = unicodedata.normalize("NFKD", char)[0].casefold()[:1] or char
+        self[codepoint] = char
+        return char
+
+
+NORMALIZE_TABLE = _NormalizeTable()
+
+
+def normalize_text(text: str) -> str:
+    return text.translate(NORMALIZE_TABLE)
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+class ProfanityMatcher:
+    """
+    Aho-Corasick automaton over normalized banned words. Finds every
+    whole-word occurrence in a single left-to-right scan, however many
+    words are loaded.
+    """
+    def __init__(self, words: List[str]):
+        # Per node: outgoing edges, failure link, and lengths of the words
+        # ending here (longest first, including those reached via failure links)
+        self.goto: List[Dict[str, int]] = [{}]
+        self.fail: List[int] = [0]
+        self.out: List[Tuple[int, ...]] = [()]
+        self.word_count = 0
+
+        for word in words:
+            word = normalize_text(word.strip())
+            if not word:
+                continue
+            node = 0
+            for char in word:
+                child = self.goto[node].get(char)
+                if child is None:
+                    child = len(self.goto)
+                    self.goto[node][char] = child
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append(())
+                node = child
+            if len(word) not in self.out[node]:
+                self.out[node] += (len(word),)
+                self.word_count += 1
+
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and char not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(char, 0)
+                self.out[child] = tuple(sorted(self.out[child] + self.out[self.fail[child]], reverse=True))
+
+    def find_spans(self, normalized: str) -> List[Tuple[int, int]]:
+        """Return (start, end) of each whole-word match, longest per end position"""
+        goto, fail, out = self.goto, self.fail, self.out
+        spans = []
+        last = len(normalized) - 1
+        node = 0
+        for i, char in enumerate(normalized):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if out[node] and (i == last or not _is_word_char(normalized[i + 1])):
+                for length in out[node]:
+                    start = i - length + 1
+                    if start == 0 or not _is_word_char(normalized[start - 1]):
+                        spans.append((start, i + 1))
+                        break
+        return spans
 
 
-# Profanity filter - simple implementation, would use a more robust library in production
 class ProfanityFilter:
+    """
+    Censors banned words in one pass using a ProfanityMatcher.
+
+    Words come from PROFANITY_WORDS_FILE (one per line, # for comments)
+    plus the profanity_words system setting (one per line). A new
+    automaton is built off the event loop whenever the setting changes
+    and swapped in once ready; messages keep using the old one meanwhile.
+    """
     def __init__(self):
-        # Simple list of banned words (would be more extensive and configurable in production)
-        self.banned_words = [
-            "badword1",
-            "badword2",
-            "badword3",
-        ]
-        self.pattern = re.compile(r'\b(' + '|'.join(self.banned_words) + r')\b', re.IGNORECASE)
+        self.matcher = ProfanityMatcher(DEFAULT_BANNED_WORDS)
+        self.generation = 0
+        self.reload_task: Optional[asyncio.Task] = None
+
+    def _load_words(self, setting_value: Optional[str]) -> List[str]:
+        words = []
+        if settings.PROFANITY_WORDS_FILE:
+            try:
+                with open(settings.PROFANITY_WORDS_FILE, encoding="utf-8") as f:
+                    words.extend(line for line in f.read().splitlines() if not line.startswith("#"))
+            except OSError as e:
+                logger.error(f"Could not read profanity word list {settings.PROFANITY_WORDS_FILE}: {e}")
+        if setting_value:
+            words.extend(setting_value.splitlines())
+        words = [word.strip() for word in words if word.strip()]
+        return words or DEFAULT_BANNED_WORDS
+
+    def _build(self, setting_value: Optional[str]) -> ProfanityMatcher:
+        return ProfanityMatcher(self._load_words(setting_value))
+
+    async def reload(self):
+        """Rebuild the automaton in a worker thread and swap it in"""
+        self.generation += 1
+        generation = self.generation
+        matcher = await asyncio.to_thread(self._build, system_settings.get(PROFANITY_SETTING))
+        # A newer reload may have started while this one was building
+        if generation == self.generation:
+            self.matcher = matcher
+            logger.info(f"Profanity filter loaded {matcher.word_count} words")
+
+    def _on_words_changed(self, value: Optional[str]):
+        self.reload_task = asyncio.create_task(self.reload())
+
+    async def start(self):
+        system_settings.watch(PROFANITY_SETTING, self._on_words_changed)
+        await self.reload()
     
     def contains_profanity(self, text: str) -> bool:
-        return bool(self.pattern.search(text))
+        return bool(self.matcher.find_spans(normalize_text(text)))
     
     def censor_text(self, text: str) -> str:
-        return self.pattern.sub(lambda m: '*' * len(m.group()), text)
+        spans = self.matcher.find_spans(normalize_text(text))
+        if not spans:
+            return text
+        chars = list(text)
+        for start, end in spans:
+            chars[start:end] = "*" * (end - start)
+        return "".join(chars)
 
 
 # Rate limiter
+async def _sweep_entries(entries: Dict[str, Any], expires_at: Callable[[Any], float]):
+    """
+    Drop the entries whose expiry has passed, RATE_LIMIT_SWEEP_BATCH keys
+    per event-loop turn. Live entries are moved to the back, so one pass
+    visits each key present when it starts exactly once, however many
+    keys there are, without stalling the loop.
+    """
+    remaining = len(entries)
+    while remaining > 0:
+        now = time.monotonic()
+        keys = list(islice(entries, min(settings.RATE_LIMIT_SWEEP_BATCH, remaining)))
+        for key in keys:
+            value = entries.pop(key)
+            if expires_at(value) > now:
+                entries[key] = value
+        remaining -= len(keys)
+        await asyncio.sleep(0)
+
+
 class RateLimiter:
+    """
+    Token-bucket rate limiter, stored in GCRA form.
+
+    A key's whole state is one float: the monotonic time at which its
+    bucket will be full again. Each allowed event pushes that time forward
+    by period / limit, and an event is refused when doing so would put it
+    more than one period ahead of now. Keys whose time has passed hold a
+    full bucket, so the sweeper can drop them without changing behaviour.
+
+    Limits are configured per scope ("user", "room", "ip") and keys are
+    stored per scope.
+    """
     def __init__(self):
-        # In-memory store for rate limiting
-        # In production, you'd use Redis for this
-        self.message_timestamps = {}
+        # scope -> (events allowed, period in seconds)
+        self.limits: Dict[str, Tuple[int, float]] = {
+            "user": (settings.RATE_LIMIT_MESSAGES_PER_MINUTE, 60.0),
+            "room": (settings.RATE_LIMIT_ROOM_MESSAGES_PER_MINUTE, 60.0),
+            "ip": (settings.RATE_LIMIT_LOGIN_ATTEMPTS_PER_MINUTE, 60.0),
+        }
+        # scope -> key -> time the key's bucket is full again
+        self.buckets: Dict[str, Dict[str, float]] = {}
+        self.sweep_task: Optional[asyncio.Task] = None
+        self.allowed = 0
+        self.limited = 0
     
-    def check_rate_limit(self, user_id: str, messages_per_minute: int) -> bool:
-        current_time = datetime.now()
-        one_minute_ago = current_time - timedelta(minutes=1)
+    def configure(self, scope: str, limit: int, period_seconds: float = 60.0):
+        self.limits[scope] = (limit, period_seconds)
         
-        # Create user entry if it doesn't exist
-        if user_id not in self.message_timestamps:
-            self.message_timestamps[user_id] = []
+    def _take(self, scope: str, key: str, limit: int, period: float) -> bool:
+        if limit <= 0:
+            self.limited += 1
+            return False
+        now = time.monotonic()
+        buckets = self.buckets.get(scope)
+        if buckets is None:
+            buckets = self.buckets[scope] = {}
+        full_at = max(buckets.get(key, now), now) + period / limit
+        # Small tolerance so float rounding never costs the last event of a burst
+        if full_at - now > period + 1e-9:
+            self.limited += 1
+            return False
+        buckets[key] = full_at
+        self.allowed += 1
+        return True
         
-        # Filter out timestamps older than 1 minute
-        self.message_timestamps[user_id] = [
-            ts for ts in self.message_timestamps[user_id] 
-            if ts >= one_minute_ago
-        ]
+    async def _acquire(self, scope: str, key: str, limit: int, period: float) -> bool:
+        return self._take(scope, key, limit, period)
         
-        # Check if user has exceeded the rate limit
-        if len(self.message_timestamps[user_id]) >= messages_per_minute:
+    async def check(self, scope: str, key: str) -> bool:
+        """Consume one event for key under the scope's configured limit"""
+        limit, period = self.limits[scope]
+        return await self._acquire(scope, str(key), limit, period)
+
+    async def check_rate_limit(self, user_id: str, messages_per_minute: int) -> bool:
+        """Per-user message limit, kept for existing callers"""
+        return await self._acquire("user", str(user_id), messages_per_minute, 60.0)
+
+    async def sweep(self):
+        """Drop keys whose bucket has refilled"""
+        for buckets in list(self.buckets.values()):
+            await _sweep_entries(buckets, lambda full_at: full_at)
+
+    async def _sweep_loop(self):
+        while True:
+            await asyncio.sleep(settings.RATE_LIMIT_SWEEP_SECONDS)
+            await self.sweep()
+
+    async def start(self):
+        self.sweep_task = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self):
+        if self.sweep_task:
+            self.sweep_task.cancel()
+
+    def get_stats(self) -> dict:
+        return {
+            "keys": {scope: len(buckets) for scope, buckets in self.buckets.items()},
+            "allowed": self.allowed,
+            "limited": self.limited,
+        }
+
+
+# Same GCRA update as RateLimiter._take, run atomically in Redis on the server
+# clock. Grants up to ARGV[3] events at once and returns how many it granted.
+GCRA_LEASE_SCRIPT = """
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local wanted = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local full_at = tonumber(redis.call('GET', KEYS[1]) or '0')
+if full_at < now then full_at = now end
+local available = math.floor((now + period - full_at) / interval + 1e-9)
+local granted = math.min(wanted, available)
+if granted <= 0 then return 0 end
+full_at = full_at + granted * interval
+redis.call('SET', KEYS[1], string.format('%.6f', full_at), 'PX', math.ceil((full_at - now) * 1000))
+return granted
+"""
+
+
+class RedisRateLimiter(RateLimiter):
+    """
+    Rate limiter whose buckets live in Redis, so limits hold across workers
+    and survive restarts.
+
+    Each check is a single script call. A user who keeps sending leases
+    several events per call (doubling up to RATE_LIMIT_LEASE_MAX) and
+    spends them locally for RATE_LIMIT_LEASE_SECONDS, so hot users skip
+    the network hop; leased events are already taken from the shared
+    bucket, so a lease can only make the limit stricter, never looser.
+    If Redis is unreachable, checks fall back to the in-memory buckets.
+    """
+    def __init__(self, prefix: str = "echo:ratelimit:"):
+        super().__init__()
+        self.prefix = prefix
+        self.script = None
+        # scope -> key -> [events left, lease expiry, lease size]
+        self.leases: Dict[str, Dict[str, list]] = {}
+        self.degraded = False
+        self.redis_calls = 0
+        self.fallback_checks = 0
+
+    async def _lease(self, scope: str, key: str, limit: int, period: float, wanted: int) -> int:
+        if self.script is None:
+            from app.database.redis import get_redis
+
+            self.script = get_redis().register_script(GCRA_LEASE_SCRIPT)
+        self.redis_calls += 1
+        granted = await self.script(
+            keys=[f"{self.prefix}{scope}:{key}"],
+            args=[period / limit, period, wanted]
+        )
+        return int(granted)
+
+    async def _acquire(self, scope: str, key: str, limit: int, period: float) -> bool:
+        if limit <= 0:
+            self.limited += 1
             return False
+        now = time.monotonic()
+        leases = self.leases.get(scope)
+        if leases is None:
+            leases = self.leases[scope] = {}
+        lease = leases.get(key)
+        if lease and lease[0] > 0 and now < lease[1]:
+            lease[0] -= 1
+            self.allowed += 1
+            return True
         
-        # Add current timestamp
-        self.message_timestamps[user_id].append(current_time)
+        # Only a user who used up the last lease before it expired gets a bigger one
+        size = 1
+        if lease and now < lease[1]:
+            size = min(lease[2] * 2, settings.RATE_LIMIT_LEASE_MAX, limit)
+
+        try:
+            granted = await self._lease(scope, key, limit, period, size)
+        except Exception as e:
+            if not self.degraded:
+                logger.warning(f"Redis rate limiting unavailable, using local limits: {e}")
+                self.degraded = True
+            self.fallback_checks += 1
+            return self._take(scope, key, limit, period)
+        if self.degraded:
+            logger.info("Redis rate limiting restored")
+            self.degraded = False
+
+        if granted <= 0:
+            leases.pop(key, None)
+            self.limited += 1
+            return False
+        leases[key] = [granted - 1, now + settings.RATE_LIMIT_LEASE_SECONDS, granted]
+        self.allowed += 1
         return True
 
+    async def sweep(self):
+        await super().sweep()
+        for leases in list(self.leases.values()):
+            await _sweep_entries(leases, lambda lease: lease[1])
+
+    def get_stats(self) -> dict:
+        stats = super().get_stats()
+        stats.update({
+            "backend": "redis",
+            "leases": {scope: len(leases) for scope, leases in self.leases.items()},
+            "redis_calls": self.redis_calls,
+            "fallback_checks": self.fallback_checks,
+            "degraded": self.degraded,
+        })
+        return stats
+
+
+def create_rate_limiter() -> RateLimiter:
+    """Build the rate limiter selected by settings.RATE_LIMIT_BACKEND"""
+    if settings.RATE_LIMIT_BACKEND.lower() == "redis":
+        return RedisRateLimiter()
+    return RateLimiter()
+
+
+# Punctuation folds to spaces so "buy now!!!" and "Buy... now" fingerprint alike
+_PUNCTUATION_TABLE = str.maketrans(string.punctuation, " " * len(string.punctuation))
+# Longer messages are sketched from this many characters at each end
+_SKETCH_END_CHARS = 200
+
+
+class SpamGuard:
+    """
+    Rejects repeated and near-identical messages, per user and across all users.
+
+    Each message gets an exact fingerprint plus a bottom-3 MinHash sketch
+    of its word bigrams (first and last ~200 characters only); every pair of sketch values is used as a band
+    key, so two messages count as near-duplicates when they share two of
+    their three smallest bigram hashes (likely once they overlap by about
+    80% or more). Keys of accepted messages are counted for
+    SPAM_WINDOW_SECONDS in a bounded deque-backed store.
+    """
+    def __init__(self):
+        # (accepted at, user_id, keys), oldest first
+        self.entries: Deque[Tuple[float, str, Tuple[int, ...]]] = deque()
+        self.global_counts: Dict[int, int] = {}
+        self.user_counts: Dict[Tuple[str, int], int] = {}
+        self.rejected = 0
+
+    def fingerprint(self, content: str) -> Optional[Tuple[int, ...]]:
+        """Return the message's keys, or None if it is too short to judge"""
+        if len(content) < settings.SPAM_MIN_LENGTH:
+            return None
+        text = content.casefold().translate(_PUNCTUATION_TABLE)
+        if len(text) > 2 * _SKETCH_END_CHARS:
+            # Long messages are only split at their ends (dropping the words cut
+            # in half) to bound the cost per message; their exact key keeps the
+            # spacing, which the sketch keys do not
+            keys = [hash(text)]
+            words = text[:_SKETCH_END_CHARS].split()[:-1] + text[-_SKETCH_END_CHARS:].split()[1:]
+        else:
+            words = text.split()
+            keys = [hash(tuple(words))]
+        # A repeated bigram hashes the same, so take a few extra and dedupe rather than build a set
+        sketch = sorted(set(heapq.nsmallest(6, map(hash, zip(words, words[1:])))))[:3]
+        if len(sketch) == 3:
+            a, b, c = sketch
+            keys += [hash((a, b)), hash((a, c)), hash((b, c))]
+        return tuple(keys)
+
+    def _forget(self, user_id: str, keys: Tuple[int, ...]):
+        for key in keys:
+            count = self.global_counts[key] - 1
+            if count:
+                self.global_counts[key] = count
+            else:
+                del self.global_counts[key]
+            user_key = (user_id, key)
+            count = self.user_counts[user_key] - 1
+            if count:
+                self.user_counts[user_key] = count
+            else:
+                del self.user_counts[user_key]
+
+    def _expire(self, now: float):
+        cutoff = now - settings.SPAM_WINDOW_SECONDS
+        entries = self.entries
+        while entries and (entries[0][0] < cutoff or len(entries) > settings.SPAM_MAX_ENTRIES):
+            _, user_id, keys = entries.popleft()
+            self._forget(user_id, keys)
+
+    def check(self, user_id: str, content: str) -> Optional[str]:
+        """Record the message and return None, or return why it is rejected"""
+        keys = self.fingerprint(content)
+        if keys is None:
+            return None
+        user_id = str(user_id)
+        now = time.monotonic()
+        self._expire(now)
+
+        global_counts, user_counts = self.global_counts, self.user_counts
+        if max(user_counts.get((user_id, key), 0) for key in keys) >= settings.SPAM_USER_MAX_REPEATS:
+            self.rejected += 1
+            return "You are sending the same message repeatedly. Please slow down."
+        if max(global_counts.get(key, 0) for key in keys) >= settings.SPAM_GLOBAL_MAX_REPEATS:
+            self.rejected += 1
+            return "This message has been sent too many times recently."
+
+        self.entries.append((now, user_id, keys))
+        for key in keys:
+            global_counts[key] = global_counts.get(key, 0) + 1
+            user_counts[(user_id, key)] = user_counts.get((user_id, key), 0) + 1
+        return None
+
+    def get_stats(self) -> dict:
+        return {
+            "tracked_messages": len(self.entries),
+            "rejected": self.rejected,
+        }
+
 
 # Ban and mute checker
-async def check_user_permissions(
-    db: AsyncIOMotorClient = Depends(get_database), 
-    user_id: str = None, 
-    room_id: Optional[str] = None
-) -> None:
-    """Check if user is banned or muted"""
-    
-    # Check for global ban
-    global_ban = await db["user_bans"].find_one({
-        "user_id": ObjectId(user_id),
-        "room_id": None,  # Global ban
-        "$or": [
-            {"expires_at": {"$exists": False}},
-            {"expires_at": {"$gt": datetime.utcnow()}}  # Permanent or not expired
-        ]
-    })
-    
-    if global_ban:
+def check_user_permissions(user_id: str, room_id: Optional[str] = None) -> None:
+    """Raise 403 if the user is banned, or banned or muted in the room"""
+    reason = sanctions.check(user_id, room_id)
+    if reason:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
-            detail="You are banned from the platform"
+            detail=reason
         )
-    
-    if room_id:
-        # Check for room-specific ban
-        room_ban = await db["user_bans"].find_one({
-            "user_id": ObjectId(user_id),
-            "room_id": ObjectId(room_id),
-            "$or": [
-                {"expires_at": {"$exists": False}},
-                {"expires_at": {"$gt": datetime.utcnow()}}  # Permanent or not expired
-            ]
-        })
-        
-        if room_ban:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You are banned from this room"
-            )
-        
-        # Check for mute
-        muted_member = await db["room_members"].find_one({
-            "user_id": ObjectId(user_id),
-            "room_id": ObjectId(room_id),
-            "is_muted": True,
-            "$or": [
-                {"muted_until": {"$exists": False}},
-                {"muted_until": {"$gt": datetime.utcnow()}}
-            ]
-        })
-        
-        if muted_member:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="You are muted in this room"
-            )
 
 
 # Initialize the moderation tools
 profanity_filter = ProfanityFilter()
-rate_limiter = RateLimiter() 
\ No newline at end of file
+spam_guard = SpamGuard()
+rate_limiter = create_rate_limiter() 
\ No newline at end of file
@@ -0,0 +1,96 @@
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from sqlalchemy import update, bindparam, func
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database.sql import run_db
+from app.models.sql import User
+
+logger = logging.getLogger(__name__)
+
+users_table = User.__table__
+
+
+class PresenceTracker:
+    """Buffers last_seen and active-time updates and writes them in bulk.
+
+    Authenticated requests and socket connects only touch memory; every
+    PRESENCE_FLUSH_SECONDS the latest timestamps and accumulated session
+    time are written with one executemany UPDATE per column.
+
+    touch() is also called from threadpool threads (token checks run in
+    run_db), so the buffers are only read or changed under a lock.
+    """
+
+    def __init__(self):
+        # user_id -> most recent activity
+        self.last_seen: Dict[str, datetime] = {}
+        # user_id -> seconds of socket time not yet added to total_active_time
+        self.active_time: Dict[str, int] = {}
+        self.task: Optional[asyncio.Task] = None
+        self.lock = threading.Lock()
+
+    def touch(self, user_id: str):
+        with self.lock:
+            self.last_seen[str(user_id)] = datetime.utcnow()
+
+    def add_active_time(self, user_id: str, seconds: int):
+        user_id = str(user_id)
+        with self.lock:
+            self.active_time[user_id] = self.active_time.get(user_id, 0) + seconds
+            self.last_seen[user_id] = datetime.utcnow()
+
+    def _write(self, db: Session, last_seen: Dict[str, datetime], active_time: Dict[str, int]):
+        if last_seen:
+            db.execute(
+                update(users_table)
+                .where(users_table.c.id == bindparam("_user_id"))
+                .values(last_seen=bindparam("_last_seen")),
+                [{"_user_id": user_id, "_last_seen": seen} for user_id, seen in last_seen.items()]
+            )
+        if active_time:
+            db.execute(
+                update(users_table)
+                .where(users_table.c.id == bindparam("_user_id"))
+                .values(total_active_time=func.coalesce(users_table.c.total_active_time, 0) + bindparam("_seconds")),
+                [{"_user_id": user_id, "_seconds": seconds} for user_id, seconds in active_time.items()]
+            )
+        db.commit()
+
+    async def flush(self):
+        with self.lock:
+            if not self.last_seen and not self.active_time:
+                return
+            last_seen, self.last_seen = self.last_seen, {}
+            active_time, self.active_time = self.active_time, {}
+        try:
+            await run_db(self._write, last_seen, active_time)
+        except Exception as e:
+            logger.error(f"Presence flush failed: {e}")
+            # Put the updates back so the next flush retries them
+            with self.lock:
+                for user_id, seen in last_seen.items():
+                    self.last_seen.setdefault(user_id, seen)
+                for user_id, seconds in active_time.items():
+                    self.active_time[user_id] = self.active_time.get(user_id, 0) + seconds
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(settings.PRESENCE_FLUSH_SECONDS)
+            await self.flush()
+
+    async def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        await self.flush()
+
+
+presence = PresenceTracker()
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database.sql import run_db
+from app.models.sql import MessageReaction, MessageReactionCount
+from app.core.websocket_manager import manager
+from app.utils.emoji import EmojiHandler
+
+logger = logging.getLogger(__name__)
+
+
+def is_reaction_emoji(emoji: str) -> bool:
+    return emoji in EmojiHandler.get_reaction_emojis()
+
+
+def _bump(db: Session, message_id: str, emoji: str, delta: int):
+    """Adjust a counter row with a single UPDATE, creating it on the first reaction"""
+    updated = db.query(MessageReactionCount).filter(
+        MessageReactionCount.message_id == message_id,
+        MessageReactionCount.emoji == emoji
+    ).update({MessageReactionCount.count: MessageReactionCount.count + delta}, synchronize_session=False)
+    if updated or delta < 0:
+        return
+    try:
+        with db.begin_nested():
+            db.add(MessageReactionCount(message_id=message_id, emoji=emoji, count=delta))
+    except IntegrityError:
+        # Another request created it first
+        _bump(db, message_id, emoji, delta)
+
+
+def add_reaction(db: Session, message_id: str, user_id: str, emoji: str) -> bool:
+    """Record a reaction and count it; False if the user had already reacted with this emoji"""
+    try:
+        with db.begin_nested():
+            db.add(MessageReaction(message_id=message_id, user_id=user_id, emoji=emoji))
+    except IntegrityError:
+        return False
+    _bump(db, message_id, emoji, 1)
+    db.commit()
+    return True
+
+
+def remove_reaction(db: Session, message_id: str, user_id: str, emoji: str) -> bool:
+    deleted = db.query(MessageReaction).filter(
+        MessageReaction.message_id == message_id,
+        MessageReaction.user_id == user_id,
+        MessageReaction.emoji == emoji
+    ).delete(synchronize_session=False)
+    if deleted:
+        _bump(db, message_id, emoji, -1)
+    db.commit()
+    return bool(deleted)
+
+
+def reaction_counts(db: Session, message_ids: List[str]) -> Dict[str, Dict[str, int]]:
+    """message_id -> {emoji: count} from the counter table"""
+    counts: Dict[str, Dict[str, int]] = {}
+    if message_ids:
+        for message_id, emoji, count in db.query(
+            MessageReactionCount.message_id, MessageReactionCount.emoji, MessageReactionCount.count
+        ).filter(MessageReactionCount.message_id.in_(message_ids), MessageReactionCount.count > 0):
+            counts.setdefault(message_id, {})[emoji] = count
+    return counts
+
+
+def attach_reactions(db: Session, user_id: str, messages: List[dict]) -> List[dict]:
+    """
+    Fill in reaction counts, and the user's own reactions, on serialized
+    messages: two indexed lookups for the whole page.
+    """
+    message_ids = [message["id"] for message in messages]
+    counts = reaction_counts(db, message_ids)
+    mine: Dict[str, List[str]] = {}
+    if counts:
+        for message_id, emoji in db.query(MessageReaction.message_id, MessageReaction.emoji).filter(
+            MessageReaction.message_id.in_(list(counts)),
+            MessageReaction.user_id == user_id
+        ):
+            mine.setdefault(message_id, []).append(emoji)
+
+    result = []
+    for message in messages:
+        by_emoji = counts.get(message["id"], {})
+        result.append({
+            **message,
+            "reaction_count": sum(by_emoji.values()),
+            "reactions_by_emoji": by_emoji,
+            "my_reactions": mine.get(message["id"], []),
+        })
+    return result
+
+
+class ReactionBroadcaster:
+    """Coalesces reaction changes into one frame per message per interval.
+
+    A reaction only marks its message dirty. Every REACTION_BROADCAST_MS
+    the current counts of all dirty messages are read in one query and
+    sent as a single reactions_updated frame per message, so a message
+    receiving thousands of reactions a second costs each client about ten
+    frames a second per worker instead of thousands. Frames carry absolute
+    counts, so a dropped or repeated frame is corrected by the next one.
+    """
+
+    def __init__(self):
+        # message_id -> room_id
+        self.dirty: Dict[str, str] = {}
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        # Metrics
+        self.changes = 0
+        self.frames = 0
+
+    def touch(self, message_id: str, room_id: str):
+        self.dirty[message_id] = room_id
+        self.changes += 1
+        self.wakeup.set()
+
+    async def flush(self):
+        if not self.dirty:
+            return
+        dirty, self.dirty = self.dirty, {}
+        counts = await run_db(reaction_counts, list(dirty))
+        for message_id, room_id in dirty.items():
+            by_emoji = counts.get(message_id, {})
+            await manager.broadcast_to_room(
+                room_id=room_id,
+                message={
+                    "type": "reactions_updated",
+                    "message_id": message_id,
+                    "reaction_count": sum(by_emoji.values()),
+                    "reactions_by_emoji": by_emoji
+                }
+            )
+            self.frames += 1
+
+    async def _run(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Reaction broadcast failed: {e}")
+            # Changes arriving meanwhile wait for the next flush
+            await asyncio.sleep(settings.REACTION_BROADCAST_MS / 1000)
+
+    async def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        await self.flush()
+
+    def get_stats(self) -> dict:
+        return {
+            "pending": len(self.dirty),
+            "changes": self.changes,
+            "frames": self.frames,
+        }
+
+
+reaction_broadcaster = ReactionBroadcaster()
@@ -0,0 +1,142 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.sql import Message, RoomMember, User
+from app.core.websocket_manager import manager
+
+logger = logging.getLogger(__name__)
+
+# (last_read_at, last_read_message_id)
+Position = Tuple[datetime, Optional[str]]
+
+
+def mark_read(db: Session, room_id: str, user_id: str, message_id: str) -> Optional[Position]:
+    """
+    Move the member's read position forward to a message with a single
+    conditional UPDATE. Returns the new position, or None if the message
+    is not in the room or the member had already read past it.
+    """
+    message = db.query(Message.created_at).filter(
+        Message.id == message_id,
+        Message.room_id == room_id
+    ).first()
+    if not message:
+        return None
+    created_at = message.created_at
+
+    # Only ever forwards: a position with no message id covers everything up to its time
+    advanced = db.query(RoomMember).filter(
+        RoomMember.room_id == room_id,
+        RoomMember.user_id == user_id,
+        or_(
+            RoomMember.last_read_at == None,
+            RoomMember.last_read_at < created_at,
+            and_(
+                RoomMember.last_read_at == created_at,
+                RoomMember.last_read_message_id != None,
+                RoomMember.last_read_message_id < message_id
+            )
+        )
+    ).update({
+        RoomMember.last_read_at: created_at,
+        RoomMember.last_read_message_id: message_id
+    }, synchronize_session=False)
+    db.commit()
+    return (created_at, message_id) if advanced else None
+
+
+def read_positions(db: Session, room_id: str) -> List[RoomMember]:
+    return db.query(RoomMember).filter(RoomMember.room_id == room_id).all()
+
+
+def read_by(db: Session, message: Message) -> List[User]:
+    """Members whose read position is at or past the message, other than its sender"""
+    return db.query(User).join(RoomMember, RoomMember.user_id == User.id).filter(
+        RoomMember.room_id == message.room_id,
+        RoomMember.user_id != message.user_id,
+        or_(
+            RoomMember.last_read_at > message.created_at,
+            and_(
+                RoomMember.last_read_at == message.created_at,
+                or_(RoomMember.last_read_message_id == None, RoomMember.last_read_message_id >= message.id)
+            )
+        )
+    ).all()
+
+
+class ReadReceiptBroadcaster:
+    """Debounces read positions into one read_progress frame per room.
+
+    Marking a room read records the member's new position here; every
+    READ_RECEIPT_BROADCAST_MS each room with changes gets one frame listing
+    the latest position of every member who moved. Reading a backlog of a
+    thousand messages is one position and at most one frame, and a busy
+    room with many readers still gets one frame per interval.
+    """
+
+    def __init__(self):
+        # room_id -> user_id -> latest position
+        self.pending: Dict[str, Dict[str, Position]] = {}
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        # Metrics
+        self.changes = 0
+        self.frames = 0
+
+    def touch(self, room_id: str, user_id: str, position: Position):
+        self.pending.setdefault(room_id, {})[str(user_id)] = position
+        self.changes += 1
+        self.wakeup.set()
+
+    async def flush(self):
+        pending, self.pending = self.pending, {}
+        for room_id, positions in pending.items():
+            # One room failing must not drop the positions of the rooms after it
+            try:
+                await manager.notify_read_progress(room_id, [
+                    {
+                        "user_id": user_id,
+                        "last_read_at": last_read_at.isoformat(),
+                        "last_read_message_id": message_id
+                    }
+                    for user_id, (last_read_at, message_id) in positions.items()
+                ])
+            except Exception as e:
+                logger.error(f"Read receipt broadcast to room {room_id} failed: {e}")
+                continue
+            self.frames += 1
+
+    async def _run(self):
+        while True:
+            await self.wakeup.wait()
+            self.wakeup.clear()
+            # Trailing edge: collect the burst, then send
+            await asyncio.sleep(settings.READ_RECEIPT_BROADCAST_MS / 1000)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Read receipt broadcast failed: {e}")
+
+    async def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+        await self.flush()
+
+    def get_stats(self) -> dict:
+        return {
+            "pending_rooms": len(self.pending),
+            "changes": self.changes,
+            "frames": self.frames,
+        }
+
+
+read_receipts = ReadReceiptBroadcaster()
@@ -0,0 +1,271 @@
+import json
+import bisect
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import List, Optional, Set, Tuple
+
+from sqlalchemy import desc
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.sql import Message as MessageModel, HiddenMessage, Room
+from app.schemas.message import Message as MessageSchema
+from app.core.websocket_manager import manager
+
+logger = logging.getLogger(__name__)
+
+HISTORY_CHANNEL = "history"
+
+# (created_at, message_id, serialized message, size in bytes)
+Entry = Tuple[datetime, str, dict, int]
+
+
+def serialize_message(message) -> dict:
+    """Serialize a Message row (or a dict of its columns) the way the history endpoint returns it"""
+    return MessageSchema.model_validate(message).model_dump(mode="json")
+
+
+class _Ring:
+    """The newest messages of one room, oldest first"""
+
+    def __init__(self, entries: List[Entry], complete: bool):
+        self.entries = entries
+        self.keys = [(entry[0], entry[1]) for entry in entries]
+        self.bytes = sum(entry[3] for entry in entries)
+        # True when the ring holds every message the room has
+        self.complete = complete
+        # Ids deleted since the ring was loaded, so a late add cannot bring them back
+        self.tombstones: Set[str] = set()
+        self.hits = 0
+        self.misses = 0
+
+    def find(self, message_id: str) -> int:
+        for i in range(len(self.entries) - 1, -1, -1):
+            if self.entries[i][1] == message_id:
+                return i
+        return -1
+
+    def remove(self, i: int):
+        self.bytes -= self.entries[i][3]
+        del self.entries[i]
+        del self.keys[i]
+
+
+class RoomHistoryCache:
+    """Per-room ring buffers of the newest messages, serving first-page reads.
+
+    Opening a room asks for the same newest page for every member, so each
+    worker keeps the last ROOM_HISTORY_CACHE_MESSAGES serialized messages
+    of the rooms being read. A ring is loaded from the database on the
+    first read and then kept current by the send, edit and delete paths,
+    which apply their change here and publish it to the other workers.
+    Per-user hidden messages and clear-chat watermarks are applied at read
+    time. Rooms are evicted least recently read first once the rings hold
+    more than ROOM_HISTORY_CACHE_MAX_BYTES.
+    """
+
+    def __init__(self):
+        self.rooms: "OrderedDict[str, _Ring]" = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.ROOM_HISTORY_CACHE_ENABLED
+
+    def _load(self, db: Session, room_id: str) -> _Ring:
+        capacity = settings.ROOM_HISTORY_CACHE_MESSAGES
+        rows = db.query(MessageModel).filter(
+            MessageModel.room_id == room_id
+        ).order_by(desc(MessageModel.created_at), desc(MessageModel.id)).limit(capacity).all()
+        entries = [self._entry(row.created_at, row.id, serialize_message(row)) for row in reversed(rows)]
+        # Once a room has archived history the messages table never holds all of it
+        complete = len(rows) < capacity and db.query(Room.archived_until).filter(Room.id == room_id).scalar() is None
+        ring = _Ring(entries, complete=complete)
+        self._put(room_id, ring)
+        return ring
+
+    def _entry(self, created_at: datetime, message_id: str, payload: dict) -> Entry:
+        return (created_at, message_id, payload, len(json.dumps(payload, separators=(",", ":"))))
+
+    def _put(self, room_id: str, ring: _Ring):
+        self._drop(room_id)
+        self.rooms[room_id] = ring
+        self.bytes += ring.bytes
+        self._evict()
+
+    def _drop(self, room_id: str):
+        ring = self.rooms.pop(room_id, None)
+        if ring is not None:
+            self.bytes -= ring.bytes
+
+    def _evict(self):
+        # The most recently read room is kept even if it alone is over the limit
+        while self.bytes > settings.ROOM_HISTORY_CACHE_MAX_BYTES and len(self.rooms) > 1:
+            room_id, ring = self.rooms.popitem(last=False)
+            self.bytes -= ring.bytes
+            self.evictions += 1
+
+    def get_page(
+        self,
+        db: Session,
+        room_id: str,
+        user_id: str,
+        limit: int,
+        cleared_at: Optional[datetime] = None
+    ) -> Optional[List[Entry]]:
+        """
+        Return the newest `limit` messages the user can see, newest first,
+        or None if the ring cannot answer and the database must.
+        """
+        if not self.enabled or limit > settings.ROOM_HISTORY_CACHE_MESSAGES:
+            return None
+
+        ring = self.rooms.get(room_id)
+        loaded = ring is None
+        if loaded:
+            ring = self._load(db, room_id)
+        else:
+            self.rooms.move_to_end(room_id)
+
+        hidden: Set[str] = set()
+        if ring.entries:
+            hidden = {
+                message_id for (message_id,) in db.query(HiddenMessage.message_id).filter(
+                    HiddenMessage.user_id == user_id,
+                    HiddenMessage.message_id.in_([key[1] for key in ring.keys])
+                )
+            }
+
+        page: List[Entry] = []
+        reached_watermark = False
+        for entry in reversed(ring.entries):
+            if cleared_at is not None and entry[0] <= cleared_at:
+                reached_watermark = True
+                break
+            if entry[1] in hidden:
+                continue
+            page.append(entry)
+            if len(page) == limit:
+                break
+
+        # A short page is only the whole answer if nothing older is visible to this user
+        served = len(page) == limit or ring.complete or reached_watermark
+        if served and not loaded:
+            self.hits += 1
+            ring.hits += 1
+        else:
+            self.misses += 1
+            ring.misses += 1
+        return page if served else None
+
+    # Changes are applied to this worker's rings at once and then published,
+    # so reads here see them immediately; applying an event twice is harmless
+
+    def _apply(self, event: dict):
+        op = event["op"]
+        room_id = event.get("room_id")
+
+        if op == "drop":
+            if room_id is None:
+                self.rooms.clear()
+                self.bytes = 0
+            else:
+                self._drop(room_id)
+            return
+
+        ring = self.rooms.get(room_id)
+        if ring is None:
+            return
+
+        if op == "delete":
+            ring.tombstones.add(event["message_id"])
+            i = ring.find(event["message_id"])
+            if i >= 0:
+                self.bytes -= ring.entries[i][3]
+                ring.remove(i)
+            return
+
+        payload = event["message"]
+        entry = self._entry(datetime.fromisoformat(payload["created_at"]), payload["id"], payload)
+        key = (entry[0], entry[1])
+        if entry[1] in ring.tombstones:
+            return
+
+        i = ring.find(entry[1])
+        if i >= 0:
+            self.bytes += entry[3] - ring.entries[i][3]
+            ring.bytes += entry[3] - ring.entries[i][3]
+            ring.entries[i] = entry
+            return
+
+        if op == "update":
+            # Edited before this worker saw it added: reload rather than cache the stale add later
+            if ring.keys and key >= ring.keys[0]:
+                self._drop(room_id)
+            return
+
+        # "add": older than everything held means it is outside the newest window
+        if not ring.complete and ring.keys and key < ring.keys[0]:
+            return
+        i = bisect.bisect(ring.keys, key)
+        ring.entries.insert(i, entry)
+        ring.keys.insert(i, key)
+        ring.bytes += entry[3]
+        self.bytes += entry[3]
+        while len(ring.entries) > settings.ROOM_HISTORY_CACHE_MESSAGES:
+            self.bytes -= ring.entries[0][3]
+            ring.remove(0)
+            ring.complete = False
+        self._evict()
+
+    async def _publish(self, event: dict):
+        self._apply(event)
+        await manager.publish_event(HISTORY_CHANNEL, event)
+
+    def _on_event(self, data: str):
+        self._apply(json.loads(data))
+
+    async def added(self, message):
+        """Record a stored message (a Message row or a dict of its columns)"""
+        payload = serialize_message(message)
+        await self._publish({"op": "add", "room_id": payload["room_id"], "message": payload})
+
+    async def updated(self, message: MessageModel):
+        payload = serialize_message(message)
+        await self._publish({"op": "update", "room_id": payload["room_id"], "message": payload})
+
+    async def deleted(self, room_id: str, message_id: str):
+        await self._publish({"op": "delete", "room_id": room_id, "message_id": message_id})
+
+    async def invalidate(self, room_id: Optional[str] = None):
+        """Forget a room's ring, or every ring when room_id is None, on every worker"""
+        await self._publish({"op": "drop", "room_id": room_id})
+
+    def get_stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "rooms": len(self.rooms),
+            "bytes": self.bytes,
+            "max_bytes": settings.ROOM_HISTORY_CACHE_MAX_BYTES,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "per_room": {
+                room_id: {
+                    "messages": len(ring.entries),
+                    "bytes": ring.bytes,
+                    "hit_rate": round(ring.hits / (ring.hits + ring.misses), 4) if ring.hits + ring.misses else 0.0,
+                }
+                for room_id, ring in self.rooms.items()
+            },
+        }
+
+
+room_history = RoomHistoryCache()
+manager.on_channel(HISTORY_CHANNEL, room_history._on_event)
@@ -0,0 +1,247 @@
+import json
+import heapq
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database.sql import run_db
+from app.models.sql import UserBan, RoomMember
+from app.core.websocket_manager import manager
+
+logger = logging.getLogger(__name__)
+
+SANCTIONS_CHANNEL = "sanctions"
+
+GLOBAL_BAN = "global_ban"
+ROOM_BAN = "room_ban"
+ROOM_MUTE = "room_mute"
+
+_MISSING = object()
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if value else None
+
+
+class SanctionIndex:
+    """In-process index of active bans and mutes.
+
+    Every message checks it, so checks are dictionary lookups only. Rows
+    live in user_bans and room_members (is_muted / muted_until); writes
+    go through this class, which updates the index and tells the other
+    workers over the backplane. A min-heap of expiry times lifts
+    temporary sanctions when they run out, and a periodic reload catches
+    anything written elsewhere.
+    """
+
+    def __init__(self):
+        # user_id -> expires_at (None = permanent)
+        self.global_bans: Dict[str, Optional[datetime]] = {}
+        # (room_id, user_id) -> expires_at (None = permanent)
+        self.room_bans: Dict[Tuple[str, str], Optional[datetime]] = {}
+        self.room_mutes: Dict[Tuple[str, str], Optional[datetime]] = {}
+        # (expires_at, kind, key); entries whose sanction was since replaced are skipped
+        self.expiries: List[tuple] = []
+        self.expiry_changed = asyncio.Event()
+        self.expiry_task: Optional[asyncio.Task] = None
+        self.refresh_task: Optional[asyncio.Task] = None
+        # Events applied while a reload is reading the tables, replayed onto the result
+        self.replay: Optional[List[tuple]] = None
+
+    def _table(self, kind: str) -> dict:
+        return {GLOBAL_BAN: self.global_bans, ROOM_BAN: self.room_bans, ROOM_MUTE: self.room_mutes}[kind]
+
+    def _active(self, table: dict, key) -> bool:
+        expires_at = table.get(key, _MISSING)
+        if expires_at is _MISSING:
+            return False
+        # Also compared here in case the expiry loop has not run yet
+        return expires_at is None or expires_at > datetime.utcnow()
+
+    def is_banned(self, user_id: str, room_id: Optional[str] = None) -> bool:
+        if self._active(self.global_bans, str(user_id)):
+            return True
+        return room_id is not None and self._active(self.room_bans, (room_id, str(user_id)))
+
+    def is_muted(self, room_id: str, user_id: str) -> bool:
+        return self._active(self.room_mutes, (room_id, str(user_id)))
+
+    def check(self, user_id: str, room_id: Optional[str] = None) -> Optional[str]:
+        """Return why the user may not post in the room, or None if they may"""
+        user_id = str(user_id)
+        if self._active(self.global_bans, user_id):
+            return "You are banned from the platform"
+        if room_id is not None:
+            if self._active(self.room_bans, (room_id, user_id)):
+                return "You are banned from this room"
+            if self._active(self.room_mutes, (room_id, user_id)):
+                return "You are muted in this room"
+        return None
+
+    def _apply(self, kind: str, user_id: str, room_id: Optional[str], expires_at: Optional[datetime], active: bool):
+        if self.replay is not None:
+            self.replay.append((kind, user_id, room_id, expires_at, active))
+        table = self._table(kind)
+        key = user_id if kind == GLOBAL_BAN else (room_id, user_id)
+        if not active:
+            table.pop(key, None)
+            return
+        table[key] = expires_at
+        if expires_at is not None:
+            heapq.heappush(self.expiries, (expires_at, kind, key))
+            self.expiry_changed.set()
+
+    async def _publish(self, kind: str, user_id: str, room_id: Optional[str], expires_at: Optional[datetime], active: bool):
+        self._apply(kind, user_id, room_id, expires_at, active)
+        await manager.publish_event(SANCTIONS_CHANNEL, {
+            "kind": kind,
+            "user_id": user_id,
+            "room_id": room_id,
+            "expires_at": expires_at.isoformat() if expires_at else None,
+            "active": active
+        })
+
+    def _on_event(self, data: str):
+        event = json.loads(data)
+        self._apply(event["kind"], event["user_id"], event["room_id"], _parse_time(event["expires_at"]), event["active"])
+        # Every worker, including the one that wrote the ban, drops its own sockets
+        if event["active"] and event["kind"] == GLOBAL_BAN:
+            manager.kick(event["user_id"], reason="You are banned from the platform")
+        elif event["active"] and event["kind"] == ROOM_BAN:
+            manager.kick(event["user_id"], event["room_id"], reason="You are banned from this room")
+
+    async def ban(
+        self,
+        db: Session,
+        user_id: str,
+        room_id: Optional[str] = None,
+        banned_by: Optional[str] = None,
+        reason: Optional[str] = None,
+        expires_at: Optional[datetime] = None
+    ):
+        """Ban a user from a room, or from the platform when room_id is None.
+
+        A room ban also removes the user's membership of that room.
+        """
+        db.query(UserBan).filter(UserBan.user_id == user_id, UserBan.room_id == room_id).delete()
+        db.add(UserBan(
+            user_id=user_id,
+            room_id=room_id,
+            banned_by=banned_by,
+            reason=reason,
+            expires_at=expires_at
+        ))
+        if room_id is not None:
+            db.query(RoomMember).filter(RoomMember.room_id == room_id, RoomMember.user_id == user_id).delete()
+        db.commit()
+        await self._publish(GLOBAL_BAN if room_id is None else ROOM_BAN, user_id, room_id, expires_at, True)
+
+    async def unban(self, db: Session, user_id: str, room_id: Optional[str] = None):
+        db.query(UserBan).filter(UserBan.user_id == user_id, UserBan.room_id == room_id).delete()
+        db.commit()
+        await self._publish(GLOBAL_BAN if room_id is None else ROOM_BAN, user_id, room_id, None, False)
+
+    async def mute(self, db: Session, member: RoomMember, until: Optional[datetime] = None):
+        member.is_muted = True
+        member.muted_until = until
+        db.commit()
+        await self._publish(ROOM_MUTE, member.user_id, member.room_id, until, True)
+
+    async def unmute(self, db: Session, member: RoomMember):
+        member.is_muted = False
+        member.muted_until = None
+        db.commit()
+        await self._publish(ROOM_MUTE, member.user_id, member.room_id, None, False)
+
+    def _read(self, db: Session) -> tuple:
+        """Read every active sanction into fresh tables"""
+        now = datetime.utcnow()
+        global_bans, room_bans, room_mutes = {}, {}, {}
+
+        bans = db.query(UserBan.user_id, UserBan.room_id, UserBan.expires_at).filter(
+            or_(UserBan.expires_at == None, UserBan.expires_at > now)
+        )
+        for user_id, room_id, expires_at in bans:
+            if room_id is None:
+                global_bans[user_id] = expires_at
+            else:
+                room_bans[(room_id, user_id)] = expires_at
+
+        mutes = db.query(RoomMember.room_id, RoomMember.user_id, RoomMember.muted_until).filter(
+            RoomMember.is_muted == True,
+            or_(RoomMember.muted_until == None, RoomMember.muted_until > now)
+        )
+        for room_id, user_id, muted_until in mutes:
+            room_mutes[(room_id, user_id)] = muted_until
+
+        return global_bans, room_bans, room_mutes
+
+    async def load(self):
+        self.replay = []
+        try:
+            global_bans, room_bans, room_mutes = await run_db(self._read)
+        finally:
+            replay, self.replay = self.replay, None
+        self.global_bans, self.room_bans, self.room_mutes = global_bans, room_bans, room_mutes
+        self.expiries = [
+            (expires_at, kind, key)
+            for kind, table in ((GLOBAL_BAN, global_bans), (ROOM_BAN, room_bans), (ROOM_MUTE, room_mutes))
+            for key, expires_at in table.items()
+            if expires_at is not None
+        ]
+        heapq.heapify(self.expiries)
+        for event in replay:
+            self._apply(*event)
+        self.expiry_changed.set()
+
+    async def _expiry_loop(self):
+        while True:
+            self.expiry_changed.clear()
+            now = datetime.utcnow()
+            while self.expiries and self.expiries[0][0] <= now:
+                expires_at, kind, key = heapq.heappop(self.expiries)
+                table = self._table(kind)
+                if table.get(key, _MISSING) == expires_at:
+                    del table[key]
+                    logger.info(f"{kind} expired for {key}")
+
+            timeout = (self.expiries[0][0] - now).total_seconds() if self.expiries else None
+            try:
+                await asyncio.wait_for(self.expiry_changed.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(settings.SANCTIONS_REFRESH_SECONDS)
+            try:
+                await self.load()
+            except Exception as e:
+                logger.error(f"Sanctions refresh failed: {e}")
+
+    async def start(self):
+        await self.load()
+        self.expiry_task = asyncio.create_task(self._expiry_loop())
+        self.refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        for task in (self.expiry_task, self.refresh_task):
+            if task:
+                task.cancel()
+
+    def get_stats(self) -> dict:
+        return {
+            "global_bans": len(self.global_bans),
+            "room_bans": len(self.room_bans),
+            "room_mutes": len(self.room_mutes),
+            "pending_expiries": len(self.expiries),
+        }
+
+
+sanctions = SanctionIndex()
+manager.on_channel(SANCTIONS_CHANNEL, sanctions._on_event)
@@ -0,0 +1,220 @@
+import heapq
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database.sql import run_db, stored_utcnow
+from app.models.sql import ScheduledMessage, Message, Room, RoomMember, generate_uuid
+from app.core.security import load_principal
+from app.core.sanctions import sanctions
+from app.core.websocket_manager import manager
+from app.core.room_history import room_history
+
+logger = logging.getLogger(__name__)
+
+
+class MessageScheduler:
+    """Sends scheduled messages when they fall due.
+
+    Schedules are rows in scheduled_messages, so they survive restarts.
+    Each worker holds only the pending rows due within the next
+    SCHEDULED_WINDOW_SECONDS in a min-heap (at most
+    SCHEDULED_WINDOW_MAX_ROWS of them) and reloads the window halfway
+    through, so memory does not grow with the number of schedules. Rows
+    created on this worker inside the current window are pushed straight
+    onto the heap.
+
+    Due rows are claimed with SELECT ... FOR UPDATE SKIP LOCKED in the
+    same transaction that inserts their messages and marks them sent, so
+    when several workers hold the same window each message is sent once.
+    Delivery then follows the normal send path: the room history ring and
+    a broadcast to the room.
+    """
+
+    def __init__(self):
+        # (scheduled_for, scheduled message id)
+        self.heap: List[Tuple[datetime, str]] = []
+        self.window_end: Optional[datetime] = None
+        # Schedules add()-ed while a window query is running, which it may not see
+        self.loading: Optional[Dict[str, datetime]] = None
+        self.wakeup = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+        # Metrics
+        self.sent = 0
+        self.failed = 0
+        self.batches = 0
+        self.max_lateness = 0.0
+
+    def add(self, schedule_id: str, scheduled_for: datetime):
+        """Track a schedule just committed on this worker"""
+        if self.loading is not None:
+            self.loading[schedule_id] = scheduled_for
+        if self.window_end is not None and scheduled_for <= self.window_end:
+            heapq.heappush(self.heap, (scheduled_for, schedule_id))
+            self.wakeup.set()
+
+    def _read_window(self, db: Session, until: datetime) -> List[Tuple[datetime, str]]:
+        # Overdue rows (missed while no worker was running) are included and fire at once
+        return [
+            (scheduled_for, schedule_id)
+            for schedule_id, scheduled_for in db.query(ScheduledMessage.id, ScheduledMessage.scheduled_for).filter(
+                ScheduledMessage.status == "pending",
+                ScheduledMessage.scheduled_for <= until
+            ).order_by(ScheduledMessage.scheduled_for).limit(settings.SCHEDULED_WINDOW_MAX_ROWS)
+        ]
+
+    async def load_window(self):
+        until = datetime.utcnow() + timedelta(seconds=settings.SCHEDULED_WINDOW_SECONDS)
+        self.loading = {}
+        try:
+            rows = await run_db(self._read_window, until)
+            added = self.loading
+        finally:
+            self.loading = None
+        if len(rows) == settings.SCHEDULED_WINDOW_MAX_ROWS:
+            # Window is full: only trust it up to the last row loaded
+            until = rows[-1][0]
+        # The heap is rebuilt from the query, plus schedules committed while it ran
+        loaded = {schedule_id for _, schedule_id in rows}
+        self.heap = sorted(rows + [
+            (scheduled_for, schedule_id)
+            for schedule_id, scheduled_for in added.items()
+            if schedule_id not in loaded and scheduled_for <= until
+        ])
+        self.window_end = until
+
+    def _deliver(self, db: Session, schedule_ids: List[str]) -> List[dict]:
+        """Claim due schedules and turn them into messages in one transaction"""
+        now = stored_utcnow()
+        due = db.query(ScheduledMessage).filter(
+            ScheduledMessage.id.in_(schedule_ids),
+            ScheduledMessage.status == "pending",
+            ScheduledMessage.scheduled_for <= now
+        ).with_for_update(skip_locked=True).all()
+        if not due:
+            db.rollback()
+            return []
+
+        # The sender must still be a member; one query for the whole batch
+        memberships = set(db.query(RoomMember.room_id, RoomMember.user_id).filter(
+            RoomMember.room_id.in_({s.room_id for s in due}),
+            RoomMember.user_id.in_({s.user_id for s in due})
+        ).all())
+
+        delivered = []
+        for scheduled in due:
+            if (scheduled.room_id, scheduled.user_id) not in memberships:
+                error = "Sender is no longer a member of the room"
+            else:
+                error = sanctions.check(scheduled.user_id, scheduled.room_id)
+            if error:
+                scheduled.status = "failed"
+                scheduled.error = error
+                continue
+
+            row = {
+                "id": generate_uuid(),
+                "content": scheduled.content,
+                "user_id": scheduled.user_id,
+                "room_id": scheduled.room_id,
+                "message_type": scheduled.message_type,
+                "is_encrypted": scheduled.is_encrypted,
+                "created_at": now,
+            }
+            db.add(Message(**row))
+            scheduled.status = "sent"
+            scheduled.sent_at = now
+            scheduled.message_id = row["id"]
+            delivered.append((row, scheduled.scheduled_for))
+
+        rooms = {row["room_id"] for row, _ in delivered}
+        if rooms:
+            db.query(Room).filter(Room.id.in_(rooms)).update({Room.last_activity: now}, synchronize_session=False)
+        db.commit()
+
+        self.failed += len(due) - len(delivered)
+        results = []
+        for row, scheduled_for in delivered:
+            self.max_lateness = max(self.max_lateness, (now - scheduled_for).total_seconds())
+            results.append({**row, "sender": load_principal(db, row["user_id"])})
+        return results
+
+    async def fire(self, schedule_ids: List[str]):
+        delivered = await run_db(self._deliver, schedule_ids)
+        self.batches += 1
+        for row in delivered:
+            sender = row.pop("sender")
+            await room_history.added(row)
+            await manager.broadcast_to_room(
+                room_id=row["room_id"],
+                message={
+                    "id": row["id"],
+                    "content": row["content"],
+                    "user_id": row["user_id"],
+                    "room_id": row["room_id"],
+                    "message_type": row["message_type"],
+                    "created_at": row["created_at"].isoformat(),
+                    "is_encrypted": row["is_encrypted"],
+                    "user": {
+                        "username": sender.username if sender else None,
+                        "avatar_url": sender.avatar_url if sender else None
+                    }
+                }
+            )
+        self.sent += len(delivered)
+
+    async def _run(self):
+        reload_every = settings.SCHEDULED_WINDOW_SECONDS / 2
+        next_reload = datetime.utcnow()
+        while True:
+            try:
+                now = datetime.utcnow()
+                if now >= next_reload:
+                    await self.load_window()
+                    next_reload = now + timedelta(seconds=reload_every)
+                    if self.window_end < next_reload:
+                        # Cut-short window: reload once it has been worked through
+                        next_reload = self.window_end
+
+                batch = []
+                while self.heap and self.heap[0][0] <= now and len(batch) < settings.SCHEDULED_BATCH_SIZE:
+                    batch.append(heapq.heappop(self.heap)[1])
+                if batch:
+                    await self.fire(batch)
+                    continue
+
+                wake_at = min(self.heap[0][0], next_reload) if self.heap else next_reload
+                self.wakeup.clear()
+                try:
+                    await asyncio.wait_for(self.wakeup.wait(), timeout=max((wake_at - now).total_seconds(), 0))
+                except asyncio.TimeoutError:
+                    pass
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Scheduled message delivery failed: {e}")
+                await asyncio.sleep(1)
+
+    async def start(self):
+        self.task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.task:
+            self.task.cancel()
+
+    def get_stats(self) -> dict:
+        return {
+            "in_window": len(self.heap),
+            "window_end": self.window_end.isoformat() if self.window_end else None,
+            "sent": self.sent,
+            "failed": self.failed,
+            "batches": self.batches,
+            "max_lateness_seconds": round(self.max_lateness, 3),
+        }
+
+
+scheduler = MessageScheduler()
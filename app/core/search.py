@@ -0,0 +1,177 @@
+import re
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Float, and_, or_, cast, desc, func, literal, literal_column, select, text, column, table
+from sqlalchemy.dialects.mysql import match as mysql_match
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+from app.models.sql import Message, Room, RoomMember, HiddenMessage
+
+# Full-text search over message content, using the index each database
+# provides natively. The indexes are maintained by the database itself
+# (a GIN expression index, a FULLTEXT index, or an FTS5 table kept current
+# by triggers), so every write path, including write-behind inserts, is
+# searchable as soon as it commits.
+
+SEARCH_CONFIG = "simple"  # PostgreSQL text search configuration; no stemming or stop words
+
+PG_VECTOR = f"to_tsvector('{SEARCH_CONFIG}', coalesce(messages.content, ''))"
+
+messages_fts = table("messages_fts", column("rowid"), column("messages_fts"))
+messages_fts_keys = table("messages_fts_keys", column("id"), column("message_id"))
+
+_WORD = re.compile(r"\w+", re.UNICODE)
+
+
+def has_terms(terms: str) -> bool:
+    """Whether a search string contains anything the index can match"""
+    return bool(_WORD.search(terms))
+
+
+def create_search_index(engine: Engine):
+    """Create the full-text index for the engine's dialect (idempotent)"""
+    dialect = engine.dialect.name
+    with engine.begin() as conn:
+        if dialect == "postgresql":
+            conn.execute(text(
+                f"CREATE INDEX IF NOT EXISTS ix_messages_content_fts ON messages USING GIN ({PG_VECTOR})"
+            ))
+        elif dialect == "mysql":
+            exists = conn.execute(text(
+                "SELECT COUNT(*) FROM information_schema.statistics "
+                "WHERE table_schema = DATABASE() AND table_name = 'messages' AND index_name = 'ft_messages_content'"
+            )).scalar()
+            if not exists:
+                conn.execute(text("ALTER TABLE messages ADD FULLTEXT INDEX ft_messages_content (content)"))
+        elif dialect == "sqlite":
+            # messages has a string primary key, so its implicit rowid can change
+            # on VACUUM; FTS5 rows are keyed by an explicit INTEGER id instead
+            has_keys = conn.execute(text(
+                "SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name = 'messages_fts_keys'"
+            )).scalar()
+            if not has_keys:
+                # Replace the earlier index over messages.rowid
+                for trigger in ("messages_fts_insert", "messages_fts_delete", "messages_fts_update"):
+                    conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger}"))
+                conn.execute(text("DROP TABLE IF EXISTS messages_fts"))
+                conn.execute(text(
+                    "CREATE TABLE messages_fts_keys "
+                    "(id INTEGER PRIMARY KEY, message_id VARCHAR(36) NOT NULL UNIQUE)"
+                ))
+                # Contentless: the text stays in messages only
+                conn.execute(text("CREATE VIRTUAL TABLE messages_fts USING fts5(content, content='')"))
+                conn.execute(text("INSERT INTO messages_fts_keys (message_id) SELECT id FROM messages"))
+                conn.execute(text(
+                    "INSERT INTO messages_fts (rowid, content) SELECT k.id, m.content "
+                    "FROM messages_fts_keys k JOIN messages m ON m.id = k.message_id"
+                ))
+            conn.execute(text(
+                "CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN "
+                "INSERT INTO messages_fts_keys (message_id) VALUES (new.id); "
+                "INSERT INTO messages_fts (rowid, content) "
+                "SELECT id, new.content FROM messages_fts_keys WHERE message_id = new.id; END"
+            ))
+            conn.execute(text(
+                "CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN "
+                "INSERT INTO messages_fts (messages_fts, rowid, content) "
+                "SELECT 'delete', id, old.content FROM messages_fts_keys WHERE message_id = old.id; "
+                "DELETE FROM messages_fts_keys WHERE message_id = old.id; END"
+            ))
+            conn.execute(text(
+                "CREATE TRIGGER IF NOT EXISTS messages_fts_update AFTER UPDATE OF content ON messages BEGIN "
+                "INSERT INTO messages_fts (messages_fts, rowid, content) "
+                "SELECT 'delete', id, old.content FROM messages_fts_keys WHERE message_id = old.id; "
+                "INSERT INTO messages_fts (rowid, content) "
+                "SELECT id, new.content FROM messages_fts_keys WHERE message_id = old.id; END"
+            ))
+
+
+def _match(db: Session, query, terms: str):
+    """Restrict the query to matching messages and return it with a score (higher is better)"""
+    dialect = db.bind.dialect.name
+    if dialect == "postgresql":
+        tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, terms)
+        vector = literal_column(PG_VECTOR)
+        # ts_rank is float4; as float8 it compares exactly with the score a cursor carries
+        return query.filter(vector.op("@@")(tsquery)), cast(func.ts_rank(vector, tsquery), Float(53))
+    if dialect == "mysql":
+        score = mysql_match(Message.content, against=terms).in_natural_language_mode()
+        return query.filter(score), score
+    if dialect == "sqlite":
+        # Every word as a quoted phrase, so user input cannot hit FTS5 query syntax
+        phrase = " ".join('"%s"' % word for word in _WORD.findall(terms))
+        # Matched first and materialized: joined inline, the planner can walk a
+        # room's messages by index and re-run the MATCH for every one of them
+        hits = select(
+            messages_fts_keys.c.message_id,
+            # bm25() is lower for better matches
+            (-func.bm25(literal_column("messages_fts"))).label("score")
+        ).select_from(
+            messages_fts.join(messages_fts_keys, messages_fts_keys.c.id == messages_fts.c.rowid)
+        ).where(
+            messages_fts.c.messages_fts.op("MATCH")(phrase)
+        ).cte("search_hits").prefix_with("MATERIALIZED")
+        return query.join(hits, hits.c.message_id == Message.id), hits.c.score
+    # No native index: substring scan, unranked
+    return query.filter(Message.content.ilike(f"%{terms}%")), literal(0.0)
+
+
+def search_messages(
+    db: Session,
+    user_id: str,
+    terms: str,
+    limit: int,
+    room_id: Optional[str] = None,
+    sender_id: Optional[str] = None,
+    after: Optional[datetime] = None,
+    before: Optional[datetime] = None,
+    cursor: Optional[Tuple[float, datetime, str]] = None,
+) -> List[Tuple[Message, float]]:
+    """
+    Messages matching `terms` that the user can read, best match first
+    (newest first among equal scores), after the (score, created_at, id)
+    cursor if one is given.
+
+    Readable means in a public room or a room the user belongs to, not
+    hidden by the user, not before their clear-chat watermark, and not
+    end-to-end encrypted (the server cannot read those).
+    """
+    query = db.query(Message).join(Room, Room.id == Message.room_id).outerjoin(
+        RoomMember,
+        and_(RoomMember.room_id == Message.room_id, RoomMember.user_id == user_id)
+    ).outerjoin(
+        HiddenMessage,
+        and_(HiddenMessage.message_id == Message.id, HiddenMessage.user_id == user_id)
+    ).filter(
+        or_(Room.is_private == False, RoomMember.id != None),
+        or_(RoomMember.cleared_at == None, Message.created_at > RoomMember.cleared_at),
+        HiddenMessage.id == None,
+        Message.is_encrypted == False
+    )
+
+    if room_id:
+        query = query.filter(Message.room_id == room_id)
+    if sender_id:
+        query = query.filter(Message.user_id == sender_id)
+    if after:
+        query = query.filter(Message.created_at > after)
+    if before:
+        query = query.filter(Message.created_at < before)
+
+    query, score = _match(db, query, terms)
+
+    if cursor:
+        last_score, last_created_at, last_id = cursor
+        query = query.filter(or_(
+            score < last_score,
+            and_(score == last_score, or_(
+                Message.created_at < last_created_at,
+                and_(Message.created_at == last_created_at, Message.id < last_id)
+            ))
+        ))
+
+    return query.add_columns(score.label("score")).order_by(
+        desc("score"), desc(Message.created_at), desc(Message.id)
+    ).limit(limit).all()
@@ -1,3 +1,8 @@
+import json
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from datetime import datetime, timedelta
 from typing import Any, Union, Optional
 from jose import jwt
@@ -11,6 +16,27 @@ from app.database.sql import get_db
 from app.models.sql import User, RoomMember
 from app.config import settings
 from app.schemas.token import TokenPayload
+from app.core.presence import presence
+from app.core.cache import TTLCache
+from app.core.websocket_manager import manager
+
+AUTH_CHANNEL = "auth"
+
+
+@dataclass(frozen=True)
+class Principal:
+    """The user fields authentication and authorization need, cached per worker"""
+    id: str
+    username: str
+    role: str
+    is_active: bool
+    avatar_url: Optional[str] = None
+
+
+# user_id -> Principal
+principal_cache = TTLCache(settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_CACHE_TTL_SECONDS)
+# sha256(token) -> TokenPayload, so repeat requests skip signature verification
+token_cache = TTLCache(settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_CACHE_TTL_SECONDS)
 
 
 async def is_room_admin(
@@ -44,6 +70,51 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     return pwd_context.hash(password)
 
+
+class PasswordHasher:
+    """Runs bcrypt on a small dedicated thread pool.
+
+    Hashing takes 100ms+ of CPU, so it must stay off the event loop. The
+    pool is kept small so a login burst cannot take every core from chat
+    delivery, and once PASSWORD_HASH_MAX_PENDING calls are running or
+    queued further requests get a 503 instead of waiting indefinitely.
+    """
+
+    def __init__(self):
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.PASSWORD_HASH_WORKERS,
+            thread_name_prefix="password-hash"
+        )
+        # Only touched from the event loop thread
+        self.pending = 0
+        self.rejected = 0
+
+    async def _run(self, fn, *args):
+        if self.pending >= settings.PASSWORD_HASH_MAX_PENDING:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server is busy, please try again shortly",
+                headers={"Retry-After": "1"},
+            )
+        self.pending += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False)
+
+
+password_hasher = PasswordHasher()
+
 # Create access token
 def create_access_token(subject: Union[str, Any], expires_delta: Optional[timedelta] = None) -> str:
     if expires_delta:
@@ -55,42 +126,75 @@ def create_access_token(subject: Union[str, Any], expires_delta: Optional[timede
     encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm="HS256")
     return encoded_jwt
 
-# Get current user from token
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-) -> User:
-    try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
-        token_data = TokenPayload(**payload)
-        if datetime.fromtimestamp(token_data.exp) < datetime.now():
+def decode_access_token(token: str) -> TokenPayload:
+    """Verify a JWT and return its payload, reusing earlier verifications of the same token"""
+    key = hashlib.sha256(token.encode()).hexdigest()
+    token_data = token_cache.get(key)
+    if token_data is None:
+        try:
+            payload = jwt.decode(token, settings.SECRET_KEY, algorithms=["HS256"])
+            token_data = TokenPayload(**payload)
+        except (jwt.JWTError, ValidationError):
             raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Token expired",
+                status_code=status.HTTP_403_FORBIDDEN,
+                detail="Could not validate credentials",
                 headers={"WWW-Authenticate": "Bearer"},
             )
-    except (jwt.JWTError, ValidationError):
+        token_cache.set(key, token_data)
+
+    # Checked on every use since a cached token can expire while in the cache
+    if datetime.fromtimestamp(token_data.exp) < datetime.now():
         raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Could not validate credentials",
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Token expired",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    user = db.query(User).filter(User.id == token_data.sub).first()
+    return token_data
+
+def load_principal(db: Session, user_id: str) -> Optional[Principal]:
+    """Return the cached principal for a user, loading it on a miss"""
+    principal = principal_cache.get(user_id)
+    if principal is None:
+        row = db.query(
+            User.id, User.username, User.role, User.is_active, User.avatar_url
+        ).filter(User.id == user_id).first()
+        if not row:
+            return None
+        principal = Principal(*row)
+        principal_cache.set(user_id, principal)
+    return principal
+
+async def invalidate_principal(user_id: str):
+    """Drop a user's cached principal on every worker after its row changes"""
+    principal_cache.invalidate(str(user_id))
+    await manager.publish_event(AUTH_CHANNEL, {"user_id": str(user_id)})
+
+def _on_principal_changed(data: str):
+    principal_cache.invalidate(json.loads(data)["user_id"])
+
+manager.on_channel(AUTH_CHANNEL, _on_principal_changed)
+
+# Get current user from token
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+) -> Principal:
+    token_data = decode_access_token(token)
+
+    user = load_principal(db, token_data.sub)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="User not found"
         )
     
-    # Update last seen
-    user.last_seen = datetime.utcnow()
-    db.commit()
+    # Update last seen (buffered and written in bulk, so reads stay read-only)
+    presence.touch(user.id)
     
     return user
 
 # Get current active user
-async def get_current_active_user(current_user: User = Depends(get_current_user)) -> User:
+async def get_current_active_user(current_user: Principal = Depends(get_current_user)) -> Principal:
     if not current_user.is_active:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -98,7 +202,23 @@ async def get_current_active_user(current_user: User = Depends(get_current_user)
         )
     return current_user
 
-async def is_moderator_or_admin(current_user: User = Depends(get_current_active_user)) -> User:
+async def get_current_db_user(
+    current_user: Principal = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+) -> User:
+    """
+    Dependency returning the current user's full row, for handlers that
+    modify the user or return profile fields the principal does not carry.
+    """
+    user = db.get(User, current_user.id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="User not found"
+        )
+    return user
+
+async def is_moderator_or_admin(current_user: Principal = Depends(get_current_active_user)) -> Principal:
     """
     Dependency to check if the current user is a moderator or an admin.
     """
@@ -109,7 +229,7 @@ async def is_moderator_or_admin(current_user: User = Depends(get_current_active_
         )
     return current_user
 
-async def is_admin(current_user: User = Depends(get_current_active_user)) -> User:
+async def is_admin(current_user: Principal = Depends(get_current_active_user)) -> Principal:
     """
     Dependency to check if the current user is an admin.
     """
@@ -122,7 +242,7 @@ async def is_admin(current_user: User = Depends(get_current_active_user)) -> Use
 
 async def is_room_admin(
     room_id: str,
-    current_user: User = Depends(get_current_active_user),
+    current_user: Principal = Depends(get_current_active_user),
     db: Session = Depends(get_db)
 ) -> RoomMember:
     """
@@ -0,0 +1,110 @@
+import json
+import asyncio
+import logging
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database.sql import run_db
+from app.models.sql import SystemSetting
+from app.core.websocket_manager import manager
+
+logger = logging.getLogger(__name__)
+
+SETTINGS_CHANNEL = "system_settings"
+
+
+class SystemSettingsCache:
+    """In-process copy of the system_settings table.
+
+    Loaded at startup and updated in place when this worker writes a
+    setting. Other workers hear about writes on the backplane, and a
+    periodic version check (row count + newest updated_at) catches
+    anything a notification missed.
+    """
+
+    def __init__(self):
+        self.values: Dict[str, str] = {}
+        self.version: Optional[Tuple] = None
+        self.refresh_task: Optional[asyncio.Task] = None
+        # name -> callbacks run on the event loop after the value changes
+        self.watchers: Dict[str, List[Callable[[Optional[str]], None]]] = {}
+
+    def get(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        return self.values.get(name, default)
+
+    def is_true(self, name: str) -> bool:
+        return self.values.get(name) == "true"
+
+    def watch(self, name: str, callback: Callable[[Optional[str]], None]):
+        """Call callback(value) on this worker whenever the setting changes"""
+        self.watchers.setdefault(name, []).append(callback)
+
+    def _notify(self, names):
+        for name in names:
+            for callback in self.watchers.get(name, ()):
+                callback(self.values.get(name))
+
+    def _version(self, db: Session) -> Tuple:
+        count, newest = db.query(func.count(SystemSetting.id), func.max(SystemSetting.updated_at)).one()
+        return (count, newest)
+
+    def load(self, db: Session) -> List[str]:
+        """Replace the cache with the current table contents and return the names that changed"""
+        values = {row.name: row.value for row in db.query(SystemSetting).all()}
+        changed = [name for name in values.keys() | self.values.keys() if values.get(name) != self.values.get(name)]
+        self.values = values
+        self.version = self._version(db)
+        return changed
+
+    def _refresh_if_changed(self, db: Session) -> List[str]:
+        if self._version(db) != self.version:
+            return self.load(db)
+        return []
+
+    def write(self, db: Session, name: str, value: str):
+        """Persist a setting and update this worker's cache"""
+        setting = db.query(SystemSetting).filter(SystemSetting.name == name).first()
+        if not setting:
+            setting = SystemSetting(name=name, value=value, is_enabled=True)
+            db.add(setting)
+        else:
+            setting.value = value
+        setting.updated_at = datetime.utcnow()
+        db.commit()
+        self.values[name] = value
+
+    async def set(self, db: Session, name: str, value: str):
+        """Write a setting and notify every other worker"""
+        self.write(db, name, value)
+        self._notify([name])
+        await manager.publish_event(SETTINGS_CHANNEL, {"name": name, "value": value})
+
+    def _on_change(self, data: str):
+        event = json.loads(data)
+        if self.values.get(event["name"]) != event["value"]:
+            self.values[event["name"]] = event["value"]
+            self._notify([event["name"]])
+
+    async def _refresh_loop(self):
+        while True:
+            await asyncio.sleep(settings.SYSTEM_SETTINGS_REFRESH_SECONDS)
+            try:
+                self._notify(await run_db(self._refresh_if_changed))
+            except Exception as e:
+                logger.error(f"System settings refresh failed: {e}")
+
+    async def start(self):
+        await run_db(self.load)
+        self.refresh_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self.refresh_task:
+            self.refresh_task.cancel()
+
+
+system_settings = SystemSettingsCache()
+manager.on_channel(SETTINGS_CHANNEL, system_settings._on_change)
@@ -1,8 +1,80 @@
 import json
-from typing import Dict, List, Set, Optional, Union
-from fastapi import WebSocket, WebSocketDisconnect
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Set, Optional
+from fastapi import WebSocket, status
 from datetime import datetime
 import asyncio
+import logging
+
+from app.config import settings
+from app.core.backplane import Backplane, InMemoryBackplane, create_backplane
+
+try:
+    import orjson
+except ImportError:  # Fall back to the stdlib encoder
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+def encode_frame(message: dict) -> str:
+    """Serialize a message once into the text frame written to every recipient"""
+    if orjson is not None:
+        return orjson.dumps(message).decode("utf-8")
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+# Backplane channels: one per room, one per user, and one for everyone
+BROADCAST_CHANNEL = "broadcast"
+
+def room_channel(room_id: str) -> str:
+    return f"room:{room_id}"
+
+def user_channel(user_id: str) -> str:
+    return f"user:{user_id}"
+
+
+class LatencyStats:
+    """Rolling window of enqueue-to-send latencies (in seconds)"""
+
+    def __init__(self, window: int = 10000):
+        self.samples: Deque[float] = deque(maxlen=window)
+        self.count = 0
+
+    def record(self, latency: float):
+        self.samples.append(latency)
+        self.count += 1
+
+    def percentile(self, pct: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "p50_ms": round(self.percentile(50) * 1000, 3),
+            "p99_ms": round(self.percentile(99) * 1000, 3),
+            "max_ms": round(max(self.samples, default=0.0) * 1000, 3),
+        }
+
+
+class ClientConnection:
+    """Outbound side of a single WebSocket: a bounded queue drained by its own writer task"""
+
+    def __init__(self, websocket: WebSocket, user_id: str):
+        self.websocket = websocket
+        self.user_id = user_id
+        # Rooms this socket currently receives broadcasts for
+        self.rooms: Set[str] = set()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_SEND_QUEUE_SIZE)
+        self.writer_task: Optional[asyncio.Task] = None
+        self.closed = False
+        # Multiplexed sockets (/ws) stay open with zero rooms subscribed
+        self.multiplexed = False
 
 
 class ConnectionManager:
@@ -13,20 +85,72 @@ class ConnectionManager:
         self.active_connections: Dict[str, Set[WebSocket]] = {}
         # User connections: user_id -> {room_id: WebSocket}
         self.user_connections: Dict[str, Dict[str, WebSocket]] = {}
+        # Multiplexed sockets: user_id -> sockets, which get the user's frames even with no rooms
+        self.user_sockets: Dict[str, Set[WebSocket]] = {}
         # Typing status: room_id -> {user_id: timestamp}
         self.typing_status: Dict[str, Dict[str, datetime]] = {}
+        # Outbound state per socket: WebSocket -> ClientConnection
+        self.connections: Dict[WebSocket, ClientConnection] = {}
+        # Fan-out metrics
+        self.send_latency = LatencyStats()
+        self.evicted_connections = 0
+        # Every broadcast is published here and delivered back by _deliver
+        self.backplane: Backplane = InMemoryBackplane()
+        self.backplane.set_handler(self._deliver)
+        # Internal (non-socket) channels: channel -> callback(data)
+        self.listeners: Dict[str, Callable[[str], None]] = {}
+
+    async def start(self):
+        """Connect the configured backplane (called on application startup)"""
+        self.backplane = create_backplane()
+        self.backplane.set_handler(self._deliver)
+        await self.backplane.start()
+        await self.backplane.subscribe(BROADCAST_CHANNEL)
+        for channel in self.listeners:
+            await self.backplane.subscribe(channel)
+
+    def on_channel(self, channel: str, callback: Callable[[str], None]):
+        """Register an in-process listener for a worker-wide event channel"""
+        self.listeners[channel] = callback
+
+    async def publish_event(self, channel: str, event: dict):
+        """Publish an event to the listeners of a channel on every worker"""
+        await self.backplane.publish(channel, encode_frame(event))
+
+    async def stop(self):
+        await self.backplane.stop()
     
     async def connect(self, websocket: WebSocket, room_id: str, user_id: str):
         """Connect a user to a room"""
         await websocket.accept()
+        self._register(websocket, user_id)
+        await self.subscribe(websocket, room_id, user_id)
+
+    async def connect_multiplexed(self, websocket: WebSocket, user_id: str):
+        """Accept a socket that carries any number of rooms for one user"""
+        await websocket.accept()
+        self._register(websocket, user_id).multiplexed = True
+        if not self._watching_user(user_id):
+            await self.backplane.subscribe(user_channel(user_id))
+        self.user_sockets.setdefault(user_id, set()).add(websocket)
+
+    async def subscribe(self, websocket: WebSocket, room_id: str, user_id: str):
+        """Start delivering a room's broadcasts to an accepted socket"""
+        connection = self.connections.get(websocket)
+        if connection is None or room_id in connection.rooms:
+            return
+        connection.rooms.add(room_id)
         
         # Add connection to room connections
         if room_id not in self.active_connections:
             self.active_connections[room_id] = set()
+            await self.backplane.subscribe(room_channel(room_id))
         self.active_connections[room_id].add(websocket)
         
         # Add connection to user connections
         if user_id not in self.user_connections:
+            if not self._watching_user(user_id):
+                await self.backplane.subscribe(user_channel(user_id))
             self.user_connections[user_id] = {}
         self.user_connections[user_id][room_id] = websocket
         
@@ -38,45 +162,185 @@ class ConnectionManager:
     
     def disconnect(self, websocket: WebSocket, room_id: str, user_id: str):
         """Disconnect a user from a room"""
+        self.unsubscribe(websocket, room_id, user_id)
+
+        # Per-room sockets are done once their room is gone
+        connection = self.connections.get(websocket)
+        if connection and not connection.rooms and not connection.multiplexed:
+            self._release(connection)
+
+    def disconnect_all(self, websocket: WebSocket) -> List[str]:
+        """Remove a socket from every room it is subscribed to; returns those rooms"""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            return []
+        rooms = list(connection.rooms)
+        for room_id in rooms:
+            self.unsubscribe(websocket, room_id, connection.user_id)
+        self._release(connection)
+        return rooms
+
+    def unsubscribe(self, websocket: WebSocket, room_id: str, user_id: str):
+        """Stop delivering a room's broadcasts to a socket"""
         # Remove from room connections
         if room_id in self.active_connections:
             self.active_connections[room_id].discard(websocket)
             if not self.active_connections[room_id]:
                 del self.active_connections[room_id]
+                self.backplane.unsubscribe(room_channel(room_id))
         
         # Remove from user connections
-        if user_id in self.user_connections and room_id in self.user_connections[user_id]:
+        if user_id in self.user_connections and self.user_connections[user_id].get(room_id) is websocket:
             del self.user_connections[user_id][room_id]
             if not self.user_connections[user_id]:
                 del self.user_connections[user_id]
+                if not self._watching_user(user_id):
+                    self.backplane.unsubscribe(user_channel(user_id))
         
         # Clear typing status
         if room_id in self.typing_status and user_id in self.typing_status[room_id]:
             del self.typing_status[room_id][user_id]
     
+        connection = self.connections.get(websocket)
+        if connection:
+            connection.rooms.discard(room_id)
+
+    def _watching_user(self, user_id: str) -> bool:
+        """Whether this worker already listens on the user's channel"""
+        return user_id in self.user_connections or user_id in self.user_sockets
+
+    def _register(self, websocket: WebSocket, user_id: str) -> ClientConnection:
+        """Create the outbound queue and writer task for a socket"""
+        connection = self.connections.get(websocket)
+        if connection is None:
+            connection = ClientConnection(websocket, user_id)
+            connection.writer_task = asyncio.create_task(self._writer(connection))
+            self.connections[websocket] = connection
+        return connection
+
+    def _release(self, connection: ClientConnection):
+        """Drop a socket's outbound state and stop its writer task"""
+        connection.closed = True
+        self.connections.pop(connection.websocket, None)
+        sockets = self.user_sockets.get(connection.user_id)
+        if sockets is not None and connection.websocket in sockets:
+            sockets.discard(connection.websocket)
+            if not sockets:
+                del self.user_sockets[connection.user_id]
+                if not self._watching_user(connection.user_id):
+                    self.backplane.unsubscribe(user_channel(connection.user_id))
+        task = connection.writer_task
+        if task and not task.done() and task is not asyncio.current_task():
+            task.cancel()
+
+    async def _writer(self, connection: ClientConnection):
+        """Drain a connection's queue, evicting it if a send stalls or fails"""
+        websocket = connection.websocket
+        while True:
+            enqueued_at, frame = await connection.queue.get()
+            try:
+                await asyncio.wait_for(websocket.send_text(frame), timeout=settings.WS_SEND_TIMEOUT_SECONDS)
+            except asyncio.CancelledError:
+                raise
+            except asyncio.TimeoutError:
+                self._evict(connection, "send timed out")
+                return
+            except Exception:
+                self._evict(connection, "send failed")
+                return
+            self.send_latency.record(time.perf_counter() - enqueued_at)
+
+    def _enqueue(self, websocket: WebSocket, frame: str):
+        """Queue a pre-encoded frame for a socket without waiting on the network"""
+        connection = self.connections.get(websocket)
+        if connection is None or connection.closed:
+            return
+        try:
+            connection.queue.put_nowait((time.perf_counter(), frame))
+        except asyncio.QueueFull:
+            self._evict(connection, "outbound queue full")
+
+    def _evict(self, connection: ClientConnection, reason: str):
+        """Remove a slow or dead consumer from every room and close its socket"""
+        if connection.closed:
+            return
+        logger.warning(f"Evicting WebSocket for user {connection.user_id}: {reason}")
+        self.evicted_connections += 1
+        self.disconnect_all(connection.websocket)
+        asyncio.create_task(self._close(connection.websocket))
+
+    async def _close(self, websocket: WebSocket, code: int = status.WS_1013_TRY_AGAIN_LATER, reason: str = ""):
+        try:
+            await asyncio.wait_for(
+                websocket.close(code=code, reason=reason),
+                timeout=settings.WS_SEND_TIMEOUT_SECONDS
+            )
+        except Exception:
+            pass
+
+    def kick(self, user_id: str, room_id: Optional[str] = None, reason: str = ""):
+        """Close a user's sockets on this worker, or only drop them from one room.
+
+        Multiplexed sockets stay open and are just unsubscribed from the room.
+        """
+        for connection in list(self.connections.values()):
+            if connection.user_id != user_id or connection.closed:
+                continue
+            if room_id is None or (not connection.multiplexed and room_id in connection.rooms):
+                self.disconnect_all(connection.websocket)
+                asyncio.create_task(self._close(connection.websocket, status.WS_1008_POLICY_VIOLATION, reason))
+            elif room_id in connection.rooms:
+                self.unsubscribe(connection.websocket, room_id, user_id)
+                self._enqueue(connection.websocket, encode_frame({
+                    "type": "unsubscribed",
+                    "room_id": room_id,
+                    "reason": reason
+                }))
+
+    async def send_to_connection(self, websocket: WebSocket, message: dict):
+        """Send a message to one socket through its writer queue"""
+        self._enqueue(websocket, encode_frame(message))
+
+    def _deliver(self, channel: str, data: str):
+        """Fan a frame received from the backplane out to this worker's sockets"""
+        if channel in self.listeners:
+            self.listeners[channel](data)
+            return
+        if channel == BROADCAST_CHANNEL:
+            targets = list(self.connections)
+        elif channel.startswith("room:"):
+            # Copy first: an overflowing queue evicts its socket from this set
+            targets = list(self.active_connections.get(channel[5:], ()))
+        elif channel.startswith("user:"):
+            # User frames carry an optional target room ahead of the frame
+            room_id, data = data.split("\n", 1)
+            sockets = self.user_connections.get(channel[5:], {})
+            if room_id:
+                targets = [sockets[room_id]] if room_id in sockets else []
+            else:
+                targets = list(set(sockets.values()) | self.user_sockets.get(channel[5:], set()))
+        else:
+            return
+        for websocket in targets:
+            self._enqueue(websocket, data)
+
+    async def _publish_to_user(self, user_id: str, frame: str, room_id: Optional[str] = None):
+        await self.backplane.publish(user_channel(user_id), f"{room_id or ''}\n{frame}")
+
     async def broadcast_to_room(self, room_id: str, message: dict):
         """Send a message to all connected users in a room"""
-        if room_id in self.active_connections:
-            disconnected_websockets = set()
-            for websocket in self.active_connections[room_id]:
-                try:
-                    await websocket.send_json(message)
-                except WebSocketDisconnect:
-                    disconnected_websockets.add(websocket)
+        # Tag frames with their room so multiplexed clients can route them
+        if "room_id" not in message:
+            message = {**message, "room_id": room_id}
+        await self.backplane.publish(room_channel(room_id), encode_frame(message))
             
-            # Clean up any disconnected WebSockets
-            for websocket in disconnected_websockets:
-                self.active_connections[room_id].discard(websocket)
-                
-    async def notify_message_read(self, room_id: str, message_id: str, user_id: str):
-        """Notify all users in a room that a message has been read"""
+    async def notify_read_progress(self, room_id: str, positions: List[dict]):
+        """Tell a room how far members have read: one frame for any number of readers"""
         await self.broadcast_to_room(
             room_id=room_id,
             message={
-                "type": "message_read",
-                "message_id": message_id,
-                "user_id": user_id,
-                "timestamp": datetime.now().isoformat()
+                "type": "read_progress",
+                "positions": positions
             }
         )
         
@@ -95,12 +359,9 @@ class ConnectionManager:
     
     async def send_personal_message(self, user_id: str, room_id: str, message: dict):
         """Send a message to a specific user in a room"""
-        if user_id in self.user_connections and room_id in self.user_connections[user_id]:
-            websocket = self.user_connections[user_id][room_id]
-            try:
-                await websocket.send_json(message)
-            except WebSocketDisconnect:
-                self.disconnect(websocket, room_id, user_id)
+        if "room_id" not in message:
+            message = {**message, "room_id": room_id}
+        await self._publish_to_user(user_id, encode_frame(message), room_id)
     
     async def set_typing_status(self, room_id: str, user_id: str, is_typing: bool):
         """Update typing status for a user in a room"""
@@ -122,11 +383,8 @@ class ConnectionManager:
     
     async def send_direct_message(self, sender_id: str, recipient_id: str, message: dict):
         """Send a direct message to another user"""
-        for room_id, websocket in self.user_connections.get(recipient_id, {}).items():
-            try:
-                await websocket.send_json({**message, "type": "direct_message", "sender_id": sender_id})
-            except WebSocketDisconnect:
-                self.disconnect(websocket, room_id, recipient_id)
+        frame = encode_frame({**message, "type": "direct_message", "sender_id": sender_id})
+        await self._publish_to_user(recipient_id, frame)
                 
     async def broadcast_to_rooms(self, room_ids: List[str], message: dict):
         """Send a message to multiple rooms (for admin broadcasting)"""
@@ -135,13 +393,10 @@ class ConnectionManager:
             
     async def broadcast_to_all(self, message: dict):
         """Send a message to all connected users across all rooms (for system announcements)"""
-        tasks = []
-        for room_id in self.active_connections:
-            tasks.append(self.broadcast_to_room(room_id, message))
-        await asyncio.gather(*tasks)
+        await self.backplane.publish(BROADCAST_CHANNEL, encode_frame(message))
     
     def get_online_users(self, room_id: Optional[str] = None) -> List[str]:
-        """Get a list of online users, optionally filtered by room"""
+        """Get a list of online users on this worker, optionally filtered by room"""
         if room_id:
             # Get users in a specific room
             online_users = set()
@@ -151,7 +406,17 @@ class ConnectionManager:
             return list(online_users)
         else:
             # Get all online users
-            return list(self.user_connections.keys())
+            return list(set(self.user_connections) | set(self.user_sockets))
+
+    def get_stats(self) -> dict:
+        """Fan-out health: connection counts, queue depth and send latency"""
+        return {
+            "connections": len(self.connections),
+            "rooms": len(self.active_connections),
+            "queued_messages": sum(c.queue.qsize() for c in self.connections.values()),
+            "evicted_connections": self.evicted_connections,
+            "send_latency": self.send_latency.snapshot(),
+        }
 
 
 # Create a global instance of the connection manager
@@ -0,0 +1,159 @@
+import logging
+from typing import Callable, List, Set
+
+from sqlalchemy import Index, func, inspect, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from sqlalchemy.orm import Session
+
+from app.database.sql import Base, SessionLocal
+from app.models.sql import Message, Room, RoomMember, HiddenMessage, SchemaMigration
+from app.core.search import create_search_index
+
+logger = logging.getLogger(__name__)
+
+# There is no migration tool: create_all only creates missing tables, so
+# columns and indexes added to existing tables, and data rewrites, are
+# applied by the steps below. Each step runs once per database (recorded
+# in schema_migrations) and is written to be safe if two workers starting
+# together both run it: DDL that loses that race fails, and is accepted
+# once a fresh look at the schema shows the other worker's change.
+
+
+def _index_names(engine: Engine, table_name: str) -> Set[str]:
+    return {ix["name"] for ix in inspect(engine).get_indexes(table_name)}
+
+
+def _column_names(engine: Engine, table_name: str) -> Set[str]:
+    return {column["name"] for column in inspect(engine).get_columns(table_name)}
+
+
+def _create_index(engine: Engine, index: Index):
+    if index.name in _index_names(engine, index.table.name):
+        return
+    logger.info(f"Creating index {index.name}")
+    try:
+        index.create(bind=engine)
+    except DBAPIError:
+        # A worker starting alongside this one created it between the check and here
+        if index.name not in _index_names(engine, index.table.name):
+            raise
+
+
+def _add_column(engine: Engine, model, column_name: str):
+    """ALTER TABLE ADD COLUMN for a nullable column declared on the model"""
+    table = model.__table__
+    if column_name in _column_names(engine, table.name):
+        return
+    column_type = table.c[column_name].type.compile(dialect=engine.dialect)
+    logger.info(f"Adding column {table.name}.{column_name}")
+    try:
+        with engine.begin() as conn:
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column_name} {column_type}"))
+    except DBAPIError:
+        # Duplicate column: another worker added it between the check and here
+        if column_name not in _column_names(engine, table.name):
+            raise
+
+
+def add_message_keyset_index(engine: Engine):
+    """messages(room_id, created_at, id) backs keyset pagination of room history"""
+    for index in Message.__table__.indexes:
+        if index.name == "ix_messages_room_created_id":
+            _create_index(engine, index)
+
+
+def add_room_member_cleared_at(engine: Engine):
+    _add_column(engine, RoomMember, "cleared_at")
+
+
+def add_room_member_last_read_message_id(engine: Engine):
+    _add_column(engine, RoomMember, "last_read_message_id")
+
+
+def add_room_archive_columns(engine: Engine):
+    for column_name in ("archive_after_days", "archived_until", "archived_until_id"):
+        _add_column(engine, Room, column_name)
+
+
+def collapse_cleared_rooms(engine: Engine):
+    """
+    Replace per-message hidden rows left by the old clear-chat with a
+    cleared_at watermark, wherever a member hid every message in a room
+    up to their newest hidden one.
+    """
+    db: Session = SessionLocal()
+    try:
+        groups = db.query(
+            HiddenMessage.user_id, Message.room_id, func.count(HiddenMessage.id), func.max(Message.created_at)
+        ).join(Message, Message.id == HiddenMessage.message_id).group_by(HiddenMessage.user_id, Message.room_id).all()
+
+        collapsed = 0
+        for user_id, room_id, hidden_count, newest_hidden in groups:
+            member = db.query(RoomMember).filter(RoomMember.room_id == room_id, RoomMember.user_id == user_id).first()
+            if not member:
+                continue
+            room_count = db.query(func.count(Message.id)).filter(
+                Message.room_id == room_id,
+                Message.created_at <= newest_hidden
+            ).scalar()
+            if hidden_count < room_count:
+                continue
+
+            if member.cleared_at is None or member.cleared_at < newest_hidden:
+                member.cleared_at = newest_hidden
+            covered = db.query(Message.id).filter(Message.room_id == room_id, Message.created_at <= newest_hidden)
+            db.query(HiddenMessage).filter(
+                HiddenMessage.user_id == user_id,
+                HiddenMessage.message_id.in_(covered)
+            ).delete(synchronize_session=False)
+            db.commit()
+            collapsed += 1
+
+        if collapsed:
+            logger.info(f"Collapsed {collapsed} cleared rooms into watermarks")
+    finally:
+        db.close()
+
+
+def add_message_search_index(engine: Engine):
+    """Native full-text index on messages.content (GIN, FULLTEXT or FTS5 by dialect)"""
+    logger.info("Creating message full-text index")
+    create_search_index(engine)
+
+
+def rekey_message_search_index(engine: Engine):
+    """SQLite: key the FTS5 index by an explicit INTEGER id rather than messages.rowid"""
+    create_search_index(engine)
+
+
+MIGRATIONS: List[Callable[[Engine], None]] = [
+    add_message_keyset_index,
+    add_room_member_cleared_at,
+    collapse_cleared_rooms,
+    add_message_search_index,
+    add_room_member_last_read_message_id,
+    add_room_archive_columns,
+    rekey_message_search_index,
+]
+
+
+def run_migrations(engine: Engine):
+    """Create missing tables, then apply every step not yet recorded"""
+    Base.metadata.create_all(bind=engine)
+
+    db: Session = SessionLocal()
+    try:
+        applied = {name for (name,) in db.query(SchemaMigration.name).all()}
+        for step in MIGRATIONS:
+            if step.__name__ in applied:
+                continue
+            step(engine)
+            db.add(SchemaMigration(name=step.__name__))
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another worker recorded it first
+                db.rollback()
+    finally:
+        db.close()
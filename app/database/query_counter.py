@@ -0,0 +1,42 @@
+import logging
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCount:
+    """SQL statements executed on behalf of one request (or one `count_queries` block)"""
+
+    def __init__(self):
+        self.statements = 0
+
+
+# Holds a mutable counter rather than an int, so statements run in the
+# threadpool (which works on a copy of the context) still add to it
+_current: ContextVar[Optional[QueryCount]] = ContextVar("query_count", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    count = _current.get()
+    if count is not None:
+        count.statements += 1
+
+
+def install(engine: Engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryCount]:
+    """Count the statements executed inside the block (and anything it awaits or runs in the threadpool)"""
+    count = QueryCount()
+    token = _current.set(count)
+    try:
+        yield count
+    finally:
+        _current.reset(token)
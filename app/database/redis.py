@@ -0,0 +1,34 @@
+import logging
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class RedisClient:
+    client = None
+
+    def get_client(self):
+        """Lazily create the shared asyncio Redis client"""
+        if self.client is None:
+            # Imported here so Redis stays optional for single-process deployments
+            import redis.asyncio as aioredis
+
+            self.client = aioredis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                password=settings.REDIS_PASSWORD or None,
+                decode_responses=True,
+            )
+        return self.client
+
+    async def close(self):
+        if self.client:
+            await self.client.close()
+            self.client = None
+            logger.info("Redis connection closed")
+
+redis_client = RedisClient()
+
+def get_redis():
+    return redis_client.get_client()
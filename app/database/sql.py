@@ -1,6 +1,9 @@
+from datetime import datetime
+
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
 import urllib.parse
 import os
 from dotenv import load_dotenv
@@ -32,9 +35,36 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+def stored_utcnow() -> datetime:
+    """utcnow() at the precision DateTime columns keep (MySQL DATETIME has no fractional seconds).
+
+    Use it for timestamps that are assigned in the app and then used as
+    they are (broadcast, cached, put in cursors) without reading them back.
+    """
+    now = datetime.utcnow()
+    if engine.dialect.name == "mysql":
+        now = now.replace(microsecond=0)
+    return now
+
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+def run_with_session(fn, *args, **kwargs):
+    """Call fn(db, *args, **kwargs) with a session that is closed right after"""
+    db = SessionLocal()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
+
+async def run_db(fn, *args, **kwargs):
+    """Run blocking database work in the threadpool with its own short-lived session.
+
+    Long-lived handlers (WebSockets) use this instead of holding a pooled
+    connection for their whole lifetime.
+    """
+    return await run_in_threadpool(run_with_session, fn, *args, **kwargs)
@@ -10,8 +10,21 @@ from sqlalchemy.orm import Session
 from app.config import settings
 # from app.database.mongodb import mongodb # Removed
 from app.database.sql import engine, Base, get_db, SessionLocal
-from app.core.security import get_password_hash
+from app.core.security import get_password_hash, password_hasher
 from app.models.sql import User # SQL Model
+from app.core.websocket_manager import manager
+from app.core.system_settings import system_settings
+from app.core.message_writer import message_writer
+from app.core.presence import presence
+from app.core.sanctions import sanctions
+from app.core.scheduler import scheduler
+from app.core.reactions import reaction_broadcaster
+from app.core.read_receipts import read_receipts
+from app.core.archive import archiver
+from app.core.moderation import rate_limiter, profanity_filter
+from app.database.redis import redis_client
+from app.database.migrations import run_migrations
+from app.database import query_counter
 
 # Create directories if they don't exist
 os.makedirs(settings.UPLOAD_DIR, exist_ok=True)
@@ -32,8 +45,21 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-SQL-Queries"],
 )
 
+async def count_sql_queries(request: Request, call_next):
+    """Count the SQL statements a request runs, for tests and query-count regressions"""
+    with query_counter.count_queries() as count:
+        response = await call_next(request)
+    response.headers["X-SQL-Queries"] = str(count.statements)
+    return response
+
+# Off by default, so normal requests pay for neither the middleware nor the engine hook
+if settings.SQL_QUERY_COUNT_HEADER:
+    query_counter.install(engine)
+    app.middleware("http")(count_sql_queries)
+
 # Mount static files for uploads
 app.mount("/uploads", StaticFiles(directory=settings.UPLOAD_DIR), name="uploads")
 
@@ -119,4 +145,34 @@ def create_admin_on_startup():
             db.commit()
             print("Default admin user created successfully.")
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+@app.on_event("startup")
+async def start_services():
+    run_migrations(engine)
+    await manager.start()
+    await system_settings.start()
+    await profanity_filter.start()
+    await sanctions.start()
+    await message_writer.start()
+    await presence.start()
+    await rate_limiter.start()
+    await scheduler.start()
+    await reaction_broadcaster.start()
+    await read_receipts.start()
+    await archiver.start()
+
+@app.on_event("shutdown")
+async def stop_services():
+    await scheduler.stop()
+    await reaction_broadcaster.stop()
+    await read_receipts.stop()
+    await archiver.stop()
+    await rate_limiter.stop()
+    await sanctions.stop()
+    await presence.stop()
+    await message_writer.stop()
+    await system_settings.stop()
+    await manager.stop()
+    await redis_client.close()
+    password_hasher.shutdown()
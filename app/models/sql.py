@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime, Text
+from sqlalchemy import Boolean, Column, ForeignKey, Index, Integer, LargeBinary, String, DateTime, Text, UniqueConstraint
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from app.database.sql import Base
@@ -42,6 +42,11 @@ class Room(Base):
     is_temporary = Column(Boolean, default=False)
     expires_at = Column(DateTime, nullable=True)
     last_activity = Column(DateTime, default=datetime.utcnow)
+    # History older than this many days moves to archive segments (None for the server default, 0 to keep it all hot)
+    archive_after_days = Column(Integer, nullable=True)
+    # Newest archived message: everything up to (archived_until, archived_until_id) is in segments
+    archived_until = Column(DateTime, nullable=True)
+    archived_until_id = Column(String(36), nullable=True)
 
     creator = relationship("User", back_populates="rooms_created")
     messages = relationship("Message", back_populates="room")
@@ -55,9 +60,13 @@ class RoomMember(Base):
     user_id = Column(String(36), ForeignKey("users.id"))
     role = Column(String(50), default="member")
     joined_at = Column(DateTime, default=datetime.utcnow)
+    # Read position: messages up to (last_read_at, last_read_message_id) are read; with no
+    # message id, everything created up to last_read_at is
     last_read_at = Column(DateTime, default=datetime.utcnow)
+    last_read_message_id = Column(String(36), nullable=True)
     is_muted = Column(Boolean, default=False)
     muted_until = Column(DateTime, nullable=True)
+    cleared_at = Column(DateTime, nullable=True)  # Messages up to here were cleared by this member
 
     room = relationship("Room", back_populates="members")
     user = relationship("User", back_populates="memberships")
@@ -77,6 +86,32 @@ class Message(Base):
     room = relationship("Room", back_populates="messages")
     sender = relationship("User", back_populates="messages")
 
+    __table_args__ = (
+        # Keyset pagination of room history walks this index
+        Index("ix_messages_room_created_id", "room_id", "created_at", "id"),
+    )
+
+class MessageArchiveSegment(Base):
+    """A run of a room's oldest messages, moved out of messages and stored compressed"""
+    __tablename__ = "message_archive_segments"
+
+    id = Column(String(36), primary_key=True, default=generate_uuid)
+    room_id = Column(String(36), ForeignKey("rooms.id", ondelete="CASCADE"))
+    # Keys of the first and last message held, oldest first; segments of a room never overlap
+    first_created_at = Column(DateTime)
+    first_message_id = Column(String(36))
+    last_created_at = Column(DateTime)
+    last_message_id = Column(String(36))
+    message_count = Column(Integer)
+    user_ids = Column(Text)  # Space-separated senders, so an account deletion can find its segments
+    codec = Column(String(20), default="zlib")
+    data = Column(LargeBinary)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_message_archive_segments_room_last", "room_id", "last_created_at", "last_message_id"),
+    )
+
 class SystemSetting(Base):
     __tablename__ = "system_settings"
 
@@ -86,6 +121,17 @@ class SystemSetting(Base):
     is_enabled = Column(Boolean, default=True)
     updated_at = Column(DateTime, default=datetime.utcnow)
 
+class UserBan(Base):
+    __tablename__ = "user_bans"
+
+    id = Column(String(36), primary_key=True, default=generate_uuid)
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    room_id = Column(String(36), ForeignKey("rooms.id", ondelete="CASCADE"), nullable=True)  # None for a platform-wide ban
+    banned_by = Column(String(36), ForeignKey("users.id"), nullable=True)
+    reason = Column(String(500), nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, nullable=True)  # None for a permanent ban
+
 class HiddenMessage(Base):
     __tablename__ = "hidden_messages"
     
@@ -98,3 +144,52 @@ class HiddenMessage(Base):
     message = relationship("Message")
     user = relationship("User")
 
+class MessageReaction(Base):
+    __tablename__ = "message_reactions"
+
+    id = Column(String(36), primary_key=True, default=generate_uuid)
+    message_id = Column(String(36), ForeignKey("messages.id", ondelete="CASCADE"))
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"))
+    emoji = Column(String(32))
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    user = relationship("User")
+
+    __table_args__ = (
+        UniqueConstraint("message_id", "user_id", "emoji", name="uq_message_reactions_message_user_emoji"),
+    )
+
+class MessageReactionCount(Base):
+    """Reactions per message and emoji, kept in step with message_reactions so reads never count rows"""
+    __tablename__ = "message_reaction_counts"
+
+    message_id = Column(String(36), ForeignKey("messages.id", ondelete="CASCADE"), primary_key=True)
+    emoji = Column(String(32), primary_key=True)
+    count = Column(Integer, default=0, nullable=False)
+
+class ScheduledMessage(Base):
+    __tablename__ = "scheduled_messages"
+
+    id = Column(String(36), primary_key=True, default=generate_uuid)
+    room_id = Column(String(36), ForeignKey("rooms.id", ondelete="CASCADE"))
+    user_id = Column(String(36), ForeignKey("users.id", ondelete="CASCADE"), index=True)
+    content = Column(Text)
+    message_type = Column(String(50), default="text")
+    is_encrypted = Column(Boolean, default=False)
+    scheduled_for = Column(DateTime)
+    status = Column(String(20), default="pending")  # pending, sent, failed or cancelled
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+    message_id = Column(String(36), nullable=True)  # The message it became once sent
+    error = Column(String(255), nullable=True)
+
+    __table_args__ = (
+        # The scheduler reads the next window of pending rows in due order
+        Index("ix_scheduled_messages_status_due", "status", "scheduled_for"),
+    )
+
+class SchemaMigration(Base):
+    __tablename__ = "schema_migrations"
+
+    name = Column(String(255), primary_key=True)
+    applied_at = Column(DateTime, default=datetime.utcnow)
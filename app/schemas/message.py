@@ -65,6 +65,37 @@ class Message(MessageInDBBase):
     user_id: Optional[str] = None # Override to allow None for deleted users
     user: Optional[User] = None # Sender
     reaction_count: int = 0
+    reactions_by_emoji: Dict[str, int] = {}
+    my_reactions: List[str] = []  # Emojis the requesting user reacted with
+
+# Properties to receive when scheduling a message
+class ScheduledMessageCreate(BaseModel):
+    content: str = Field(..., max_length=2000)
+    message_type: MessageType = MessageType.TEXT
+    is_encrypted: bool = False
+    scheduled_for: datetime
+
+# Scheduled message as stored, until and after it is sent
+class ScheduledMessage(BaseModel):
+    id: str
+    room_id: str
+    user_id: str
+    content: str
+    message_type: MessageType
+    is_encrypted: bool
+    scheduled_for: datetime
+    status: str
+    created_at: datetime
+    sent_at: Optional[datetime] = None
+    message_id: Optional[str] = None
+    error: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+# Message search hit, ranked by relevance
+class MessageSearchResult(Message):
+    score: float
 
 # Message Reaction
 class MessageReaction(BaseModel):
@@ -78,6 +109,10 @@ class MessageReaction(BaseModel):
     class Config:
         from_attributes = True
 
+# Properties to receive when reacting to a message
+class MessageReactionCreate(BaseModel):
+    emoji: str = Field(..., max_length=32)
+
 # Message with reactions
 class MessageWithReactions(Message):
     reactions: List[MessageReaction] = []
@@ -112,6 +147,19 @@ class MessageReadReceipt(BaseModel):
     class Config:
         from_attributes = True
         
+# How far one member has read a room
+class ReadPosition(BaseModel):
+    user_id: str
+    last_read_at: Optional[datetime] = None
+    last_read_message_id: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+# Properties to receive when marking a room read up to a message
+class MarkRead(BaseModel):
+    message_id: str
+
 # Message with Read Receipts
 class MessageWithReadReceipts(Message):
     read_by: List[User] = []
@@ -40,6 +40,7 @@ class RoomMember(BaseModel):
     is_muted: bool
     muted_until: Optional[datetime] = None
     last_read_at: Optional[datetime] = None
+    last_read_message_id: Optional[str] = None
     user: Optional[User] = None
 
     class Config:
@@ -59,4 +60,8 @@ class RoomOwnershipTransfer(BaseModel):
 
 # Properties for creating a DM
 class DMCreate(BaseModel):
-    target_user_id: str
\ No newline at end of file
+    target_user_id: str
+# Properties for muting or banning a user; no duration means until lifted
+class Sanction(BaseModel):
+    duration_minutes: Optional[int] = Field(None, gt=0)
+    reason: Optional[str] = Field(None, max_length=500)
@@ -0,0 +1,22 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List
+
+
+def encode_cursor(*values: Any) -> str:
+    """Pack the sort key of the last row on a page into an opaque string"""
+    payload = [value.isoformat() if isinstance(value, datetime) else value for value in values]
+    return base64.urlsafe_b64encode(json.dumps(payload, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> List[Any]:
+    """Unpack a cursor made by encode_cursor; raises ValueError if it is malformed"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(values, list):
+        raise ValueError("Invalid cursor")
+    return values
@@ -0,0 +1,6 @@
+"""Benchmarks for the chat server's hot paths.
+
+Run from the repository root, e.g. ``python -m bench.broadcast_encode``.
+Each script prints its results; scripts that need a database create a
+throwaway SQLite file unless DATABASE_URL is already set.
+"""
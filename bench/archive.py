@@ -0,0 +1,138 @@
+"""Hot-path insert and read latency before and after archiving old history.
+
+Fills --rooms rooms with --messages messages in total, 95% of them older
+than ARCHIVE_AFTER_DAYS. It times single-message inserts (a commit each,
+as create_message does) and newest-page reads against the messages
+table, then archives every room in ARCHIVE_BATCH_SIZE batches, VACUUMs
+and times them again. Ends with the cost of pages read back from the
+archive. The request's 50M-row case is --messages 50000000, which takes
+hours to generate on SQLite.
+"""
+import argparse
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+
+from bench.common import percentile, use_temp_database
+
+database_url = use_temp_database()
+
+from sqlalchemy import desc, text  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.core.archive import archive_batch, read_archive  # noqa: E402
+from app.database.migrations import run_migrations  # noqa: E402
+from app.database.sql import Base, SessionLocal, engine  # noqa: E402
+from app.models.sql import Message, Room, User, generate_uuid  # noqa: E402
+
+PAGE = 50
+
+
+def fill(db, args) -> tuple:
+    user = User(username="archiver", email="archiver@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    room_ids = []
+    for i in range(args.rooms):
+        room = Room(name=f"room-{i}", created_by=user.id)
+        db.add(room)
+        db.commit()
+        room_ids.append(room.id)
+
+    now = datetime.utcnow()
+    old = int(args.messages * 0.95)
+    old_start = now - timedelta(days=settings.ARCHIVE_AFTER_DAYS + 30)
+    recent_start = now - timedelta(days=1)
+    for start in range(0, args.messages, 50_000):
+        db.execute(Message.__table__.insert(), [
+            {
+                "id": f"m{i:09d}", "room_id": room_ids[i % len(room_ids)], "user_id": user.id,
+                "content": f"benchmark message {i}", "message_type": "text", "is_encrypted": False,
+                "created_at": (old_start if i < old else recent_start) + timedelta(microseconds=i),
+            }
+            for i in range(start, min(start + 50_000, args.messages))
+        ])
+        db.commit()
+    return user.id, room_ids
+
+
+def measure(db, label: str, user_id: str, room_id: str, samples: int):
+    inserts, reads = [], []
+    for i in range(samples):
+        started = time.perf_counter()
+        db.add(Message(id=generate_uuid(), room_id=room_id, user_id=user_id, content=f"live {i}", created_at=datetime.utcnow()))
+        db.commit()
+        inserts.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        db.query(Message).filter(Message.room_id == room_id).order_by(
+            desc(Message.created_at), desc(Message.id)
+        ).limit(PAGE).all()
+        reads.append(time.perf_counter() - started)
+    hot = db.query(Message).count()
+    size = os.path.getsize(engine.url.database) / 1e6
+    print(
+        f"{label:>7} {hot:>11,} {size:>9.0f}MB {percentile(inserts, 50) * 1000:>9.2f}ms {percentile(inserts, 99) * 1000:>9.2f}ms"
+        f" {percentile(reads, 50) * 1000:>9.2f}ms {percentile(reads, 99) * 1000:>9.2f}ms"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--rooms", type=int, default=10)
+    parser.add_argument("--samples", type=int, default=300)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    if not database_url.startswith("sqlite"):
+        parser.error("the size column reads the SQLite file; run against SQLite")
+
+    Base.metadata.create_all(engine)
+    run_migrations(engine)
+    db = SessionLocal()
+    started = time.perf_counter()
+    user_id, room_ids = fill(db, args)
+    print(f"inserted {args.messages:,} messages in {time.perf_counter() - started:.0f}s")
+
+    print(f"{'':>7} {'hot rows':>11} {'db file':>11} {'insert p50':>11} {'insert p99':>11} {'page p50':>11} {'page p99':>11}")
+    measure(db, "before", user_id, room_ids[0], args.samples)
+
+    moved = batches = 0
+    longest = 0.0
+    started = time.perf_counter()
+    for room_id in room_ids:
+        while True:
+            batch_started = time.perf_counter()
+            count = archive_batch(db, room_id)
+            if not count:
+                break
+            longest = max(longest, time.perf_counter() - batch_started)
+            moved += count
+            batches += 1
+    elapsed = time.perf_counter() - started
+    with engine.connect() as conn:
+        conn.execute(text("VACUUM"))
+    measure(db, "after", user_id, room_ids[0], args.samples)
+    print(
+        f"archived {moved:,} messages in {batches:,} batches: {elapsed:.0f}s ({moved / elapsed:,.0f}/s),"
+        f" longest batch {longest * 1000:.0f}ms"
+    )
+
+    room = db.get(Room, room_ids[0])
+    for label, position in (
+        ("newest archived page", {"before": (room.archived_until, room.archived_until_id)}),
+        ("oldest archived page", {"after": (datetime.min, "")}),
+    ):
+        times = []
+        for _ in range(20):
+            started = time.perf_counter()
+            page = read_archive(db, room.id, user_id, PAGE, **position)
+            times.append(time.perf_counter() - started)
+        assert len(page) == PAGE
+        print(f"{label}: p50 {percentile(times, 50) * 1000:.2f}ms")
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""Requests/sec on GET /users/me with the principal and token caches on and off.
+
+Requests go straight to the ASGI app (no sockets), so the numbers are
+the server's own cost per request. "off" sets both cache TTLs to zero,
+which makes every lookup a miss: the JWT is verified and the user row
+read on every request, as before the caches existed.
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from bench.common import use_temp_database
+
+use_temp_database()
+os.environ["SQL_QUERY_COUNT_HEADER"] = "true"
+
+import httpx  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.core.security import principal_cache, token_cache  # noqa: E402
+from app.database.sql import Base, engine  # noqa: E402
+import app.models.sql  # noqa: E402,F401
+from app.main import app  # noqa: E402
+
+
+async def run(client: httpx.AsyncClient, headers: dict, requests: int, concurrency: int):
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            response = await client.get("/api/v1/users/me", headers=headers)
+            assert response.status_code == 200, response.text
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return requests / (time.perf_counter() - started)
+
+
+async def main(args):
+    Base.metadata.create_all(engine)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post("/api/v1/auth/register", json={
+            "username": "benchuser", "email": "bench@example.com", "password": "password123"
+        })
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+        print(f"{'caches':>7} {'req/s':>8} {'SQL/request':>12} {'principal hit rate':>19} {'token hit rate':>15}")
+        for label, ttl in (("off", 0.0), ("on", settings.AUTH_CACHE_TTL_SECONDS)):
+            for cache in (principal_cache, token_cache):
+                cache.ttl_seconds = ttl
+                cache.clear()
+                cache.hits = cache.misses = 0
+            await run(client, headers, 200, args.concurrency)  # warm up
+            rate = await run(client, headers, args.requests, args.concurrency)
+            queries = (await client.get("/api/v1/users/me", headers=headers)).headers["X-SQL-Queries"]
+            print(
+                f"{label:>7} {rate:>8.0f} {queries:>12}"
+                f" {principal_cache.get_stats()['hit_rate']:>19.2%} {token_cache.get_stats()['hit_rate']:>15.2%}"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    asyncio.run(main(parser.parse_args()))
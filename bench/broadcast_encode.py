@@ -0,0 +1,105 @@
+"""Encode cost per broadcast at 10, 100 and 1000 recipients.
+
+"before" is what send_json did: json.dumps the message once per socket.
+"after" is encode_frame once per broadcast. The fan-out rows time a whole
+broadcast_to_room through the connection manager (encode, backplane,
+per-socket queues) against a send_json loop over the same sockets.
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime
+
+from app.core.websocket_manager import ConnectionManager, encode_frame
+
+
+class NullSocket:
+    """Accepts frames and drops them"""
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        pass
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        pass
+
+
+MESSAGE = {
+    "type": "message",
+    "message_id": "3f6c1e2a-9b4d-4c1e-8f3a-2d5e6b7c8a90",
+    "content": "Lorem ipsum dolor sit amet, consectetur adipiscing elit. " * 3,
+    "user_id": "7a1b2c3d-4e5f-6071-8293-a4b5c6d7e8f9",
+    "sender_name": "alice",
+    "user": {"id": "7a1b2c3d-4e5f-6071-8293-a4b5c6d7e8f9", "username": "alice", "avatar_url": None},
+    "message_type": "text",
+    "created_at": datetime(2024, 1, 1, 12, 0, 0).isoformat(),
+    "is_encrypted": False,
+    "room_id": "room-1",
+}
+
+
+def send_json_encode(message: dict) -> str:
+    # starlette's WebSocket.send_json
+    return json.dumps(message, separators=(",", ":"), ensure_ascii=False)
+
+
+def per_broadcast_us(fn, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - started) / repeat * 1e6
+
+
+async def fan_out(recipients: int, repeat: int):
+    manager = ConnectionManager()
+
+    async def drain():
+        while any(not c.queue.empty() for c in manager.connections.values()):
+            await asyncio.sleep(0)
+
+    sockets = [NullSocket() for _ in range(recipients)]
+    for i, websocket in enumerate(sockets):
+        # Each join is announced to the room; let the writers keep up
+        await manager.connect(websocket, "room-1", f"user-{i}")
+        await drain()
+    before = 0.0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for websocket in sockets:
+            await websocket.send_text(send_json_encode(MESSAGE))
+        before += time.perf_counter() - started
+
+    after = 0.0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        await manager.broadcast_to_room("room-1", MESSAGE)
+        after += time.perf_counter() - started
+        await drain()
+
+    for websocket in sockets:
+        manager.disconnect_all(websocket)
+    return before / repeat * 1e6, after / repeat * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--recipients", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--broadcasts", type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{'recipients':>10} {'encode before':>14} {'encode after':>13} {'fan-out before':>15} {'fan-out after':>14}")
+    for recipients in args.recipients:
+        encode_before = per_broadcast_us(lambda: [send_json_encode(MESSAGE) for _ in range(recipients)], args.broadcasts)
+        encode_after = per_broadcast_us(lambda: encode_frame(MESSAGE), args.broadcasts)
+        fan_before, fan_after = asyncio.run(fan_out(recipients, args.broadcasts))
+        print(
+            f"{recipients:>10} {encode_before:>12.1f}us {encode_after:>11.1f}us"
+            f" {fan_before:>13.1f}us {fan_after:>12.1f}us"
+        )
+
+
+if __name__ == "__main__":
+    main()
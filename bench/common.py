@@ -0,0 +1,17 @@
+import os
+import tempfile
+
+
+def use_temp_database():
+    """Point the app at a throwaway SQLite file unless DATABASE_URL is set; call before importing app"""
+    if not os.getenv("DATABASE_URL"):
+        path = os.path.join(tempfile.mkdtemp(prefix="echo-bench-"), "bench.db")
+        os.environ["DATABASE_URL"] = f"sqlite:///{path}"
+    return os.environ["DATABASE_URL"]
+
+
+def percentile(samples, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
@@ -0,0 +1,86 @@
+"""Room export throughput and peak memory, by room size.
+
+Fills a small and a large room (--messages and a tenth of it), then
+streams each through stream_room_export, the generator behind GET
+/admin/rooms/{id}/export, uncompressed and gzipped. Peak memory is
+measured with tracemalloc on a separate pass, since tracing slows the
+export down; flat memory means the large room's peak matches the small
+one's. Pass --messages 10000000 for the full-size run.
+"""
+import argparse
+import logging
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from bench.common import use_temp_database
+
+use_temp_database()
+
+from app.core.export import stream_room_export  # noqa: E402
+from app.database.migrations import run_migrations  # noqa: E402
+from app.database.sql import Base, SessionLocal, engine  # noqa: E402
+from app.models.sql import Message, Room, User  # noqa: E402
+
+
+def fill_room(db, user_id: str, name: str, rows: int) -> str:
+    room = Room(name=name, created_by=user_id)
+    db.add(room)
+    db.commit()
+    started_at = datetime.utcnow() - timedelta(days=1)
+    for start in range(0, rows, 50_000):
+        db.execute(Message.__table__.insert(), [
+            {
+                "id": f"{name}-{i:09d}", "room_id": room.id, "user_id": user_id,
+                "content": f"benchmark message {i} with a little more text, like most chat lines",
+                "message_type": "text", "is_encrypted": False,
+                "created_at": started_at + timedelta(microseconds=i),
+            }
+            for i in range(start, min(start + 50_000, rows))
+        ])
+        db.commit()
+    return room.id
+
+
+def export(room_id: str, compression: str):
+    output = 0
+    started = time.perf_counter()
+    for chunk in stream_room_export(room_id, compression):
+        output += len(chunk)
+    return time.perf_counter() - started, output
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    Base.metadata.create_all(engine)
+    run_migrations(engine)
+    db = SessionLocal()
+    user = User(username="exporter", email="exporter@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    rooms = [
+        (args.messages // 10, fill_room(db, user.id, "small", args.messages // 10)),
+        (args.messages, fill_room(db, user.id, "large", args.messages)),
+    ]
+    db.close()
+
+    print(f"{'rows':>10} {'compression':>11} {'rows/s':>9} {'output MB':>10} {'peak memory':>12}")
+    for rows, room_id in rooms:
+        for compression in ("none", "gzip"):
+            elapsed, output = export(room_id, compression)
+            tracemalloc.start()
+            export(room_id, compression)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(
+                f"{rows:>10,} {compression:>11} {rows / elapsed:>9,.0f} {output / 1e6:>10.1f}"
+                f" {peak / 1e6:>10.1f}MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
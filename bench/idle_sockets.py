@@ -0,0 +1,131 @@
+"""Thousands of idle WebSockets alongside normal REST traffic.
+
+Starts the app under uvicorn in this process, opens --sockets room
+sockets spread over rooms of --room-size, then runs REST requests
+against it while they stay open. The connection pool (pool_size=10,
+max_overflow=20) is sampled throughout: sockets only borrow a session
+while they authenticate or write, so the pool never fills and REST
+latency stays where it is with no sockets open.
+"""
+import argparse
+import asyncio
+import logging
+import socket
+import time
+
+from bench.common import percentile, use_temp_database
+
+use_temp_database()
+
+import httpx  # noqa: E402
+import uvicorn  # noqa: E402
+import websockets  # noqa: E402
+
+from app.database.sql import Base, engine  # noqa: E402
+import app.models.sql  # noqa: E402,F401
+from app.main import app  # noqa: E402
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+async def rest_load(client: httpx.AsyncClient, headers: dict, rooms: list, requests: int, concurrency: int):
+    latencies, errors = [], 0
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+
+    async def worker():
+        nonlocal errors
+        while not queue.empty():
+            i = queue.get_nowait()
+            url = "/api/v1/users/me" if i % 2 else f"/api/v1/messages/rooms/{rooms[i % len(rooms)]}/messages?limit=50"
+            started = time.perf_counter()
+            response = await client.get(url, headers=headers)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors, time.perf_counter() - started
+
+
+async def main(args):
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    Base.metadata.create_all(engine)
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", ws="websockets"))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    peak = 0
+
+    async def sample_pool():
+        nonlocal peak
+        while True:
+            peak = max(peak, engine.pool.checkedout())
+            await asyncio.sleep(0.005)
+
+    sampler = asyncio.create_task(sample_pool())
+
+    base = f"http://127.0.0.1:{port}"
+    async with httpx.AsyncClient(base_url=base, timeout=60) as client:
+        response = await client.post("/api/v1/auth/register", json={
+            "username": "benchuser", "email": "bench@example.com", "password": "password123"
+        })
+        token = response.json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        room_count = max(1, args.sockets // args.room_size)
+        rooms = []
+        for i in range(room_count):
+            response = await client.post("/api/v1/rooms/", json={"name": f"room{i}"}, headers=headers)
+            rooms.append(response.json()["id"])
+        for room_id in rooms[:10]:
+            for n in range(20):
+                await client.post(f"/api/v1/messages/rooms/{room_id}/messages", json={"content": f"m{n}", "room_id": room_id}, headers=headers)
+
+        baseline, baseline_errors, _ = await rest_load(client, headers, rooms, args.requests, args.concurrency)
+        peak_without_sockets = peak
+
+        sockets = []
+        started = time.perf_counter()
+        for offset in range(0, args.sockets, 250):
+            batch = [
+                websockets.connect(f"ws://127.0.0.1:{port}/ws/{rooms[i % room_count]}?token={token}", max_queue=None, open_timeout=120)
+                for i in range(offset, min(offset + 250, args.sockets))
+            ]
+            sockets += await asyncio.gather(*batch)
+        connect_seconds = time.perf_counter() - started
+        await asyncio.sleep(1)
+        open_sockets = sum(1 for ws in sockets if ws.state == websockets.protocol.State.OPEN)
+        idle_checked_out = engine.pool.checkedout()
+
+        loaded, loaded_errors, seconds = await rest_load(client, headers, rooms, args.requests, args.concurrency)
+
+        for ws in sockets:
+            await ws.close()
+
+    sampler.cancel()
+    server.should_exit = True
+    await serving
+
+    print(f"sockets open:              {open_sockets}/{args.sockets} (connected in {connect_seconds:.1f}s)")
+    print(f"pool checked out, idle:    {idle_checked_out}")
+    print(f"pool peak, no sockets:     {peak_without_sockets}")
+    print(f"pool peak, whole run:      {peak} of {engine.pool.size() + engine.pool._max_overflow}")
+    print(f"REST without sockets:      p50 {percentile(baseline, 50) * 1000:.1f}ms  p99 {percentile(baseline, 99) * 1000:.1f}ms  errors {baseline_errors}")
+    print(f"REST with sockets open:    p50 {percentile(loaded, 50) * 1000:.1f}ms  p99 {percentile(loaded, 99) * 1000:.1f}ms  errors {loaded_errors}  ({len(loaded) / seconds:.0f} req/s)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sockets", type=int, default=5000)
+    parser.add_argument("--room-size", type=int, default=10)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,80 @@
+"""Event-loop lag while 200 logins arrive at once.
+
+A ticker task asks to wake every 10ms and records how late it runs,
+which is how long any WebSocket on the worker would have waited. The
+burst runs twice: with bcrypt called inline on the loop, as before the
+password hasher existed, and through password_hasher's bounded pool.
+Requests go straight to the ASGI app; the per-IP login limit is lifted
+for the run.
+"""
+import argparse
+import asyncio
+import time
+
+from bench.common import percentile, use_temp_database
+
+use_temp_database()
+
+import httpx  # noqa: E402
+
+from app.core.moderation import rate_limiter  # noqa: E402
+from app.core.security import password_hasher, verify_password  # noqa: E402
+from app.database.sql import Base, engine  # noqa: E402
+import app.models.sql  # noqa: E402,F401
+from app.main import app  # noqa: E402
+
+TICK = 0.01
+
+
+async def burst(client: httpx.AsyncClient, logins: int):
+    lags = []
+    done = False
+
+    async def ticker():
+        while not done:
+            expected = time.perf_counter() + TICK
+            await asyncio.sleep(TICK)
+            lags.append(max(0.0, time.perf_counter() - expected))
+
+    async def login():
+        response = await client.post("/api/v1/auth/login", data={"username": "benchuser", "password": "password123"})
+        return response.status_code
+
+    ticking = asyncio.create_task(ticker())
+    started = time.perf_counter()
+    statuses = await asyncio.gather(*(login() for _ in range(logins)))
+    seconds = time.perf_counter() - started
+    done = True
+    await ticking
+    return lags, statuses, seconds
+
+
+async def main(args):
+    Base.metadata.create_all(engine)
+    rate_limiter.configure("ip", 10 ** 9)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        response = await client.post("/api/v1/auth/register", json={
+            "username": "benchuser", "email": "bench@example.com", "password": "password123"
+        })
+        assert response.status_code == 200, response.text
+
+        async def inline_verify(plain_password: str, hashed_password: str) -> bool:
+            return verify_password(plain_password, hashed_password)
+
+        pooled_verify = password_hasher.verify
+        print(f"{'bcrypt':>8} {'lag p50':>9} {'lag p99':>9} {'lag max':>9} {'burst':>8} {'200 OK':>7} {'503':>5}")
+        for label, verify in (("inline", inline_verify), ("pool", pooled_verify)):
+            password_hasher.verify = verify
+            lags, statuses, seconds = await burst(client, args.logins)
+            print(
+                f"{label:>8} {percentile(lags, 50) * 1000:>7.1f}ms {percentile(lags, 99) * 1000:>7.1f}ms"
+                f" {max(lags) * 1000:>7.1f}ms {seconds:>7.1f}s {statuses.count(200):>7} {statuses.count(503):>5}"
+            )
+        password_hasher.verify = pooled_verify
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--logins", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,104 @@
+"""Room history page latency by depth: offset (skip) versus keyset cursor.
+
+Fills one room with --rows messages, then times GET
+/rooms/{id}/messages for a 50-message page that starts `depth` messages
+back from the newest, once with skip=depth (how history was paged
+before) and once with before=<cursor of the message just newer>. The
+room history cache is turned off so depth 0 measures the SQL path too.
+"""
+import argparse
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+
+from bench.common import percentile, use_temp_database
+
+use_temp_database()
+
+import httpx  # noqa: E402
+
+from app.config import settings  # noqa: E402
+from app.database.migrations import run_migrations  # noqa: E402
+from app.database.sql import Base, SessionLocal, engine  # noqa: E402
+from app.models.sql import Message, Room, RoomMember  # noqa: E402
+from app.utils.pagination import encode_cursor  # noqa: E402
+from app.main import app  # noqa: E402
+
+PAGE = 50
+
+
+def fill_room(user_id: str, rows: int) -> tuple:
+    """Insert `rows` messages a microsecond apart; returns the room id and the first timestamp"""
+    db = SessionLocal()
+    room = Room(name="bench", created_by=user_id)
+    db.add(room)
+    db.commit()
+    db.add(RoomMember(room_id=room.id, user_id=user_id, role="admin"))
+    db.commit()
+    started_at = datetime.utcnow() - timedelta(days=1)
+    for start in range(0, rows, 50_000):
+        db.execute(Message.__table__.insert(), [
+            {
+                "id": f"m{i:08d}", "room_id": room.id, "user_id": user_id,
+                "content": f"benchmark message {i}", "message_type": "text", "is_encrypted": False,
+                "created_at": started_at + timedelta(microseconds=i),
+            }
+            for i in range(start, min(start + 50_000, rows))
+        ])
+    db.commit()
+    room_id = room.id
+    db.close()
+    return room_id, started_at
+
+
+async def timed(client: httpx.AsyncClient, url: str, headers: dict, params: dict, samples: int) -> list:
+    times = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        response = await client.get(url, headers=headers, params=params)
+        times.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.text
+        assert len(response.json()) == PAGE
+    return times
+
+
+async def main(args):
+    logging.disable(logging.INFO)
+    Base.metadata.create_all(engine)
+    run_migrations(engine)
+    settings.ROOM_HISTORY_CACHE_ENABLED = False
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        response = await client.post("/api/v1/auth/register", json={
+            "username": "benchuser", "email": "bench@example.com", "password": "password123"
+        })
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        user_id = (await client.get("/api/v1/users/me", headers=headers)).json()["id"]
+
+        started = time.perf_counter()
+        room_id, started_at = fill_room(user_id, args.rows)
+        print(f"inserted {args.rows:,} messages in {time.perf_counter() - started:.1f}s")
+        url = f"/api/v1/messages/rooms/{room_id}/messages"
+
+        print(f"{'depth':>10} {'offset p50':>11} {'offset p99':>11} {'cursor p50':>11} {'cursor p99':>11}")
+        for depth in sorted({depth for depth in (0, 10_000, args.rows - PAGE) if 0 <= depth <= args.rows - PAGE}):
+            offset = await timed(client, url, headers, {"limit": PAGE, "skip": depth}, args.samples)
+            params = {"limit": PAGE}
+            if depth:
+                # The message just newer than the page, as the previous page's X-Next-Cursor would name it
+                newer = args.rows - depth
+                params["before"] = encode_cursor(started_at + timedelta(microseconds=newer), f"m{newer:08d}")
+            cursor = await timed(client, url, headers, params, args.samples)
+            print(
+                f"{depth:>10,} {percentile(offset, 50) * 1000:>9.1f}ms {percentile(offset, 99) * 1000:>9.1f}ms"
+                f" {percentile(cursor, 50) * 1000:>9.1f}ms {percentile(cursor, 99) * 1000:>9.1f}ms"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--samples", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,141 @@
+"""Rate limiter checks/sec, memory at 1M users, and sweep pauses.
+
+"before" is the original limiter, which kept a list of datetimes per
+user and rebuilt it on every check; it never evicted idle users. "after"
+is the GCRA token bucket in app.core.moderation, one float per key.
+The sweep rows compare rebuilding the whole bucket dict in one go (the
+first token-bucket sweeper) with the batched sweep, which yields to the
+event loop every RATE_LIMIT_SWEEP_BATCH keys.
+"""
+import argparse
+import asyncio
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+from app.config import settings
+from app.core.moderation import RateLimiter
+
+
+class ListRateLimiter:
+    """The limiter this replaced, verbatim apart from the name"""
+
+    def __init__(self):
+        self.message_timestamps = {}
+
+    def check_rate_limit(self, user_id: str, messages_per_minute: int) -> bool:
+        current_time = datetime.now()
+        one_minute_ago = current_time - timedelta(minutes=1)
+        if user_id not in self.message_timestamps:
+            self.message_timestamps[user_id] = []
+        self.message_timestamps[user_id] = [
+            ts for ts in self.message_timestamps[user_id]
+            if ts >= one_minute_ago
+        ]
+        if len(self.message_timestamps[user_id]) >= messages_per_minute:
+            return False
+        self.message_timestamps[user_id].append(current_time)
+        return True
+
+
+def checks_per_second(check, keys, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for key in keys:
+            check(key)
+    return rounds * len(keys) / (time.perf_counter() - started)
+
+
+def bytes_per_user(fill, users: int) -> float:
+    keys = [f"user-{i}" for i in range(users)]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    state = fill(keys)
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del state
+    return used / users
+
+
+async def max_pause(work) -> float:
+    """Longest time the loop went without running another task while `work` ran"""
+    lags = []
+    running = True
+
+    async def ticker():
+        while running:
+            started = time.perf_counter()
+            await asyncio.sleep(0)
+            lags.append(time.perf_counter() - started)
+
+    ticking = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    await work()
+    running = False
+    await ticking
+    return max(lags)
+
+
+async def sweeps(users: int):
+    limiter = RateLimiter()
+    limiter.configure("user", 1000, 0.001)
+    for i in range(users):
+        limiter._take("user", f"user-{i}", 1000, 0.001)
+    await asyncio.sleep(0.01)
+    snapshot = dict(limiter.buckets["user"])
+
+    async def rebuild():
+        now = time.monotonic()
+        limiter.buckets["user"] = {key: full_at for key, full_at in limiter.buckets["user"].items() if full_at > now}
+
+    started = time.perf_counter()
+    rebuild_pause = await max_pause(rebuild)
+    rebuild_total = time.perf_counter() - started
+
+    limiter.buckets["user"] = snapshot
+    started = time.perf_counter()
+    batched_pause = await max_pause(limiter.sweep)
+    batched_total = time.perf_counter() - started
+    assert not limiter.buckets["user"]
+    return rebuild_total, rebuild_pause, batched_total, batched_pause
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=1_000_000)
+    args = parser.parse_args()
+    limit = settings.RATE_LIMIT_MESSAGES_PER_MINUTE
+
+    old = ListRateLimiter()
+    new = RateLimiter()
+    print(f"checks/sec, limit {limit}/min    {'before':>10} {'after':>10}")
+    # A user sending steadily: the old list holds up to `limit` timestamps to filter
+    print(f"  one hot user                {checks_per_second(lambda k: old.check_rate_limit(k, limit), ['hot'], 100_000):>10,.0f}"
+          f" {checks_per_second(lambda k: new._take('user', k, limit, 60.0), ['hot'], 100_000):>10,.0f}")
+    keys = [f"user-{i}" for i in range(100_000)]
+    print(f"  100k users, one check each  {checks_per_second(lambda k: old.check_rate_limit(k, limit), keys, 1):>10,.0f}"
+          f" {checks_per_second(lambda k: new._take('user', k, limit, 60.0), keys, 1):>10,.0f}")
+
+    def fill_old(keys):
+        limiter = ListRateLimiter()
+        for key in keys:
+            limiter.check_rate_limit(key, limit)
+        return limiter
+
+    def fill_new(keys):
+        limiter = RateLimiter()
+        for key in keys:
+            limiter._take("user", key, limit, 60.0)
+        return limiter
+
+    print(f"bytes per user at {args.users:,} users (excluding the id strings)")
+    print(f"  before {bytes_per_user(fill_old, args.users):>6.0f}    after {bytes_per_user(fill_new, args.users):>6.0f}")
+
+    rebuild_total, rebuild_pause, batched_total, batched_pause = asyncio.run(sweeps(args.users))
+    print(f"sweeping {args.users:,} idle keys (batch {settings.RATE_LIMIT_SWEEP_BATCH:,})")
+    print(f"  rebuild  total {rebuild_total * 1000:>7.1f}ms  longest loop pause {rebuild_pause * 1000:>7.1f}ms")
+    print(f"  batched  total {batched_total * 1000:>7.1f}ms  longest loop pause {batched_pause * 1000:>7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
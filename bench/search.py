@@ -0,0 +1,131 @@
+"""Message search latency over a generated corpus: full-text index versus ilike.
+
+Generates --messages messages (default 1M; pass --messages 10000000 for
+the full-size run, which takes a while to insert on SQLite) from a
+Zipf-distributed vocabulary across --rooms rooms, half of them private
+with the searching user a member of half of those. It then times a
+first page of search_messages (the FTS5 index behind GET
+/messages/search) for a common, a mid-frequency and a rare word, a
+two-word query and a room-filtered query. Each is compared with the
+ilike('%term%') scan that was the only search style before.
+"""
+import argparse
+import logging
+import random
+import string
+import time
+from datetime import datetime, timedelta
+from itertools import accumulate
+
+from bench.common import percentile, use_temp_database
+
+use_temp_database()
+
+from sqlalchemy import desc, or_  # noqa: E402
+
+from app.database.migrations import run_migrations  # noqa: E402
+from app.database.sql import Base, SessionLocal, engine  # noqa: E402
+from app.models.sql import Message, Room, RoomMember, User  # noqa: E402
+from app.core.search import search_messages  # noqa: E402
+
+PAGE = 20
+
+
+def make_corpus(db, args, rng: random.Random):
+    user = User(username="searcher", email="searcher@example.com", password_hash="x")
+    db.add(user)
+    db.commit()
+    rooms = []
+    for i in range(args.rooms):
+        room = Room(name=f"room-{i}", is_private=i % 2 == 1, created_by=user.id)
+        db.add(room)
+        rooms.append(room)
+    db.commit()
+    for room in rooms[1::4]:
+        db.add(RoomMember(room_id=room.id, user_id=user.id))
+    db.commit()
+    room_ids = [room.id for room in rooms]
+
+    vocabulary = list({"".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(args.vocabulary * 2)})
+    vocabulary = vocabulary[:args.vocabulary]
+    weights = list(accumulate(1 / rank for rank in range(1, len(vocabulary) + 1)))
+
+    started_at = datetime.utcnow() - timedelta(days=30)
+    batch = 50_000
+    for start in range(0, args.messages, batch):
+        db.execute(Message.__table__.insert(), [
+            {
+                "id": f"m{i:09d}", "room_id": room_ids[i % len(room_ids)], "user_id": user.id,
+                "content": " ".join(rng.choices(vocabulary, cum_weights=weights, k=rng.randint(5, 20))),
+                "message_type": "text", "is_encrypted": False,
+                "created_at": started_at + timedelta(milliseconds=i),
+            }
+            for i in range(start, min(start + batch, args.messages))
+        ])
+        db.commit()
+    return user.id, room_ids, vocabulary
+
+
+def substring_search(db, user_id: str, term: str, limit: int, room_id=None):
+    """Newest readable messages containing the term, the way ilike search worked"""
+    query = db.query(Message).join(Room, Room.id == Message.room_id).outerjoin(
+        RoomMember,
+        (RoomMember.room_id == Message.room_id) & (RoomMember.user_id == user_id)
+    ).filter(
+        or_(Room.is_private == False, RoomMember.id != None),  # noqa: E712
+        Message.content.ilike(f"%{term}%")
+    )
+    if room_id:
+        query = query.filter(Message.room_id == room_id)
+    return query.order_by(desc(Message.created_at)).limit(limit).all()
+
+
+def timed(fn, samples: int) -> list:
+    times = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=1_000_000)
+    parser.add_argument("--rooms", type=int, default=100)
+    parser.add_argument("--vocabulary", type=int, default=50_000)
+    parser.add_argument("--samples", type=int, default=5)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    rng = random.Random(19)
+
+    Base.metadata.create_all(engine)
+    run_migrations(engine)
+    db = SessionLocal()
+    started = time.perf_counter()
+    user_id, room_ids, vocabulary = make_corpus(db, args, rng)
+    elapsed = time.perf_counter() - started
+    print(f"inserted {args.messages:,} messages in {elapsed:.0f}s ({args.messages / elapsed:,.0f}/s, FTS5 triggers on)")
+
+    queries = [
+        ("common word", vocabulary[5], None),
+        ("mid word", vocabulary[500], None),
+        ("rare word", vocabulary[-1], None),
+        ("two words", f"{vocabulary[50]} {vocabulary[400]}", None),
+        ("common, one room", vocabulary[5], room_ids[0]),
+    ]
+    print(f"{'query':>17} {'matches':>9} {'fts p50':>9} {'fts p99':>9} {'ilike p50':>10} {'ilike p99':>10}")
+    for label, terms, room_id in queries:
+        matches = len(search_messages(db, user_id, terms, 10**9, room_id=room_id))
+        fts = timed(lambda: search_messages(db, user_id, terms, PAGE, room_id=room_id), args.samples)
+        # ilike has no notion of separate words; the phrase is matched as typed
+        ilike = timed(lambda: substring_search(db, user_id, terms, PAGE, room_id=room_id), args.samples)
+        print(
+            f"{label:>17} {matches:>9,} {percentile(fts, 50) * 1000:>7.1f}ms {percentile(fts, 99) * 1000:>7.1f}ms"
+            f" {percentile(ilike, 50) * 1000:>8.1f}ms {percentile(ilike, 99) * 1000:>8.1f}ms"
+        )
+    db.close()
+
+
+if __name__ == "__main__":
+    main()
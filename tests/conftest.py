@@ -0,0 +1,95 @@
+import itertools
+import os
+import tempfile
+
+# Point the app at a throwaway SQLite database before anything imports it
+os.environ["DATABASE_URL"] = "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="echo-tests-"), "test.db")
+# Lets tests assert on the X-SQL-Queries header
+os.environ["SQL_QUERY_COUNT_HEADER"] = "true"
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.database.sql import Base, engine
+import app.models.sql  # noqa: F401  (registers the tables)
+
+# The admin bootstrap runs before migrations on startup and needs the users table
+Base.metadata.create_all(engine)
+
+from app.main import app  # noqa: E402
+
+_names = itertools.count(1)
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture(scope="session")
+def client():
+    # One app for the whole run: the services it starts are process-wide singletons
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def register(client):
+    """Register a fresh user; returns (user_id, token, auth headers)"""
+
+    def _register(prefix: str = "user"):
+        name = f"{prefix}{next(_names)}"
+        response = client.post("/api/v1/auth/register", json={
+            "username": name,
+            "email": f"{name}@example.com",
+            "password": "password123"
+        })
+        assert response.status_code == 200, response.text
+        token = response.json()["access_token"]
+        headers = {"Authorization": f"Bearer {token}"}
+        user_id = client.get("/api/v1/users/me", headers=headers).json()["id"]
+        return user_id, token, headers
+
+    return _register
+
+
+@pytest.fixture
+def room(client, register):
+    """A public room owned by one user and joined by another: (room_id, owner, member)"""
+    owner = register("owner")
+    member = register("member")
+    response = client.post("/api/v1/rooms/", json={"name": "general"}, headers=owner[2])
+    assert response.status_code == 200, response.text
+    room_id = response.json()["id"]
+    assert client.post(f"/api/v1/rooms/{room_id}/join", headers=member[2]).status_code == 200
+    return room_id, owner, member
+
+
+@pytest.fixture
+def add_messages():
+    """Insert `count` messages straight into the table, oldest first; returns their ids"""
+    from datetime import datetime, timedelta
+
+    from app.database.sql import SessionLocal
+    from app.models.sql import Message, generate_uuid
+
+    def _add(room_id: str, user_id: str, count: int):
+        start = datetime.utcnow()
+        rows = [{
+            "id": generate_uuid(),
+            "room_id": room_id,
+            "user_id": user_id,
+            "content": f"message {i}",
+            "message_type": "text",
+            "is_encrypted": False,
+            "created_at": start + timedelta(milliseconds=i),
+        } for i in range(count)]
+        db = SessionLocal()
+        try:
+            db.execute(Message.__table__.insert(), rows)
+            db.commit()
+        finally:
+            db.close()
+        return [row["id"] for row in rows]
+
+    return _add
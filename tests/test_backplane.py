@@ -0,0 +1,138 @@
+import asyncio
+import json
+import logging
+
+import fakeredis
+import pytest
+
+from app.config import settings
+from app.core.backplane import Backplane, PostgresBackplane
+from app.core.websocket_manager import ConnectionManager
+from app.database import redis as redis_module
+
+pytestmark = pytest.mark.anyio
+
+
+class FakeSocket:
+    """Records the frames a connection manager writes to it"""
+
+    def __init__(self):
+        self.frames = []
+        self.closed = False
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        self.frames.append(json.loads(data))
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        self.closed = True
+
+    def received(self, frame_type: str):
+        return [frame for frame in self.frames if frame.get("type") == frame_type]
+
+
+async def eventually(predicate, timeout: float = 3.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+@pytest.fixture
+async def workers(monkeypatch):
+    """Two connection managers, as on two workers, sharing one stand-in Redis server"""
+    monkeypatch.setattr(settings, "BACKPLANE", "redis")
+    server = fakeredis.FakeServer()
+    managers = []
+    for _ in range(2):
+        # Each worker gets its own client connection, as it would in its own process
+        client = fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+        monkeypatch.setattr(redis_module, "get_redis", lambda client=client: client)
+        manager = ConnectionManager()
+        await manager.start()
+        managers.append(manager)
+    yield managers
+    for manager in managers:
+        await manager.stop()
+
+
+async def test_room_broadcast_reaches_sockets_on_other_workers(workers):
+    a, b = workers
+    alice, bob, carol = FakeSocket(), FakeSocket(), FakeSocket()
+    await a.connect(alice, "general", "alice")
+    await b.connect(bob, "general", "bob")
+    await b.connect(carol, "random", "carol")
+
+    # Workers only listen on rooms they hold sockets for
+    assert "room:general" in a.backplane.subscribed and "room:random" not in a.backplane.subscribed
+    assert {"room:general", "room:random"} <= b.backplane.subscribed
+
+    await a.broadcast_to_room("general", {"type": "message", "content": "hello"})
+    await eventually(lambda: bob.received("message"))
+    await eventually(lambda: alice.received("message"))
+    assert bob.received("message") == [{"type": "message", "content": "hello", "room_id": "general"}]
+
+    # Publishing to a room this worker holds no sockets for still reaches the one that does
+    await a.broadcast_to_room("random", {"type": "message", "content": "over here"})
+    await eventually(lambda: carol.received("message"))
+    assert [frame["content"] for frame in bob.received("message")] == ["hello"]
+
+
+async def test_user_frames_and_unsubscribe_across_workers(workers):
+    a, b = workers
+    bob = FakeSocket()
+    await b.connect(bob, "general", "bob")
+
+    await a.send_personal_message("bob", "general", {"type": "notice", "text": "for bob"})
+    await eventually(lambda: bob.received("notice"))
+
+    # The last socket leaving a room drops the worker's subscription to it
+    b.disconnect(bob, "general", "bob")
+    await eventually(lambda: "room:general" not in b.backplane.subscribed and "user:bob" not in b.backplane.subscribed)
+    assert not b.backplane.tasks
+
+
+async def test_publish_failure_is_logged_not_raised(caplog):
+    class BrokenBackplane(Backplane):
+        async def _publish(self, channel: str, data: str):
+            raise ConnectionError("broker down")
+
+    with caplog.at_level(logging.ERROR, logger="app.core.backplane"):
+        await BrokenBackplane().publish("room:general", "{}")
+    assert "broker down" in caplog.text
+
+
+class Notify:
+    def __init__(self, channel: str, payload: str):
+        self.channel = channel
+        self.payload = payload
+
+
+class FakeListener:
+    def __init__(self):
+        self.notifies = []
+
+    def poll(self):
+        pass
+
+
+def test_postgres_backplane_splits_and_reassembles_large_frames():
+    backplane = PostgresBackplane()
+    received = []
+    backplane.set_handler(lambda channel, data: received.append((channel, data)))
+    backplane.channels.add("room:general")
+    backplane.listener = FakeListener()
+
+    small = json.dumps({"type": "message", "content": "hi"})
+    large = json.dumps({"type": "message", "content": "ünïcödé " * 3000})
+    assert backplane._split(small) == [small]
+    payloads = backplane._split(large)
+    assert len(payloads) > 1
+    assert all(len(payload.encode("utf-8")) <= PostgresBackplane.MAX_PAYLOAD for payload in payloads)
+
+    backplane.listener.notifies = [Notify("echo:room:general", p) for p in [small] + payloads]
+    backplane._on_readable()
+    assert received == [("room:general", small), ("room:general", large)]
+    assert not backplane.parts
@@ -0,0 +1,59 @@
+def queries(response) -> int:
+    assert response.status_code == 200, response.text
+    return int(response.headers["X-SQL-Queries"])
+
+
+def make_rooms(client, owner, members, count: int):
+    room_ids = []
+    for i in range(count):
+        response = client.post("/api/v1/rooms/", json={"name": f"room {i}"}, headers=owner[2])
+        room_id = response.json()["id"]
+        for member in members:
+            assert client.post(f"/api/v1/rooms/{room_id}/join", headers=member[2]).status_code == 200
+        room_ids.append(room_id)
+    return room_ids
+
+
+def test_room_list_query_count_does_not_grow_with_rooms(client, register):
+    owner, member = register("owner"), register("member")
+    make_rooms(client, owner, [member], 2)
+    few = queries(client.get("/api/v1/rooms/", headers=member[2]))
+    make_rooms(client, owner, [member], 10)
+    response = client.get("/api/v1/rooms/", headers=member[2])
+    assert len(response.json()) == 12
+    # The rooms with the user's membership, then member counts for the page
+    assert queries(response) == few <= 2
+
+
+def test_room_detail_query_count_does_not_grow_with_members(client, register):
+    owner = register("owner")
+    [small] = make_rooms(client, owner, [register("member")], 1)
+    [large] = make_rooms(client, owner, [register("member") for _ in range(8)], 1)
+    few = queries(client.get(f"/api/v1/rooms/{small}", headers=owner[2]))
+    response = client.get(f"/api/v1/rooms/{large}", headers=owner[2])
+    assert len(response.json()["members"]) == 9
+    # The room, its members with their users, and the read position update
+    assert queries(response) == few <= 3
+
+
+def test_history_query_count_does_not_grow_with_page_size(client, room, add_messages):
+    room_id, owner, member = room
+    add_messages(room_id, owner[0], 120)
+    url = f"/api/v1/messages/rooms/{room_id}/messages"
+    # skip bypasses the room history cache, so both pages come from SQL
+    small = client.get(url, params={"limit": 5, "skip": 1}, headers=member[2])
+    large = client.get(url, params={"limit": 100, "skip": 1}, headers=member[2])
+    assert len(large.json()) == 100
+    # Room and membership, the page, and reactions for the page
+    assert queries(large) == queries(small) <= 3
+
+
+def test_dm_lookup_query_count(client, register):
+    alice, bob = register("alice"), register("bob")
+    created = client.post("/api/v1/rooms/dm", json={"target_user_id": bob[0]}, headers=alice[2])
+    existing = client.post("/api/v1/rooms/dm", json={"target_user_id": alice[0]}, headers=bob[2])
+    assert existing.json()["id"] == created.json()["id"]
+    assert {m["user"]["id"] for m in existing.json()["members"]} == {alice[0], bob[0]}
+    # Target user, the pair lookup, then the room and its members
+    assert queries(existing) <= 4
+    assert queries(created) <= 8
@@ -0,0 +1,121 @@
+import asyncio
+import sys
+import time
+
+import fakeredis
+import pytest
+
+from app.config import settings
+from app.core.moderation import RateLimiter, RedisRateLimiter
+from app.database import redis as redis_module
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_limit_allows_a_burst_then_refuses():
+    limiter = RateLimiter()
+    limiter.configure("user", 5, 60.0)
+    results = [await limiter.check("user", "alice") for _ in range(7)]
+    assert results == [True] * 5 + [False] * 2
+    # Keys are independent, and so are scopes
+    assert await limiter.check("user", "bob")
+    limiter.configure("room", 1, 60.0)
+    assert await limiter.check("room", "alice")
+
+
+async def test_one_million_users_stay_small_and_are_swept_without_stalling():
+    limiter = RateLimiter()
+    # One event per microsecond: every bucket is full again almost at once
+    limiter.configure("user", 1000, 0.001)
+
+    for i in range(1_000_000):
+        await limiter.check("user", f"user-{i}")
+
+    # A key's whole state is one float and its dict slot (the key string is the caller's id)
+    buckets = limiter.buckets["user"]
+    assert len(buckets) == 1_000_000
+    state = sys.getsizeof(buckets) + sum(sys.getsizeof(full_at) for full_at in buckets.values())
+    assert state / len(buckets) < 100
+
+    lags = []
+    sweeping = True
+
+    async def ticker():
+        while sweeping:
+            expected = time.perf_counter()
+            await asyncio.sleep(0)
+            lags.append(time.perf_counter() - expected)
+
+    ticking = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    await limiter.sweep()
+    sweeping = False
+    await ticking
+
+    assert limiter.buckets["user"] == {}
+    # The sweep yields between batches; no single turn holds the loop for long
+    assert max(lags) < 0.1
+
+
+async def test_sweep_keeps_keys_that_are_still_limited():
+    limiter = RateLimiter()
+    limiter.configure("user", 2, 60.0)
+    limiter.configure("ip", 1000, 0.001)
+    await limiter.check("user", "alice")
+    await limiter.check("ip", "10.0.0.1")
+    await asyncio.sleep(0.01)
+
+    await limiter.sweep()
+    assert list(limiter.buckets["user"]) == ["alice"]
+    assert limiter.buckets["ip"] == {}
+    # The kept bucket still counts the event already taken
+    assert [await limiter.check("user", "alice") for _ in range(2)] == [True, False]
+
+
+@pytest.fixture
+def shared_redis(monkeypatch):
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        redis_module, "get_redis",
+        lambda: fakeredis.aioredis.FakeRedis(server=server, decode_responses=True)
+    )
+    return server
+
+
+async def test_workers_share_one_limit_through_redis(shared_redis):
+    workers = [RedisRateLimiter(), RedisRateLimiter()]
+    for worker in workers:
+        worker.configure("user", 10, 60.0)
+
+    allowed = 0
+    for _ in range(20):
+        for worker in workers:
+            allowed += await worker.check("user", "alice")
+    # Leases are taken from the shared bucket, so together they never exceed the limit
+    assert allowed == 10
+    assert not any(worker.degraded for worker in workers)
+
+
+async def test_hot_user_is_served_from_leases(shared_redis, monkeypatch):
+    monkeypatch.setattr(settings, "RATE_LIMIT_LEASE_SECONDS", 60.0)
+    limiter = RedisRateLimiter()
+    limiter.configure("user", 1000, 60.0)
+    for _ in range(100):
+        assert await limiter.check("user", "alice")
+    # Leases double up to RATE_LIMIT_LEASE_MAX events per round trip
+    assert limiter.redis_calls < 100 / settings.RATE_LIMIT_LEASE_MAX + 5
+
+
+async def test_falls_back_to_local_limits_when_redis_is_down(shared_redis):
+    limiter = RedisRateLimiter()
+    limiter.configure("user", 3, 60.0)
+    shared_redis.connected = False
+
+    results = [await limiter.check("user", "alice") for _ in range(4)]
+    assert results == [True, True, True, False]
+    assert limiter.degraded
+    assert limiter.fallback_checks == 4
+
+    shared_redis.connected = True
+    assert await limiter.check("user", "bob")
+    assert not limiter.degraded
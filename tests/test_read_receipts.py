@@ -0,0 +1,138 @@
+import logging
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from app.config import settings
+from app.core.read_receipts import ReadReceiptBroadcaster
+from app.core.websocket_manager import manager
+from app.database.sql import engine
+
+
+@contextmanager
+def record_writes():
+    """Collect the INSERT/UPDATE/DELETE statements run on the engine inside the block"""
+    writes = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().split(" ", 1)[0].upper() in ("INSERT", "UPDATE", "DELETE"):
+            writes.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield writes
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def post_marker(client, room_id, headers) -> str:
+    """Post a chat message over REST; its broadcast marks the end of the frames to check"""
+    response = client.post(f"/api/v1/messages/rooms/{room_id}/messages", json={"content": "marker", "room_id": room_id}, headers=headers)
+    assert response.status_code == 200, response.text
+    return response.json()["id"]
+
+
+def frames_until(ws, message_id: str):
+    """Frames received up to and including the broadcast of a message"""
+    frames = []
+    while True:
+        frame = ws.receive_json()
+        frames.append(frame)
+        if frame.get("id") == message_id:
+            return frames
+
+
+def test_reading_backlog_is_one_write_and_one_frame(client, room, add_messages, monkeypatch):
+    monkeypatch.setattr(settings, "READ_RECEIPT_BROADCAST_MS", 50)
+    room_id, owner, member = room
+    ids = add_messages(room_id, owner[0], 1000)
+
+    with client.websocket_connect(f"/ws/{room_id}?token={owner[1]}") as peer:
+        with record_writes() as writes:
+            response = client.post(f"/api/v1/messages/rooms/{room_id}/read", json={"message_id": ids[-1]}, headers=member[2])
+        assert response.status_code == 200
+        assert response.json()["advanced"] is True
+        assert len(writes) == 1 and writes[0].startswith("UPDATE room_members")
+
+        # Let the debounce window pass, then use a chat message as a marker
+        time.sleep(0.3)
+        marker = post_marker(client, room_id, member[2])
+        progress = [frame for frame in frames_until(peer, marker) if frame.get("type") == "read_progress"]
+
+    assert len(progress) == 1
+    assert progress[0]["positions"] == [{
+        "user_id": member[0],
+        "last_read_at": progress[0]["positions"][0]["last_read_at"],
+        "last_read_message_id": ids[-1],
+    }]
+
+    # Every message up to the watermark is read by the member, computed from the one row
+    for message_id in (ids[0], ids[500], ids[-1]):
+        readers = client.get(f"/api/v1/messages/messages/{message_id}/read-by", headers=owner[2]).json()
+        assert [reader["id"] for reader in readers] == [member[0]]
+
+
+def test_read_position_only_moves_forward(client, room, add_messages):
+    room_id, owner, member = room
+    ids = add_messages(room_id, owner[0], 10)
+
+    url = f"/api/v1/messages/rooms/{room_id}/read"
+    assert client.post(url, json={"message_id": ids[7]}, headers=member[2]).json()["advanced"] is True
+    with record_writes() as writes:
+        assert client.post(url, json={"message_id": ids[3]}, headers=member[2]).json()["advanced"] is False
+
+    # The conditional UPDATE matched nothing; the position is still at message 7
+    assert len(writes) == 1
+    positions = client.get(f"/api/v1/messages/rooms/{room_id}/read-positions", headers=owner[2]).json()
+    assert {p["user_id"]: p["last_read_message_id"] for p in positions}[member[0]] == ids[7]
+    readers = client.get(f"/api/v1/messages/messages/{ids[8]}/read-by", headers=owner[2]).json()
+    assert readers == []
+
+
+def test_burst_of_readers_is_one_frame(client, room, register, add_messages, monkeypatch):
+    # Long enough for the whole burst of requests to land in one interval
+    monkeypatch.setattr(settings, "READ_RECEIPT_BROADCAST_MS", 1000)
+    room_id, owner, member = room
+    others = [register("reader") for _ in range(3)]
+    for other in others:
+        assert client.post(f"/api/v1/rooms/{room_id}/join", headers=other[2]).status_code == 200
+    ids = add_messages(room_id, owner[0], 50)
+
+    with client.websocket_connect(f"/ws/{room_id}?token={owner[1]}") as peer:
+        for reader in [member] + others:
+            for message_id in ids[-5:]:
+                client.post(f"/api/v1/messages/rooms/{room_id}/read", json={"message_id": message_id}, headers=reader[2])
+        time.sleep(1.5)
+        marker = post_marker(client, room_id, member[2])
+        progress = [frame for frame in frames_until(peer, marker) if frame.get("type") == "read_progress"]
+
+    # Twenty position changes from four readers: one frame with each reader's latest position
+    assert len(progress) == 1
+    latest = {p["user_id"]: p["last_read_message_id"] for p in progress[0]["positions"]}
+    assert latest == {reader[0]: ids[-1] for reader in [member] + others}
+
+
+@pytest.mark.anyio
+async def test_one_failing_room_does_not_drop_the_others(monkeypatch, caplog):
+    sent = []
+
+    async def notify_read_progress(room_id, positions):
+        if room_id == "broken":
+            raise RuntimeError("backplane down")
+        sent.append((room_id, [position["user_id"] for position in positions]))
+
+    monkeypatch.setattr(manager, "notify_read_progress", notify_read_progress)
+    broadcaster = ReadReceiptBroadcaster()
+    now = datetime.utcnow()
+    broadcaster.touch("broken", "alice", (now, "m1"))
+    broadcaster.touch("healthy", "bob", (now, "m2"))
+
+    with caplog.at_level(logging.ERROR, logger="app.core.read_receipts"):
+        await broadcaster.flush()
+
+    assert sent == [("healthy", ["bob"])]
+    assert broadcaster.frames == 1
+    assert "room broken failed: backplane down" in caplog.text
@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import pytest
+
+from app.config import settings
+from app.core.websocket_manager import ConnectionManager
+from app.database.sql import engine
+
+
+def test_open_sockets_hold_no_database_sessions(client, room):
+    room_id, owner, member = room
+    with client.websocket_connect(f"/ws/{room_id}?token={owner[1]}") as first, \
+            client.websocket_connect(f"/ws/{room_id}?token={member[1]}") as second:
+        first.send_text(json.dumps({"type": "message", "content": "hello"}))
+        while second.receive_json().get("type") != "message":
+            pass
+        # Sessions are borrowed per operation and returned before the socket waits again
+        assert engine.pool.checkedout() == 0
+        assert client.get("/api/v1/users/me", headers=owner[2]).status_code == 200
+
+
+class RecordingSocket:
+    def __init__(self):
+        self.frames = []
+        self.close_code = None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, data: str):
+        self.frames.append(json.loads(data))
+
+    async def close(self, code: int = 1000, reason: str = ""):
+        self.close_code = code
+
+
+class StalledSocket(RecordingSocket):
+    """A client that stopped reading: every send blocks"""
+
+    async def send_text(self, data: str):
+        await asyncio.Event().wait()
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+@pytest.mark.anyio
+async def test_full_queue_evicts_slow_consumer(monkeypatch):
+    monkeypatch.setattr(settings, "WS_SEND_QUEUE_SIZE", 8)
+    manager = ConnectionManager()
+    fast, slow = RecordingSocket(), StalledSocket()
+    await manager.connect(fast, "general", "fast")
+    await manager.connect(slow, "general", "slow")
+
+    for i in range(20):
+        await manager.broadcast_to_room("general", {"type": "message", "content": str(i)})
+        await settle()
+
+    # The stalled socket was dropped and closed; the healthy one got every frame
+    assert slow not in manager.connections
+    assert slow not in manager.active_connections["general"]
+    assert manager.evicted_connections == 1
+    assert slow.close_code == 1013
+    assert [frame["content"] for frame in fast.frames if frame["type"] == "message"] == [str(i) for i in range(20)]
+
+
+@pytest.mark.anyio
+async def test_send_timeout_evicts_stalled_consumer(monkeypatch):
+    monkeypatch.setattr(settings, "WS_SEND_TIMEOUT_SECONDS", 0.05)
+    manager = ConnectionManager()
+    slow = StalledSocket()
+    await manager.connect(slow, "general", "slow")
+
+    await manager.broadcast_to_room("general", {"type": "message", "content": "hi"})
+    await asyncio.sleep(0.2)
+    assert slow not in manager.connections
+    assert "general" not in manager.active_connections
+    assert manager.evicted_connections == 1